@@ -1,9 +1,25 @@
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 import datetime
-import pandas as pd
 import time
-import sqlite3
 import re
+import os
+import json
+
+# Toda la lógica vive en el paquete `heysave`: se importa una vez por proceso
+# y no se vuelve a ejecutar en cada rerun
+from heysave.autenticacion import autenticar, crear_sesion, registrar_password, renovar_sesion, revocar_sesion
+from heysave.cache import consulta_usuario, get_cache, invalidar_cache
+from heysave.categorias import detectar_categoria
+from heysave.conciliacion import conciliar
+from heysave.db import get_escritor, get_pool, run_query, transaccion
+from heysave.finanzas import analizar_gastos_y_sugerir, buscar_movimientos, calcular_nivel, historial_pagina, resumen_analitico
+from heysave.fotos import guardar_foto, obtener_miniatura
+from heysave.importacion import importar_csv
+from heysave.instrumentacion import get_instrumentacion
+from heysave.premios import canjear, catalogo
+from heysave.programador import crear_regla, desactivar_regla, reglas_usuario
+from heysave.tarjetas import info_tarjeta
 
 # --- CONFIGURACIÓN DE LA PÁGINA ---
 st.set_page_config(
@@ -13,60 +29,7 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# --- GESTIÓN DE BASE DE DATOS ---
-def init_db():
-    conn = sqlite3.connect('heysave.db')
-    c = conn.cursor()
-    # Tabla usuarios con nuevos campos
-    c.execute('''CREATE TABLE IF NOT EXISTS usuarios (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT, usuario TEXT UNIQUE, password TEXT,
-                    nombre TEXT, dni TEXT, banco TEXT, saldo REAL DEFAULT 0, 
-                    saldo_metas REAL DEFAULT 0, puntos INTEGER DEFAULT 0,
-                    foto BLOB,
-                    pais TEXT, direccion TEXT, postal TEXT)''')
-    
-    # Migraciones para usuarios existentes (por si acaso)
-    columnas_nuevas = ["foto", "saldo_metas", "pais", "direccion", "postal"]
-    for col in columnas_nuevas:
-        try:
-            tipo = "REAL" if "saldo" in col else "TEXT"
-            if col == "foto": tipo = "BLOB"
-            c.execute(f"ALTER TABLE usuarios ADD COLUMN {col} {tipo}")
-        except:
-            pass
-
-    c.execute('''CREATE TABLE IF NOT EXISTS transacciones (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT, usuario_id INTEGER, fecha TEXT,
-                    descripcion TEXT, categoria TEXT, monto REAL, tipo TEXT,
-                    FOREIGN KEY(usuario_id) REFERENCES usuarios(id))''')
-    c.execute('''CREATE TABLE IF NOT EXISTS metas (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT, usuario_id INTEGER, nombre TEXT,
-                    objetivo REAL, ahorrado REAL DEFAULT 0,
-                    FOREIGN KEY(usuario_id) REFERENCES usuarios(id))''')
-    c.execute('''CREATE TABLE IF NOT EXISTS premios_canjeados (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT, usuario_id INTEGER, premio TEXT,
-                    codigo TEXT, fecha TEXT,
-                    FOREIGN KEY(usuario_id) REFERENCES usuarios(id))''')
-    conn.commit()
-    conn.close()
-
-def run_query(query, params=(), return_data=False):
-    conn = sqlite3.connect('heysave.db')
-    c = conn.cursor()
-    try:
-        c.execute(query, params)
-        if return_data:
-            data = c.fetchall()
-            conn.close()
-            return data
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        conn.close()
-        return False
-
-init_db()
+get_pool()
 
 # --- ESTILOS CSS ---
 st.markdown("""
@@ -132,6 +95,27 @@ if 'temp_reg_data' not in st.session_state: st.session_state.temp_reg_data = {}
 if 'cc_num_input' not in st.session_state: st.session_state.cc_num_input = ""
 if 'cc_exp_input' not in st.session_state: st.session_state.cc_exp_input = ""
 if 'mostrar_camara' not in st.session_state: st.session_state.mostrar_camara = False
+if 'flash' not in st.session_state: st.session_state.flash = []
+
+# --- MENSAJES FLASH ---
+# En vez de dormir el hilo (time.sleep) para que el mensaje se alcance a ver
+# antes del rerun, se encola y se muestra en el siguiente render.
+def flash(mensaje, tipo="success"):
+    st.session_state.flash.append((tipo, mensaje))
+
+def mostrar_flash():
+    pendientes, st.session_state.flash = st.session_state.flash, []
+    for tipo, mensaje in pendientes:
+        if tipo == "toast": st.toast(mensaje)
+        elif tipo == "balloons": st.balloons()
+        elif tipo == "error": st.error(mensaje)
+        else: st.success(mensaje)
+
+def recargar_seccion():
+    # Rerun solo del fragmento; si el click llegó en un rerun completo (p. ej. con
+    # AppTest) Streamlit no permite scope="fragment" y se recarga toda la app
+    try: st.rerun(scope="fragment")
+    except StreamlitAPIException: st.rerun()
 
 # --- FUNCIONES DE LIMPIEZA ---
 def limpiar_solo_numeros(key, max_len=None):
@@ -156,58 +140,26 @@ def formatear_fecha():
     else:
         st.session_state.cc_exp_input = clean
 
-# --- OTRAS FUNCIONES ---
-def detectar_banco_red(numero):
-    n = numero.replace(" ", "")
-    banco = "Desconocido"
-    red = ""
-    if n.startswith("4"): red = "Visa"
-    elif n.startswith("5"): red = "Mastercard"
-    else: red = "Tarjeta"
-    if len(n) >= 4:
-        if n.startswith(("4551", "4214", "5491")): banco = "BCP"
-        elif n.startswith(("4550", "4919", "5160")): banco = "BBVA"
-        elif n.startswith(("4213", "4458", "5204")): banco = "Interbank"
-        elif n.startswith(("4555", "5406")): banco = "Scotiabank"
-        elif n.startswith("4111"): banco = "Banco de la Nación"
-        elif red in ["Visa", "Mastercard"]: banco = f"{red} Bank"
-    return banco, red
-
-def detectar_categoria(descripcion):
-    desc = descripcion.lower()
-    if any(x in desc for x in ["comida", "hamburguesa", "pizza", "starbucks", "menu", "kfc", "desayuno"]): return "Alimentación 🍔"
-    elif any(x in desc for x in ["uber", "taxi", "bus", "gasolina", "cabify", "pasaje"]): return "Transporte 🚕"
-    elif any(x in desc for x in ["cine", "netflix", "spotify", "fiesta", "entrada", "juego"]): return "Entretenimiento 🎬"
-    elif any(x in desc for x in ["libro", "fotocopias", "curso", "pension", "universidad", "clase"]): return "Educación 📚"
-    elif any(x in desc for x in ["ropa", "zapatilla", "polo", "tienda", "shopping"]): return "Moda 👕"
-    else: return "Varios 📦"
-
-def analizar_gastos_y_sugerir(user_id):
-    tips = []
-    gastos = run_query("SELECT categoria FROM transacciones WHERE usuario_id = ? AND tipo = 'Gasto'", (user_id,), return_data=True)
-    saldo_actual = run_query("SELECT saldo FROM usuarios WHERE id = ?", (user_id,), return_data=True)[0][0]
-    
-    if not gastos: return ["👋 Registra tus primeros gastos para recibir consejos de la IA."]
-    cats = set([g[0] for g in gastos])
-    
-    if any("Alimentación" in c for c in cats): tips.append("🍔 **Comida:** Cocinar en casa ahorra hasta S/. 120/mes.")
-    if any("Transporte" in c for c in cats): tips.append("🚕 **Movilidad:** ¿Has probado compartir viaje o usar bus?")
-    if any("Entretenimiento" in c for c in cats): tips.append("🎬 **Ocio:** Busca descuentos de estudiante.")
-    
-    if saldo_actual < 20: tips.append("🚨 **URGENTE:** Saldo crítico (< S/. 20).")
-    elif saldo_actual < 50: tips.append("⚠️ **Cuidado:** Prioriza lo esencial (< S/. 50).")
-        
-    if not tips: tips.append("✅ **¡Finanzas Saludables!** Sigue así.")
-    return tips
-
-def calcular_nivel(puntos):
-    if puntos < 100: return "Bronce 🥉", 100
-    elif puntos < 500: return "Plata 🥈", 500
-    elif puntos < 1500: return "Oro 🥇", 1500
-    else: return "Diamante 💎", 5000
-
 # --- LOGIN & REGISTRO ---
+# El token de sesión va en la URL (?s=...): sobrevive a recargar la página sin volver a pedir
+# la contraseña (Streamlit no deja escribir cookies). Al restaurar se cambia por uno nuevo,
+# así el que quedó en el historial o en un enlace copiado deja de servir
+def iniciar_sesion(user_id, usuario):
+    st.session_state.logged_in = True
+    st.session_state.user_id = user_id
+    st.session_state.usuario = usuario
+    token = crear_sesion(user_id)
+    if token: st.query_params["s"] = token
+
+def restaurar_sesion():
+    sesion = renovar_sesion(st.query_params.get("s"))
+    if sesion:
+        st.session_state.logged_in = True
+        st.session_state.user_id, st.session_state.usuario, st.query_params["s"] = sesion
+    else: st.query_params.pop("s", None)
+
 def login_register_screen():
+    mostrar_flash()
     st.markdown("<h1 style='text-align: center; color: #D2A8FF;'>💸 HeySave</h1>", unsafe_allow_html=True)
     st.markdown("<p style='text-align: center; color: #8B949E;'>Tu Billetera Digital en Dark Mode</p>", unsafe_allow_html=True)
     st.write("")
@@ -222,12 +174,10 @@ def login_register_screen():
             submitted = st.form_submit_button("Ingresar", type="primary")
             
             if submitted:
-                data = run_query("SELECT id, usuario, nombre FROM usuarios WHERE usuario = ? AND password = ?", (user, password), return_data=True)
+                data = autenticar(user, password)
                 if data:
-                    st.session_state.logged_in = True
-                    st.session_state.user_id = data[0][0]
-                    st.session_state.usuario = data[0][1]
-                    st.toast(f"Hola {data[0][2]}!"); time.sleep(1); st.rerun()
+                    iniciar_sesion(data[0], data[1])
+                    flash(f"Hola {data[2]}!", "toast"); st.rerun()
                 else: st.error("Credenciales incorrectas")
 
     # --- PESTAÑA DE REGISTRO ---
@@ -250,7 +200,8 @@ def login_register_screen():
                     if run_query("SELECT id FROM usuarios WHERE usuario = ?", (r_user,), return_data=True):
                         st.error("Usuario ocupado.")
                     else:
-                        st.session_state.temp_reg_data = {"user": r_user, "pass": r_pass, "nombre": r_nombre, "dni": st.session_state.reg_dni}
+                        # La contraseña ya viaja hasheada al paso 2: nunca queda en claro en la sesión
+                        st.session_state.temp_reg_data = {"user": r_user, "pass": registrar_password(r_pass), "nombre": r_nombre, "dni": st.session_state.reg_dni}
                         st.session_state.reg_step = 2; st.rerun()
                 else:
                     for err in errores: st.error(err)
@@ -271,11 +222,13 @@ def login_register_screen():
             st.text_input("N° Tarjeta", key="cc_num_input", placeholder="0000 0000 0000 0000", on_change=formatear_tarjeta)
             
             tarjeta_actual = st.session_state.cc_num_input
-            banco_detectado, red_detectada = detectar_banco_red(tarjeta_actual)
+            info_bin = info_tarjeta(tarjeta_actual)
+            banco_detectado, red_detectada = info_bin["banco"], info_bin["red"]
             
             if len(tarjeta_actual) >= 4:
                 if banco_detectado != "Desconocido":
-                    st.success(f"✅ Tarjeta detectada: **{banco_detectado}** ({red_detectada})")
+                    detalle = " · ".join(x for x in (red_detectada, info_bin["tipo"]) if x)
+                    st.success(f"✅ Tarjeta detectada: **{banco_detectado}** ({detalle})")
                 else:
                     st.warning(f"🤔 {red_detectada} detectada.")
             
@@ -306,267 +259,499 @@ def login_register_screen():
                     
                     run_query("INSERT INTO usuarios (usuario, password, nombre, dni, banco, pais, direccion, postal) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", 
                                 (d['user'], d['pass'], d['nombre'], d['dni'], banco_final, r_pais, r_direccion, st.session_state.reg_postal))
-                    st.balloons(); st.success("¡Cuenta Creada!"); st.session_state.reg_step = 1; time.sleep(2); st.rerun()
+                    flash("", "balloons"); flash("¡Cuenta Creada!"); st.session_state.reg_step = 1; st.rerun()
 
 # --- APP PRINCIPAL ---
-def main_app():
-    user_id = st.session_state.user_id
+SECCIONES = ["🏠 Inicio", "📊 Análisis", "🎯 Metas", "💡 Tips", "🎁 Premios", "👤 Perfil"]
+SECCION_DIAGNOSTICO = "🛠️ Diagnóstico"
+# Usuarios (separados por coma) que ven el panel de diagnóstico
+ADMINS = {u.strip() for u in os.environ.get("HEYSAVE_ADMINS", "").split(",") if u.strip()}
+
+def leer_usuario(user_id):
     # Traemos el saldo_metas (el apartado especial)
-    user_data = run_query("SELECT saldo, puntos, nombre, dni, banco, foto, saldo_metas FROM usuarios WHERE id = ?", (user_id,), return_data=True)[0]
-    saldo_db, puntos_db, nombre_user, dni_user, banco_user, foto_blob, saldo_metas_db = user_data
-    
+    # Sin bytes de imagen: la foto se resuelve aparte por su hash
+    user_data = consulta_usuario(user_id, "usuario", "SELECT saldo, puntos, nombre, dni, banco, foto_hash, saldo_metas FROM usuarios WHERE id = ?", (user_id,))[0]
+    saldo_db, puntos_db, nombre_user, dni_user, banco_user, foto_hash, saldo_metas_db = user_data
     # Manejo de valor nulo para saldo_metas en usuarios viejos
     if saldo_metas_db is None: saldo_metas_db = 0.0
+    return saldo_db, puntos_db, nombre_user, dni_user, banco_user, foto_hash, saldo_metas_db
 
+def cerrar_sesion(user_id):
+    revocar_sesion(st.query_params.pop("s", None))
+    invalidar_cache(user_id); st.session_state.logged_in = False; st.session_state.user_id = None; st.rerun()
+
+def main_app():
+    user_id = st.session_state.user_id
+    saldo_db, puntos_db, nombre_user, dni_user, banco_user, foto_hash, saldo_metas_db = leer_usuario(user_id)
     nivel_actual, prox_nivel = calcular_nivel(puntos_db)
+    mostrar_flash()
     
     # --- SIDEBAR ---
     with st.sidebar:
-        if foto_blob: st.image(foto_blob, width=150)
-        else: st.image("https://cdn-icons-png.flaticon.com/512/3135/3135715.png", width=150)
+        st.image(obtener_miniatura(foto_hash), width=150)
              
         st.write(f"Usuario: **{st.session_state.usuario}**")
         st.metric("HeyPoints", f"{puntos_db} ⭐")
         st.info(f"Rango: {nivel_actual}")
-        if st.button("Cerrar Sesión"):
-            st.session_state.logged_in = False; st.session_state.user_id = None; st.rerun()
-
-    tab1, tab2, tab3, tab4, tab5 = st.tabs(["🏠 Inicio", "🎯 Metas", "💡 Tips", "🎁 Premios", "👤 Perfil"])
-
-    # --- TAB 1: DASHBOARD ---
-    with tab1:
-        st.markdown(f"""
-        <div class="balance-card">
-            <div class="balance-title">Saldo Disponible</div>
-            <div class="balance-amount">S/. {saldo_db:,.2f}</div>
-            <div style="font-size: 12px; opacity: 0.8; color: #ddd;">{banco_user} • **** {dni_user[-4:]}</div>
-        </div>
-        """, unsafe_allow_html=True)
-
-        # Mostrar el "Apartado Especial" de Dinero de Metas
-        if saldo_metas_db > 0:
-            st.info(f"💰 **Dinero de Metas (Retirado):** S/. {saldo_metas_db:,.2f}")
-
-        with st.container():
-            c1, c2 = st.columns([2, 1])
-            desc = c1.text_input("Descripción", placeholder="Ej. Almuerzo, Uber...")
-            monto = c2.number_input("Monto (S/.)", min_value=0.0, step=0.01, format="%.2f")
-            
-            b1, b2 = st.columns(2)
-            
-            if b1.button("➖ Registrar Gasto", type="primary"):
-                if desc and monto > 0:
-                    if monto > saldo_db: st.error("🚫 Fondos insuficientes.")
-                    else:
-                        cat = detectar_categoria(desc)
-                        run_query("UPDATE usuarios SET saldo = saldo - ? WHERE id = ?", (monto, user_id))
-                        run_query("INSERT INTO transacciones (usuario_id, fecha, descripcion, categoria, monto, tipo) VALUES (?, ?, ?, ?, ?, ?)",
-                                  (user_id, datetime.date.today().strftime("%d/%m"), desc, cat, monto, 'Gasto'))
-                        st.rerun()
-            
-            if b2.button("➕ Registrar Ingreso"):
-                if desc and monto > 0:
-                    run_query("UPDATE usuarios SET saldo = saldo + ? WHERE id = ?", (monto, user_id))
-                    run_query("INSERT INTO transacciones (usuario_id, fecha, descripcion, categoria, monto, tipo) VALUES (?, ?, ?, ?, ?, ?)",
-                              (user_id, datetime.date.today().strftime("%d/%m"), desc, "Ingreso", monto, 'Ingreso'))
-                    st.rerun()
-
-        # --- SECCIÓN: ÚLTIMOS MOVIMIENTOS (SIN TABLA, NATIVO Y BONITO) ---
-        st.subheader("📝 Últimos Movimientos")
+        if st.button("Cerrar Sesión"): cerrar_sesion(user_id)
+
+    # Solo se construye la sección activa; cada una es un fragmento que se
+    # vuelve a ejecutar sola cuando el click ocurre dentro de ella.
+    secciones = SECCIONES + [SECCION_DIAGNOSTICO] if st.session_state.usuario in ADMINS else SECCIONES
+    seccion = st.radio("Sección", secciones, key="seccion_activa", horizontal=True, label_visibility="collapsed")
+    if seccion == "🏠 Inicio": tab_inicio(user_id)
+    elif seccion == "📊 Análisis": tab_analisis(user_id)
+    elif seccion == "🎯 Metas": tab_metas(user_id)
+    elif seccion == "💡 Tips": tab_tips(user_id)
+    elif seccion == "🎁 Premios": tab_premios(user_id)
+    elif seccion == SECCION_DIAGNOSTICO: tab_diagnostico()
+    else: tab_perfil(user_id)
+
+# --- TAB 1: DASHBOARD ---
+@st.fragment
+def tab_inicio(user_id):
+    mostrar_flash()
+    saldo_db, puntos_db, nombre_user, dni_user, banco_user, foto_hash, saldo_metas_db = leer_usuario(user_id)
+    st.markdown(f"""
+    <div class="balance-card">
+        <div class="balance-title">Saldo Disponible</div>
+        <div class="balance-amount">S/. {saldo_db:,.2f}</div>
+        <div style="font-size: 12px; opacity: 0.8; color: #ddd;">{banco_user} • **** {dni_user[-4:]}</div>
+    </div>
+    """, unsafe_allow_html=True)
+
+    # Mostrar el "Apartado Especial" de Dinero de Metas
+    if saldo_metas_db > 0:
+        st.info(f"💰 **Dinero de Metas (Retirado):** S/. {saldo_metas_db:,.2f}")
+
+    with st.container():
+        c1, c2 = st.columns([2, 1])
+        desc = c1.text_input("Descripción", placeholder="Ej. Almuerzo, Uber...")
+        monto = c2.number_input("Monto (S/.)", min_value=0.0, step=0.01, format="%.2f")
         
-        hist_data = run_query("SELECT fecha, descripcion, categoria, tipo, monto FROM transacciones WHERE usuario_id = ? ORDER BY id DESC LIMIT 10", (user_id,), return_data=True)
+        b1, b2 = st.columns(2)
         
-        if hist_data:
-            for h in hist_data:
-                fecha, desc_txt, cat_txt, tipo, monto_val = h
-                
-                # Configuración visual nativa
-                if tipo == "Gasto":
-                    icon = "💸"
-                    color_monto = "red"
-                    signo = "-"
-                else: # Ingreso
-                    icon = "💰"
-                    color_monto = "green"
-                    signo = "+"
-                
-                # Tarjeta visual nativa usando st.container
-                with st.container(border=True):
-                    c_icon, c_det, c_mont = st.columns([1, 4, 2])
-                    with c_icon:
-                        st.markdown(f"# {icon}")
-                    with c_det:
-                        st.write(f"**{desc_txt}**")
-                        st.caption(f"{cat_txt} • {fecha}")
-                    with c_mont:
-                        # Color nativo de Streamlit
-                        st.markdown(f"#### :{color_monto}[{signo} S/. {monto_val:,.2f}]")
-        else:
-            st.info("No hay movimientos recientes.")
-
-    # --- TAB 2: METAS ---
-    with tab2:
-        st.subheader("🎯 Mis Objetivos")
-        with st.expander("➕ Nueva Meta", expanded=False):
-            n_name = st.text_input("Nombre Meta")
-            n_obj = st.number_input("Monto Objetivo", min_value=0.0, step=1.0, format="%.2f")
-            
-            if st.button("Crear Meta"):
-                if n_obj > 0 and n_name:
-                    run_query("INSERT INTO metas (usuario_id, nombre, objetivo) VALUES (?, ?, ?)", (user_id, n_name, n_obj))
-                    st.rerun()
-                else: st.error("Datos inválidos.")
+        if b1.button("➖ Registrar Gasto", type="primary"):
+            if desc and monto > 0:
+                if monto > saldo_db: st.error("🚫 Fondos insuficientes.")
+                else:
+                    cat = detectar_categoria(desc)
+                    with transaccion() as tx:
+                        # El WHERE saldo >= ? evita quedar en negativo si otro click ya gastó
+                        tx.ejecutar("UPDATE usuarios SET saldo = saldo - ? WHERE id = ? AND saldo >= ?", (monto, user_id, monto), minimo_filas=1)
+                        tx.ejecutar("INSERT INTO transacciones (usuario_id, fecha, ts, descripcion, categoria, monto, tipo) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    (user_id, datetime.date.today().strftime("%d/%m"), int(time.time()), desc, cat, monto, 'Gasto'))
+                    if tx.ok: invalidar_cache(user_id, "usuario", "historial", "tips", "analisis"); recargar_seccion()
+                    else: st.error("🚫 Fondos insuficientes.")
         
-        metas = run_query("SELECT id, nombre, objetivo, ahorrado FROM metas WHERE usuario_id = ?", (user_id,), return_data=True)
-        for m in metas:
-            mid, nom, obj, aho = m
-            pct = min(aho/obj, 1.0)
-            st.markdown(f"**{nom}** (S/. {aho:.2f} / S/. {obj:.2f})")
-            st.progress(pct)
-            
-            if aho < obj:
-                # Meta en progreso
-                c1, c2 = st.columns([2, 1])
-                abo = c1.number_input(f"Monto a abonar", key=f"ab_{mid}", min_value=0.0, step=1.0, label_visibility="collapsed")
-                
-                if c2.button("Abonar", key=f"btn_{mid}"):
-                    if abo > 0 and saldo_db >= abo:
-                        pts = int(abo * 0.25)
-                        run_query("UPDATE metas SET ahorrado = ahorrado + ? WHERE id = ?", (abo, mid))
-                        run_query("UPDATE usuarios SET saldo = saldo - ?, puntos = puntos + ? WHERE id = ?", (abo, pts, user_id))
-                        st.toast(f"¡Guardado! +{pts} pts"); time.sleep(1); st.rerun()
-                    else: st.error("Saldo insuficiente")
+        if b2.button("➕ Registrar Ingreso"):
+            if desc and monto > 0:
+                with transaccion() as tx:
+                    tx.ejecutar("UPDATE usuarios SET saldo = saldo + ? WHERE id = ?", (monto, user_id), minimo_filas=1)
+                    tx.ejecutar("INSERT INTO transacciones (usuario_id, fecha, ts, descripcion, categoria, monto, tipo) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                (user_id, datetime.date.today().strftime("%d/%m"), int(time.time()), desc, "Ingreso", monto, 'Ingreso'))
+                if tx.ok: invalidar_cache(user_id, "usuario", "historial", "tips", "analisis"); recargar_seccion()
+                else: st.error("No se pudo registrar el ingreso.")
+
+    with st.expander("📥 Importar estado de cuenta (CSV)"):
+        st.caption("Columnas: fecha, descripción y monto (negativo = gasto). Opcional: tipo.")
+        archivo_csv = st.file_uploader("Archivo CSV", type=["csv", "txt"], label_visibility="collapsed")
+        if archivo_csv is not None and st.button("Importar movimientos"):
+            barra = st.progress(0.0, text="Importando...")
+            total_aprox = max(archivo_csv.size // 60, 1)  # ~60 bytes por fila
+            try:
+                res = importar_csv(user_id, archivo_csv, progreso=lambda n: barra.progress(min(n / total_aprox, 1.0), text=f"{n:,} filas..."))
+            except ValueError as e:
+                st.error(str(e))
             else:
-                # META COMPLETADA
-                st.success("¡META COMPLETADA! 🎉")
-                
-                # --- SISTEMA DE RETIRO Y TRANSFERENCIAS ---
-                st.write("**¿Qué deseas hacer con el dinero?**")
-                
-                # Radio button principal
-                opcion_retiro = st.radio("Selecciona una opción:", 
-                                         ["Mantener en Meta", 
-                                          "Retirar a Billetera (Sin Puntos)", 
-                                          "Transferir a un Banco"], 
-                                         key=f"opt_{mid}", label_visibility="collapsed")
-                
-                # Opción 1: Retirar a apartado especial (anti-farming)
-                if opcion_retiro == "Retirar a Billetera (Sin Puntos)":
-                    st.caption("El dinero irá a 'Dinero de Metas' y no generará puntos si se vuelve a ahorrar.")
-                    if st.button("Confirmar Retiro Interno", key=f"ret_{mid}"):
-                        # Mueve dinero a saldo_metas, NO a saldo principal
-                        run_query("UPDATE usuarios SET saldo_metas = saldo_metas + ? WHERE id = ?", (aho, user_id))
-                        run_query("UPDATE metas SET ahorrado = 0 WHERE id = ?", (mid,))
-                        run_query("INSERT INTO transacciones (usuario_id, fecha, descripcion, categoria, monto, tipo) VALUES (?, ?, ?, ?, ?, ?)",
-                                  (user_id, datetime.date.today().strftime("%d/%m"), f"Retiro Meta: {nom}", "Ahorro", aho, 'Ingreso'))
-                        st.balloons(); st.success("Dinero movido a tu apartado de Metas."); time.sleep(2); st.rerun()
-                
-                # Opción 2: Transferencia Externa
-                elif opcion_retiro == "Transferir a un Banco":
-                    # Sub-selección de tipo de transferencia
-                    tipo_trans = st.radio("Tipo de Transferencia:", ["Mismo Banco", "Interbancario (CCI)"], key=f"type_{mid}", horizontal=True)
-                    
-                    if tipo_trans == "Mismo Banco":
-                        n_cuenta = st.text_input("Número de Cuenta", key=f"cta_{mid}")
-                        if st.button("Confirmar Transferencia", key=f"trans_banco_{mid}"):
-                            if len(n_cuenta) > 5 and n_cuenta.isdigit(): # Validación básica
-                                run_query("UPDATE metas SET ahorrado = 0 WHERE id = ?", (mid,))
-                                run_query("INSERT INTO transacciones (usuario_id, fecha, descripcion, categoria, monto, tipo) VALUES (?, ?, ?, ?, ?, ?)",
-                                          (user_id, datetime.date.today().strftime("%d/%m"), f"Transf. a {n_cuenta}: {nom}", "Transferencia", aho, 'Gasto'))
-                                st.success("Transferencia exitosa."); time.sleep(2); st.rerun()
-                            else: st.error("Número de cuenta inválido.")
-                            
-                    else: # Interbancario
-                        cci_destino = st.text_input("Ingresa CCI (20 dígitos)", key=f"cci_{mid}", max_chars=20)
-                        if st.button("Confirmar CCI", key=f"trans_cci_{mid}"):
-                            if len(cci_destino) == 20 and cci_destino.isdigit():
-                                run_query("UPDATE metas SET ahorrado = 0 WHERE id = ?", (mid,))
-                                run_query("INSERT INTO transacciones (usuario_id, fecha, descripcion, categoria, monto, tipo) VALUES (?, ?, ?, ?, ?, ?)",
-                                          (user_id, datetime.date.today().strftime("%d/%m"), f"Transf. CCI {cci_destino}: {nom}", "Transferencia", aho, 'Gasto'))
-                                st.success("Transferencia CCI exitosa."); time.sleep(2); st.rerun()
-                            else: st.error("El CCI debe tener 20 números.")
-            st.divider()
+                flash(f"📥 {res['filas']:,} movimientos importados ({res['filas_por_segundo']:,.0f} filas/s)."
+                      + (f" {res['rechazadas']:,} filas no se pudieron leer." if res['rechazadas'] else ""))
+                recargar_seccion()
+
+    # --- SECCIÓN: ÚLTIMOS MOVIMIENTOS (SIN TABLA, NATIVO Y BONITO) ---
+    st.subheader("📝 Últimos Movimientos")
+
+    busqueda = st.text_input("Buscar movimientos", key="hist_busqueda", placeholder="🔎 Buscar (ej. uber, alimen...)", label_visibility="collapsed")
+    if busqueda.strip():
+        resultados = buscar_movimientos(user_id, busqueda)
+        if resultados is False: st.error("No se pudo buscar ahora. Intenta de nuevo."); return
+        for h in resultados: tarjeta_movimiento(h)
+        if not resultados: st.info("Ningún movimiento coincide con la búsqueda.")
+        return
+
+    with st.expander("🔎 Filtrar por fechas"):
+        rango = st.date_input("Rango", value=(), key="hist_rango", format="DD/MM/YYYY", label_visibility="collapsed")
+    desde = rango[0] if len(rango) > 0 else None
+    hasta = rango[1] if len(rango) > 1 else desde
+    # Pila de cursores: la página actual es la del último; "Ver más" apila y "Recientes" vuelve al inicio
+    if st.session_state.get("hist_filtro") != (desde, hasta):
+        st.session_state.hist_filtro = (desde, hasta)
+        st.session_state.hist_cursores = []
+    cursores = st.session_state.hist_cursores
+
+    if not cursores and desde is None:
+        # La primera página sin filtros es la que se ve en cada rerun: va por la caché
+        pagina = get_cache().obtener(user_id, "historial", lambda: historial_pagina(user_id))
+    else:
+        pagina = historial_pagina(user_id, cursores[-1] if cursores else None, desde, hasta)
+    # Una lectura fallida no es "sin movimientos" (y la caché no la guardó)
+    if pagina is False: st.error("No se pudo leer el historial. Intenta de nuevo."); return
+    hist_data, siguiente = pagina
+    
+    if hist_data:
+        for h in hist_data: tarjeta_movimiento(h)
+    else:
+        st.info("No hay movimientos recientes." if desde is None else "No hay movimientos en ese rango.")
 
-    # --- TAB 3: SUGERENCIAS ---
-    with tab3:
-        st.subheader("🤖 HeySave AI Tips")
-        with st.spinner('Analizando tus gastos...'): time.sleep(0.5)
-        for t in analizar_gastos_y_sugerir(user_id):
-            st.markdown(f"""<div class="suggestion-card">{t}</div>""", unsafe_allow_html=True)
-
-    # --- TAB 4: PREMIOS ---
-    with tab4:
-        col_header, col_pts = st.columns([2,1])
-        col_header.subheader("🎁 Canjea tus Puntos")
-        col_pts.metric("Tus Puntos", f"{puntos_db}", delta="XP")
-        premios = [
-            {"img": "☕", "nom": "Café Gratis", "costo": 50, "code": "CAFE-FREE"},
-            {"img": "🍿", "nom": "2x1 Cine", "costo": 150, "code": "CINE-X2"},
-            {"img": "📚", "nom": "Libro -20%", "costo": 300, "code": "BOOK-20"},
-            {"img": "🎧", "nom": "Spotify 1 Mes", "costo": 600, "code": "SPOT-1M"},
-        ]
-        cols = st.columns(2)
-        for idx, p in enumerate(premios):
-            with cols[idx % 2]:
-                with st.container(border=True):
-                    st.markdown(f"<div style='text-align:center; font-size:40px;'>{p['img']}</div>", unsafe_allow_html=True)
-                    st.markdown(f"<div style='text-align:center; font-weight:bold; color: white;'>{p['nom']}</div>", unsafe_allow_html=True)
-                    st.markdown(f"<div style='text-align:center; color:#f59e0b;'>{p['costo']} Pts</div>", unsafe_allow_html=True)
-                    if st.button(f"Canjear", key=f"r_{idx}"):
-                        if puntos_db >= p['costo']:
-                            run_query("UPDATE usuarios SET puntos = puntos - ? WHERE id = ?", (p['costo'], user_id))
-                            run_query("INSERT INTO premios_canjeados (usuario_id, premio, codigo, fecha) VALUES (?, ?, ?, ?)", 
-                                     (user_id, p['nom'], p['code'], datetime.date.today().strftime("%d/%m/%Y")))
-                            st.balloons(); time.sleep(1); st.rerun()
-                        else: st.error("Puntos insuficientes")
-
-    # --- TAB 5: PERFIL ---
-    with tab5:
-        c1, c2 = st.columns([1,2])
-        with c1:
-             if foto_blob: st.image(foto_blob, width=120)
-             else: st.image("https://cdn-icons-png.flaticon.com/512/3135/3135715.png", width=120)
-        with c2:
-            st.markdown(f"<h2 style='margin:0;'>{nombre_user}</h2>", unsafe_allow_html=True)
-            st.caption(f"DNI: {dni_user} | Banco: {banco_user}")
-            st.markdown(f"<p style='color:#8B949E; margin-top:5px;'>{nivel_actual}</p>", unsafe_allow_html=True)
+    p1, p2 = st.columns(2)
+    if cursores and p1.button("⬅️ Recientes", key="hist_inicio"):
+        cursores.clear(); recargar_seccion()
+    if siguiente and p2.button("Ver más ➡️", key="hist_mas"):
+        cursores.append(siguiente); recargar_seccion()
+
+def tarjeta_movimiento(h):
+    _, ts, fecha, desc_txt, cat_txt, tipo, monto_val = h
+    
+    # Configuración visual nativa
+    if tipo == "Gasto":
+        icon = "💸"
+        color_monto = "red"
+        signo = "-"
+    elif tipo == "Abono": # Del saldo a una meta
+        icon = "🎯"
+        color_monto = "blue"
+        signo = "-"
+    else: # Ingreso
+        icon = "💰"
+        color_monto = "green"
+        signo = "+"
+    
+    # Tarjeta visual nativa usando st.container
+    with st.container(border=True):
+        c_icon, c_det, c_mont = st.columns([1, 4, 2])
+        with c_icon:
+            st.markdown(f"# {icon}")
+        with c_det:
+            st.write(f"**{desc_txt}**")
+            st.caption(f"{cat_txt} • {datetime.date.fromtimestamp(ts).strftime('%d/%m/%Y') if ts else fecha}")
+        with c_mont:
+            # Color nativo de Streamlit
+            st.markdown(f"#### :{color_monto}[{signo} S/. {monto_val:,.2f}]")
+
+# --- TAB: ANÁLISIS MENSUAL ---
+@st.fragment
+def tab_analisis(user_id):
+    st.subheader("📊 Tu mes en números")
+    mensual, por_categoria = get_cache().obtener(user_id, "analisis", lambda: resumen_analitico(user_id))
+    if mensual.empty:
+        st.info("Aún no hay movimientos para analizar.")
+        return
+
+    mes_actual = datetime.date.today().strftime("%Y-%m")
+    fila = mensual.loc[mes_actual] if mes_actual in mensual.index else None
+    m1, m2, m3 = st.columns(3)
+    m1.metric("Ingresos del mes", f"S/. {fila['Ingresos'] if fila is not None else 0:,.2f}")
+    m2.metric("Gastos del mes", f"S/. {fila['Gastos'] if fila is not None else 0:,.2f}")
+    m3.metric("Tasa de ahorro", f"{fila['Tasa de ahorro'] if fila is not None else 0:.0%}")
+
+    st.markdown("**Ingresos vs. Gastos**")
+    st.line_chart(mensual[["Ingresos", "Gastos"]], color=["#238636", "#DA3633"])
+
+    if not por_categoria.empty:
+        st.markdown("**Gastos por categoría**")
+        st.bar_chart(por_categoria)
+        mes_sel = st.selectbox("Mes", por_categoria.index[::-1], key="analisis_mes")
+        reparto = por_categoria.loc[mes_sel]
+        reparto = reparto[reparto > 0].sort_values(ascending=False)
+        st.dataframe((reparto / reparto.sum() * 100).rename("% del gasto").to_frame(),
+                     column_config={"% del gasto": st.column_config.ProgressColumn(format="%.0f%%", min_value=0, max_value=100)},
+                     use_container_width=True)
+
+    st.markdown("**Ahorro mensual**")
+    st.bar_chart(mensual["Ahorro"])
+
+# --- TAB 2: METAS ---
+DIAS_SEMANA = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+
+@st.fragment
+def tab_metas(user_id):
+    mostrar_flash()
+    saldo_db = leer_usuario(user_id)[0]
+    st.subheader("🎯 Mis Objetivos")
+    with st.expander("➕ Nueva Meta", expanded=False):
+        n_name = st.text_input("Nombre Meta")
+        n_obj = st.number_input("Monto Objetivo", min_value=0.0, step=1.0, format="%.2f")
         
-        st.divider()
+        if st.button("Crear Meta"):
+            if n_obj > 0 and n_name:
+                run_query("INSERT INTO metas (usuario_id, nombre, objetivo) VALUES (?, ?, ?)", (user_id, n_name, n_obj))
+                invalidar_cache(user_id, "metas"); recargar_seccion()
+            else: st.error("Datos inválidos.")
+    
+    metas = consulta_usuario(user_id, "metas", "SELECT id, nombre, objetivo, ahorrado FROM metas WHERE usuario_id = ?", (user_id,))
+    en_progreso = {mid: nom for mid, nom, obj, aho in metas if aho < obj}
+    with st.expander("🔁 Ahorro Automático", expanded=False):
+        st.caption("Un monto fijo pasa solo de tu saldo a la meta cada día, semana o mes (si el saldo alcanza).")
+        if en_progreso:
+            c1, c2 = st.columns(2)
+            r_meta = c1.selectbox("Meta", list(en_progreso), format_func=en_progreso.get, key="regla_meta")
+            r_monto = c2.number_input("Monto por vez (S/.)", min_value=0.0, step=1.0, format="%.2f", key="regla_monto")
+            c3, c4 = st.columns(2)
+            r_frec = c3.selectbox("Frecuencia", ["Diaria", "Semanal", "Mensual"], key="regla_frec")
+            if r_frec == "Semanal":
+                r_dia = DIAS_SEMANA.index(c4.selectbox("Día", DIAS_SEMANA, key="regla_dia_sem"))
+            elif r_frec == "Mensual":
+                r_dia = c4.number_input("Día del mes", min_value=1, max_value=28, step=1, key="regla_dia_mes")
+            else: r_dia = 0
+            if st.button("Programar Ahorro"):
+                if r_monto > 0 and crear_regla(user_id, r_meta, r_monto, r_frec.lower(), r_dia):
+                    flash("Ahorro automático programado."); recargar_seccion()
+                else: st.error("Datos inválidos.")
+        else: st.info("Crea una meta para programar ahorros automáticos.")
+        for rid, _, nom, monto, frec, dia, proxima, resultado in reglas_usuario(user_id):
+            c1, c2 = st.columns([4, 1])
+            cuando = {"semanal": f" ({DIAS_SEMANA[dia]})", "mensual": f" (día {dia})"}.get(frec, "")
+            aviso = " · ⚠️ último intento sin saldo" if resultado == "saldo" else ""
+            c1.write(f"**{nom}**: S/. {monto:.2f} {frec}{cuando} · próximo {datetime.date.fromtimestamp(proxima).strftime('%d/%m')}{aviso}")
+            if c2.button("Detener", key=f"regla_off_{rid}"):
+                desactivar_regla(user_id, rid); recargar_seccion()
+    
+    for m in metas:
+        mid, nom, obj, aho = m
+        pct = min(aho/obj, 1.0)
+        st.markdown(f"**{nom}** (S/. {aho:.2f} / S/. {obj:.2f})")
+        st.progress(pct)
         
-        if not st.session_state.mostrar_camara:
-            if st.button("📷 Actualizar Foto de Perfil"):
-                st.session_state.mostrar_camara = True
-                st.rerun()
+        if aho < obj:
+            # Meta en progreso
+            c1, c2 = st.columns([2, 1])
+            abo = c1.number_input(f"Monto a abonar", key=f"ab_{mid}", min_value=0.0, step=1.0, label_visibility="collapsed")
+            
+            if c2.button("Abonar", key=f"btn_{mid}"):
+                if abo > 0 and saldo_db >= abo:
+                    pts = int(abo * 0.25)
+                    with transaccion() as tx:
+                        tx.ejecutar("UPDATE metas SET ahorrado = ahorrado + ? WHERE id = ?", (abo, mid), minimo_filas=1)
+                        tx.ejecutar("UPDATE usuarios SET saldo = saldo - ?, puntos = puntos + ? WHERE id = ? AND saldo >= ?", (abo, pts, user_id, abo), minimo_filas=1)
+                        tx.ejecutar("INSERT INTO transacciones (usuario_id, fecha, ts, descripcion, categoria, monto, tipo) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    (user_id, datetime.date.today().strftime("%d/%m"), int(time.time()), f"Abono Meta: {nom}", "Ahorro", abo, 'Abono'))
+                    if tx.ok:
+                        # Los puntos se ven en el sidebar: rerun de toda la app
+                        invalidar_cache(user_id, "usuario", "metas", "historial", "tips"); flash(f"¡Guardado! +{pts} pts", "toast"); st.rerun()
+                    else: st.error("Saldo insuficiente")
+                else: st.error("Saldo insuficiente")
         else:
-            st.markdown("### Sonríe para la foto 😁")
-            img_buffer = st.camera_input("Toma tu foto", label_visibility="collapsed")
+            # META COMPLETADA
+            st.success("¡META COMPLETADA! 🎉")
             
-            c_save, c_cancel = st.columns(2)
+            # --- SISTEMA DE RETIRO Y TRANSFERENCIAS ---
+            st.write("**¿Qué deseas hacer con el dinero?**")
             
-            if img_buffer is not None:
-                if c_save.button("Guardar Foto", type="primary"):
-                    bytes_data = img_buffer.getvalue()
-                    run_query("UPDATE usuarios SET foto = ? WHERE id = ?", (bytes_data, user_id))
-                    st.success("¡Foto actualizada!")
-                    st.session_state.mostrar_camara = False 
-                    time.sleep(1.5)
-                    st.rerun()
+            # Radio button principal
+            opcion_retiro = st.radio("Selecciona una opción:", 
+                                     ["Mantener en Meta", 
+                                      "Retirar a Billetera (Sin Puntos)", 
+                                      "Transferir a un Banco"], 
+                                     key=f"opt_{mid}", label_visibility="collapsed")
             
-            if c_cancel.button("Cancelar / Cerrar"):
-                st.session_state.mostrar_camara = False
-                st.rerun()
-
-        st.markdown("### 📜 Historial de Canjes")
-        mp = run_query("SELECT fecha, premio, codigo FROM premios_canjeados WHERE usuario_id = ? ORDER BY id DESC", (user_id,), return_data=True)
-        if mp:
-            for item in mp:
-                st.info(f"📅 {item[0]} | {item[1]} -> Código: **{item[2]}**")
-        else: st.caption("No has canjeado premios aún.")
+            # Opción 1: Retirar a apartado especial (anti-farming)
+            if opcion_retiro == "Retirar a Billetera (Sin Puntos)":
+                st.caption("El dinero irá a 'Dinero de Metas' y no generará puntos si se vuelve a ahorrar.")
+                if st.button("Confirmar Retiro Interno", key=f"ret_{mid}"):
+                    # Mueve dinero a saldo_metas, NO a saldo principal
+                    with transaccion() as tx:
+                        # ahorrado = ? evita retirar dos veces la misma meta (doble click)
+                        tx.ejecutar("UPDATE metas SET ahorrado = 0 WHERE id = ? AND ahorrado = ?", (mid, aho), minimo_filas=1)
+                        tx.ejecutar("UPDATE usuarios SET saldo_metas = COALESCE(saldo_metas, 0) + ? WHERE id = ?", (aho, user_id), minimo_filas=1)
+                        tx.ejecutar("INSERT INTO transacciones (usuario_id, fecha, ts, descripcion, categoria, monto, tipo) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    (user_id, datetime.date.today().strftime("%d/%m"), int(time.time()), f"Retiro Meta: {nom}", "Ahorro", aho, 'Ingreso'))
+                    if tx.ok:
+                        invalidar_cache(user_id, "usuario", "metas", "historial", "tips", "analisis")
+                        flash("", "balloons"); flash("Dinero movido a tu apartado de Metas."); recargar_seccion()
+                    else: st.error("No se pudo completar el retiro.")
+            
+            # Opción 2: Transferencia Externa
+            elif opcion_retiro == "Transferir a un Banco":
+                # Sub-selección de tipo de transferencia
+                tipo_trans = st.radio("Tipo de Transferencia:", ["Mismo Banco", "Interbancario (CCI)"], key=f"type_{mid}", horizontal=True)
+                
+                if tipo_trans == "Mismo Banco":
+                    n_cuenta = st.text_input("Número de Cuenta", key=f"cta_{mid}")
+                    if st.button("Confirmar Transferencia", key=f"trans_banco_{mid}"):
+                        if len(n_cuenta) > 5 and n_cuenta.isdigit(): # Validación básica
+                            with transaccion() as tx:
+                                tx.ejecutar("UPDATE metas SET ahorrado = 0 WHERE id = ? AND ahorrado = ?", (mid, aho), minimo_filas=1)
+                                tx.ejecutar("INSERT INTO transacciones (usuario_id, fecha, ts, descripcion, categoria, monto, tipo) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                            (user_id, datetime.date.today().strftime("%d/%m"), int(time.time()), f"Transf. a {n_cuenta}: {nom}", "Transferencia", aho, 'Gasto'))
+                            if tx.ok: invalidar_cache(user_id, "metas", "historial", "tips", "analisis"); flash("Transferencia exitosa."); recargar_seccion()
+                            else: st.error("No se pudo completar la transferencia.")
+                        else: st.error("Número de cuenta inválido.")
+                        
+                else: # Interbancario
+                    cci_destino = st.text_input("Ingresa CCI (20 dígitos)", key=f"cci_{mid}", max_chars=20)
+                    if st.button("Confirmar CCI", key=f"trans_cci_{mid}"):
+                        if len(cci_destino) == 20 and cci_destino.isdigit():
+                            with transaccion() as tx:
+                                tx.ejecutar("UPDATE metas SET ahorrado = 0 WHERE id = ? AND ahorrado = ?", (mid, aho), minimo_filas=1)
+                                tx.ejecutar("INSERT INTO transacciones (usuario_id, fecha, ts, descripcion, categoria, monto, tipo) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                            (user_id, datetime.date.today().strftime("%d/%m"), int(time.time()), f"Transf. CCI {cci_destino}: {nom}", "Transferencia", aho, 'Gasto'))
+                            if tx.ok: invalidar_cache(user_id, "metas", "historial", "tips", "analisis"); flash("Transferencia CCI exitosa."); recargar_seccion()
+                            else: st.error("No se pudo completar la transferencia.")
+                        else: st.error("El CCI debe tener 20 números.")
+        st.divider()
+
+# --- TAB 3: SUGERENCIAS ---
+@st.fragment
+def tab_tips(user_id):
+    st.subheader("🤖 HeySave AI Tips")
+    with st.spinner('Analizando tus gastos...'):
+        tips = analizar_gastos_y_sugerir(user_id)
+    for t in tips:
+        st.markdown(f"""<div class="suggestion-card">{t}</div>""", unsafe_allow_html=True)
+
+# --- TAB 4: PREMIOS ---
+@st.fragment
+def tab_premios(user_id):
+    mostrar_flash()
+    puntos_db = leer_usuario(user_id)[1]
+    col_header, col_pts = st.columns([2,1])
+    col_header.subheader("🎁 Canjea tus Puntos")
+    col_pts.metric("Tus Puntos", f"{puntos_db}", delta="XP")
+    cols = st.columns(2)
+    for idx, p in enumerate(catalogo()):
+        with cols[idx % 2]:
+            with st.container(border=True):
+                st.markdown(f"<div style='text-align:center; font-size:40px;'>{p['icono']}</div>", unsafe_allow_html=True)
+                st.markdown(f"<div style='text-align:center; font-weight:bold; color: white;'>{p['nombre']}</div>", unsafe_allow_html=True)
+                st.markdown(f"<div style='text-align:center; color:#f59e0b;'>{p['costo']} Pts</div>", unsafe_allow_html=True)
+                st.caption(f"Quedan {p['stock']}" if p['stock'] > 0 else "Agotado")
+                if st.button("Canjear", key=f"r_{p['id']}", disabled=p['stock'] <= 0):
+                    codigo = canjear(user_id, p['id']) if puntos_db >= p['costo'] else None
+                    # Los puntos se ven en el sidebar: rerun de toda la app
+                    if codigo: flash("", "balloons"); flash(f"¡Canjeado! Tu código: {codigo}"); st.rerun()
+                    elif puntos_db < p['costo']: st.error("Puntos insuficientes")
+                    else: st.error("No se pudo canjear: revisa tus puntos o el stock.")
+
+# --- TAB 5: PERFIL ---
+@st.fragment
+def tab_perfil(user_id):
+    mostrar_flash()
+    saldo_db, puntos_db, nombre_user, dni_user, banco_user, foto_hash, saldo_metas_db = leer_usuario(user_id)
+    nivel_actual, prox_nivel = calcular_nivel(puntos_db)
+    c1, c2 = st.columns([1,2])
+    with c1:
+         st.image(obtener_miniatura(foto_hash), width=120)
+    with c2:
+        st.markdown(f"<h2 style='margin:0;'>{nombre_user}</h2>", unsafe_allow_html=True)
+        st.caption(f"DNI: {dni_user} | Banco: {banco_user}")
+        st.markdown(f"<p style='color:#8B949E; margin-top:5px;'>{nivel_actual}</p>", unsafe_allow_html=True)
+    
+    st.divider()
+    
+    if not st.session_state.mostrar_camara:
+        if st.button("📷 Actualizar Foto de Perfil"):
+            st.session_state.mostrar_camara = True
+            recargar_seccion()
+    else:
+        st.markdown("### Sonríe para la foto 😁")
+        img_buffer = st.camera_input("Toma tu foto", label_visibility="collapsed")
         
-        st.write("")
-        if st.button("Cerrar Sesión", key="btn_logout_tab"):
-            st.session_state.logged_in = False; st.session_state.user_id = None; st.rerun()
+        c_save, c_cancel = st.columns(2)
+        
+        if img_buffer is not None:
+            if c_save.button("Guardar Foto", type="primary"):
+                bytes_data = img_buffer.getvalue()
+                if guardar_foto(user_id, bytes_data, foto_hash):
+                    invalidar_cache(user_id, "usuario")
+                    st.session_state.mostrar_camara = False 
+                    # La foto también está en el sidebar: rerun de toda la app
+                    flash("¡Foto actualizada!"); st.rerun()
+                else: st.error("No se pudo guardar la foto.")
+        
+        if c_cancel.button("Cancelar / Cerrar"):
+            st.session_state.mostrar_camara = False
+            recargar_seccion()
+
+    st.markdown("### 📜 Historial de Canjes")
+    mp = consulta_usuario(user_id, "canjes", "SELECT fecha, premio, codigo FROM premios_canjeados WHERE usuario_id = ? ORDER BY id DESC", (user_id,))
+    if mp:
+        for item in mp:
+            st.info(f"📅 {item[0]} | {item[1]} -> Código: **{item[2]}**")
+    else: st.caption("No has canjeado premios aún.")
+    
+    st.write("")
+    if st.button("Cerrar Sesión", key="btn_logout_tab"): cerrar_sesion(user_id)
+
+# --- DIAGNÓSTICO (SOLO ADMINS) ---
+@st.fragment
+def tab_diagnostico():
+    inst = get_instrumentacion()
+    st.markdown("### 🛠️ Rendimiento")
+    c1, c2 = st.columns(2)
+    inst.activa = c1.toggle("Instrumentación activa", value=inst.activa)
+    inst.umbral_lento_ms = c2.number_input("Consulta lenta desde (ms)", min_value=1.0, value=float(inst.umbral_lento_ms), step=10.0)
+    if not inst.activa: st.caption("Desactivada: solo se cuentan los errores de consultas.")
+
+    resumen = inst.resumen()
+    st.markdown("#### Consultas por tiempo total")
+    if resumen["consultas"]: st.dataframe(resumen["consultas"], hide_index=True, use_container_width=True)
+    else: st.caption("Sin consultas registradas.")
+
+    st.markdown("#### Consultas lentas")
+    for lenta in reversed(resumen["lentas"][-20:]):
+        with st.expander(f"{lenta['ms']:.1f} ms · {lenta['sql'][:80]}"):
+            st.code(lenta["sql"], language="sql")
+            if lenta["plan"]: st.code("\n".join(lenta["plan"]), language="text")
+    if not resumen["lentas"]: st.caption("Ninguna por encima del umbral.")
+
+    st.markdown("#### Escritor (group commit)")
+    escritor = get_escritor()
+    resumen["escritor"] = dict(escritor.estadisticas, pendientes=escritor.pendientes())
+    cols = st.columns(4)
+    cols[0].metric("Operaciones", resumen["escritor"]["operaciones"])
+    cols[1].metric("Ops/commit", f"{resumen['escritor']['operaciones'] / max(resumen['escritor']['grupos'], 1):.1f}")
+    cols[2].metric("Reintentos BUSY", resumen["escritor"]["reintentos"])
+    cols[3].metric("En cola", resumen["escritor"]["pendientes"])
+
+    st.markdown("#### Últimos reruns (ms)")
+    if resumen["reruns"]: st.dataframe(resumen["reruns"][::-1], hide_index=True, use_container_width=True)
+    else: st.caption("Activa la instrumentación para medir reruns.")
+
+    st.markdown("#### Conciliación de saldos")
+    if st.button("⚖️ Conciliar con el libro"):
+        st.session_state.conciliacion = conciliar() or False
+    reporte = st.session_state.get("conciliacion")
+    if reporte:
+        cols = st.columns(3)
+        cols[0].metric("Usuarios", reporte["usuarios"])
+        cols[1].metric("Con diferencia", reporte["con_diferencia"])
+        cols[2].metric("Segundos", reporte["segundos"])
+        if reporte["mayores"]: st.dataframe(reporte["mayores"], hide_index=True, use_container_width=True)
+        st.caption("Para corregir: `python -m heysave.conciliacion --reconstruir`.")
+    elif reporte is False: st.error("No se pudo conciliar (ver el log).")
+
+    c1, c2 = st.columns(2)
+    c1.download_button("⬇️ Descargar JSON", json.dumps(resumen, indent=2, ensure_ascii=False),
+                       file_name="heysave_diagnostico.json", mime="application/json", use_container_width=True)
+    if c2.button("Reiniciar métricas", use_container_width=True):
+        inst.reiniciar(); recargar_seccion()
 
 # --- EJECUCIÓN ---
-if st.session_state.logged_in: main_app()
-else: login_register_screen()
+get_pool().conteo_hilo(reiniciar=True)
+get_instrumentacion().iniciar_rerun()
+completa = False
+try:
+    if not st.session_state.logged_in and "s" in st.query_params: restaurar_sesion()
+    if st.session_state.logged_in: main_app()
+    else: login_register_screen()
+    completa = True
+finally:
+    # Lo leen los benchmarks (AppTest) y el panel de diagnóstico
+    desglose = get_instrumentacion().cerrar_rerun(st.session_state.get("seccion_activa", "login") if st.session_state.logged_in else "login")
+    conteo = get_pool().conteo_hilo()
+    # Una corrida cortada por st.rerun() (p. ej. tras registrar un gasto) no llega a mostrarse:
+    # sus consultas y escrituras se suman a la siguiente, que es la que ve quien mide
+    arrastre = st.session_state.pop("perf_arrastre", None)
+    if arrastre: conteo = {k: v + arrastre.get(k, 0) for k, v in conteo.items()}
+    if not completa: st.session_state.perf_arrastre = conteo
+    st.session_state.perf_rerun = dict(conteo, **(desglose or {}))
@@ -0,0 +1,262 @@
+"""Benchmark de carga de HeySave con sesiones simuladas (Streamlit AppTest).
+
+Crea una base sintética (usuarios, transacciones y metas configurables), abre
+varias sesiones concurrentes que inician sesión por el formulario y hacen
+gastos, abonos, canjes y cambios de sección, y mide cada rerun. AppTest no es
+seguro entre hilos: cada sesión corre en su propio proceso.
+
+Uso:
+    python benchmarks/bench_heysave.py --usuarios 200 --transacciones 2000 --sesiones 8 --acciones 25 --salida bench.json
+
+El resultado es un JSON con percentiles de latencia por acción, consultas por
+rerun (según `st.session_state.perf_rerun`: lecturas del pool más sentencias del
+escritor), errores de bloqueo de SQLite (incluidos los BUSY que reintentó el
+escritor) y escrituras rechazadas, pensado para comparar versiones entre sí.
+"""
+import argparse
+import datetime
+import json
+import math
+import multiprocessing
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(RAIZ, "ProyectoHeySave.py")
+PASSWORD = "bench-pass!"
+
+DESCRIPCIONES = [
+    ("Almuerzo menu", "Alimentación 🍔"), ("Pizza viernes", "Alimentación 🍔"), ("Starbucks", "Alimentación 🍔"),
+    ("Uber a casa", "Transporte 🚕"), ("Pasaje bus", "Transporte 🚕"), ("Netflix", "Entretenimiento 🎬"),
+    ("Entrada cine", "Entretenimiento 🎬"), ("Fotocopias", "Educación 📚"), ("Polo tienda", "Moda 👕"),
+    ("Varios bodega", "Varios 📦"),
+]
+SECCIONES = ["🏠 Inicio", "📊 Análisis", "🎯 Metas", "💡 Tips", "🎁 Premios", "👤 Perfil"]
+
+
+# --- BASE SINTÉTICA ---
+def sembrar(ruta, usuarios, transacciones, metas, semilla, hash_password):
+    """Llena una base ya migrada con datos sintéticos (todos con la misma contraseña hasheada); devuelve [(user_id, usuario, [meta_ids])]."""
+    rng = random.Random(semilla)
+    conn = sqlite3.connect(ruta)
+    ahora = int(time.time())
+    with conn:
+        conn.executemany(
+            "INSERT INTO usuarios (usuario, password, nombre, dni, banco, saldo, saldo_metas, puntos, pais, direccion, postal) "
+            "VALUES (?, ?, ?, ?, 'BCP', ?, 0, ?, 'Perú', 'Av. Bench 123', '15001')",
+            [(f"bench{i}", hash_password, f"Usuario Bench {i}", f"{10000000 + i}", 1_000_000.0, 100_000) for i in range(usuarios)])
+        ids = [fila[0] for fila in conn.execute("SELECT id FROM usuarios WHERE usuario LIKE 'bench%' ORDER BY id")]
+        for user_id in ids:
+            filas = []
+            for _ in range(transacciones):
+                ts = ahora - rng.randint(0, 365 * 86400)
+                if rng.random() < 0.8:
+                    desc, cat = rng.choice(DESCRIPCIONES)
+                    tipo = "Gasto"
+                else:
+                    desc, cat, tipo = "Sueldo", "Ingreso", "Ingreso"
+                fecha = datetime.date.fromtimestamp(ts).strftime("%d/%m")
+                filas.append((user_id, fecha, ts, desc, cat, round(rng.uniform(1, 300), 2), tipo))
+            conn.executemany("INSERT INTO transacciones (usuario_id, fecha, ts, descripcion, categoria, monto, tipo) VALUES (?, ?, ?, ?, ?, ?, ?)", filas)
+            conn.executemany("INSERT INTO metas (usuario_id, nombre, objetivo, ahorrado) VALUES (?, ?, ?, 0)",
+                             [(user_id, f"Meta {j}", 1_000_000.0) for j in range(metas)])
+    resultado = []
+    for user_id, usuario in conn.execute("SELECT id, usuario FROM usuarios WHERE usuario LIKE 'bench%' ORDER BY id").fetchall():
+        metas_ids = [fila[0] for fila in conn.execute("SELECT id FROM metas WHERE usuario_id = ?", (user_id,))]
+        resultado.append((user_id, usuario, metas_ids))
+    conn.close()
+    return resultado
+
+
+# --- SESIONES SIMULADAS ---
+def _por_etiqueta(elementos, etiqueta):
+    for elemento in elementos:
+        if elemento.label == etiqueta:
+            return elemento
+    raise LookupError(f"No se encontró el widget '{etiqueta}'")
+
+def _medir(at, accion, preparar, muestras):
+    # `preparar` deja los widgets listos (y navega, con su propio rerun, si hace falta);
+    # solo se mide el rerun que procesa la acción
+    if preparar:
+        preparar()
+    inicio = time.perf_counter()
+    at.run()
+    ms = (time.perf_counter() - inicio) * 1000
+    perf = at.session_state["perf_rerun"] if "perf_rerun" in at.session_state else {}
+    muestras.append({
+        "accion": accion,
+        "ms": ms,
+        "consultas": perf.get("consultas"),
+        "escrituras": perf.get("escrituras"),
+        "errores_bloqueo": perf.get("errores_bloqueo", 0),
+        "rechazadas": perf.get("rechazadas", 0),
+        "excepciones": len(at.exception),
+    })
+
+def _ir_a(at, seccion):
+    at.radio(key="seccion_activa").set_value(seccion)
+
+def simular_sesion(usuario, metas_ids, acciones, semilla, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(semilla)
+    muestras = []
+    at = AppTest.from_file(APP, default_timeout=timeout)
+    _medir(at, "pantalla_login", None, muestras)
+
+    def login():
+        _por_etiqueta(at.text_input, "Usuario").set_value(usuario)
+        _por_etiqueta(at.text_input, "Contraseña").set_value(PASSWORD)
+        _por_etiqueta(at.button, "Ingresar").click()
+    _medir(at, "login", login, muestras)
+    if not at.session_state["logged_in"]:
+        raise RuntimeError(f"{usuario}: el login falló")
+
+    def gasto():
+        _ir_a(at, "🏠 Inicio"); at.run()
+        desc, _ = rng.choice(DESCRIPCIONES)
+        _por_etiqueta(at.text_input, "Descripción").set_value(desc)
+        _por_etiqueta(at.number_input, "Monto (S/.)").set_value(round(rng.uniform(1, 50), 2))
+        _por_etiqueta(at.button, "➖ Registrar Gasto").click()
+
+    def abono():
+        _ir_a(at, "🎯 Metas"); at.run()
+        mid = rng.choice(metas_ids)
+        at.number_input(key=f"ab_{mid}").set_value(float(rng.randint(1, 40)))
+        at.button(key=f"btn_{mid}").click()
+
+    def canje():
+        _ir_a(at, "🎁 Premios"); at.run()
+        botones = [b for b in at.button if b.label == "Canjear"]
+        rng.choice(botones).click()
+
+    def navegar():
+        _ir_a(at, rng.choice(SECCIONES))
+
+    pasos = {"gasto": gasto, "abono": abono, "canje": canje, "navegar": navegar}
+    pesos = {"gasto": 4, "abono": 2, "canje": 1, "navegar": 3}
+    if not metas_ids:
+        pesos["abono"] = 0
+    for _ in range(acciones):
+        accion = rng.choices(list(pesos), weights=list(pesos.values()))[0]
+        _medir(at, accion, pasos[accion], muestras)
+    return muestras
+
+def correr_sesion(i, usuario, metas_ids, acciones, semilla, timeout):
+    """Una sesión en un proceso hijo: devuelve `(muestras, fallo)`."""
+    # El hijo hereda HEYSAVE_DB del entorno, pero no el sys.path del padre
+    sys.path.insert(0, RAIZ)
+    try:
+        return simular_sesion(usuario, metas_ids, acciones, semilla, timeout), None
+    except Exception as e:
+        return [], f"sesión {i}: {e!r}"
+
+
+# --- REPORTE ---
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    # Nearest-rank: el menor valor que deja al menos p% de las muestras por debajo o igual
+    k = max(0, min(len(ordenados) - 1, math.ceil(p / 100 * len(ordenados)) - 1))
+    return ordenados[k]
+
+def resumir(muestras):
+    por_accion = {}
+    for accion in sorted({m["accion"] for m in muestras}):
+        grupo = [m for m in muestras if m["accion"] == accion]
+        ms = [m["ms"] for m in grupo]
+        consultas = [m["consultas"] for m in grupo if m["consultas"] is not None]
+        por_accion[accion] = {
+            "n": len(grupo),
+            "ms_p50": round(percentil(ms, 50), 2),
+            "ms_p90": round(percentil(ms, 90), 2),
+            "ms_p99": round(percentil(ms, 99), 2),
+            "ms_max": round(max(ms), 2),
+            "consultas_p50": percentil(consultas, 50),
+            "consultas_max": max(consultas) if consultas else None,
+            "escrituras_p50": percentil([m["escrituras"] for m in grupo if m["escrituras"] is not None], 50),
+            "errores_bloqueo": sum(m["errores_bloqueo"] for m in grupo),
+            "rechazadas": sum(m["rechazadas"] for m in grupo),
+            "excepciones": sum(m["excepciones"] for m in grupo),
+        }
+    return por_accion
+
+def version_app():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=RAIZ, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--usuarios", type=int, default=50)
+    parser.add_argument("--transacciones", type=int, default=1000, help="transacciones por usuario")
+    parser.add_argument("--metas", type=int, default=3, help="metas por usuario")
+    parser.add_argument("--sesiones", type=int, default=8, help="sesiones concurrentes")
+    parser.add_argument("--acciones", type=int, default=20, help="acciones por sesión")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=60.0, help="timeout de cada rerun (s)")
+    parser.add_argument("--db", help="ruta de la base sintética (por defecto, un archivo temporal)")
+    parser.add_argument("--salida", help="archivo JSON de resultados (por defecto, stdout)")
+    args = parser.parse_args(argv)
+
+    ruta = args.db or os.path.join(tempfile.mkdtemp(prefix="heysave-bench-"), "heysave.db")
+    # heysave.db lee HEYSAVE_DB al importarse, así que debe estar antes
+    os.environ["HEYSAVE_DB"] = ruta
+    sys.path.insert(0, RAIZ)
+    from heysave.autenticacion import hashear_password
+    from heysave.db import get_pool
+    get_pool()  # aplica las migraciones sin levantar Streamlit
+
+    inicio = time.perf_counter()
+    usuarios = sembrar(ruta, args.usuarios, args.transacciones, args.metas, args.semilla, hashear_password(PASSWORD))
+    segundos_siembra = time.perf_counter() - inicio
+
+    rng = random.Random(args.semilla)
+    elegidos = [rng.choice(usuarios) for _ in range(args.sesiones)]
+    muestras, fallos = [], []
+
+    # spawn y no fork: el padre ya tiene vivos el escritor y las conexiones del pool
+    inicio = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.sesiones, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futuros = [pool.submit(correr_sesion, i, usuario, metas_ids, args.acciones, args.semilla + i, args.timeout)
+                   for i, (_, usuario, metas_ids) in enumerate(elegidos)]
+        for futuro in futuros:
+            resultado, fallo = futuro.result()
+            muestras += resultado
+            if fallo:
+                fallos.append(fallo)
+    segundos = time.perf_counter() - inicio
+
+    reporte = {
+        "version": version_app(),
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("salida",)} | {"db": ruta},
+        "siembra_segundos": round(segundos_siembra, 2),
+        "duracion_segundos": round(segundos, 2),
+        "reruns": len(muestras),
+        "reruns_por_segundo": round(len(muestras) / segundos, 2) if segundos else None,
+        "errores_bloqueo": sum(m["errores_bloqueo"] for m in muestras),
+        "escrituras_rechazadas": sum(m["rechazadas"] for m in muestras),
+        "sesiones_fallidas": fallos,
+        "total": resumir([dict(m, accion="total") for m in muestras])["total"] if muestras else {},
+        "por_accion": resumir(muestras),
+    }
+    texto = json.dumps(reporte, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    else:
+        print(texto)
+    return 1 if fallos else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
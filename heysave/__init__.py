@@ -0,0 +1,6 @@
+"""Núcleo de HeySave: dominio y almacenamiento, sin Streamlit.
+
+Lo usan la app (`ProyectoHeySave.py`), los trabajos por lotes y los benchmarks.
+Cada módulo importa solo lo que necesita y las dependencias pesadas (pandas,
+Pillow) se cargan recién al usarlas.
+"""
@@ -0,0 +1,91 @@
+"""Archivo de transacciones viejas: pasan de `transacciones` a `transacciones_archivo`.
+
+La tabla caliente (y sus índices) queda con los movimientos recientes, que son
+los que leen el historial y el día a día. Los agregados mensuales se mantienen
+por trigger al insertar y no se tocan al mover filas, así que el análisis no
+pierde nada; el historial sigue por el archivo cuando se pagina más atrás.
+Después se devuelve el espacio libre con `PRAGMA incremental_vacuum`.
+
+Uso (p. ej. desde cron, cada semana):
+    python -m heysave.archivo [--dias 365] [--lote 5000] [--vacuum-completo]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from heysave.conciliacion import tomar_checkpoint
+from heysave.db import get_pool, run_query, run_transaction
+
+# Antigüedad (en días, por `ts`) desde la que se archiva
+DIAS_DEFAULT = int(os.environ.get("HEYSAVE_ARCHIVO_DIAS", "365"))
+_COLUMNAS = "id, usuario_id, fecha, descripcion, categoria, monto, tipo, ts"
+
+def _liberar_espacio(vacuum_completo):
+    # Fuera del escritor, por una conexión del pool en autocommit: VACUUM no puede ir
+    # dentro de una transacción, e incremental_vacuum libera una página por paso y
+    # execute() da uno solo (executescript lo corre hasta el final)
+    with get_pool().conexion() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2 and vacuum_completo:
+            # Única vez en bases creadas antes de auto_vacuum: reescribe el archivo entero
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return False, 0
+        libres = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        conn.executescript("PRAGMA incremental_vacuum;")
+        return True, libres - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+def archivar(dias=None, tamano_lote=5000, vacuum_completo=False):
+    """Mueve al archivo las transacciones con `ts` de hace más de `dias` días.
+
+    Antes toma un checkpoint de saldos y solo archiva lo que ese checkpoint ya
+    cubre: la conciliación incremental no lee el archivo. Cada lote (rango de
+    ids) es una transacción del escritor. Devuelve un dict con filas movidas,
+    lotes, si hubo error, páginas devueltas al sistema y segundos.
+    """
+    dias = DIAS_DEFAULT if dias is None else dias
+    inicio = time.perf_counter()
+    limite = int(time.time()) - dias * 86400
+    resumen = {"movidas": 0, "lotes": 0, "error": False, "auto_vacuum": False, "paginas_liberadas": 0}
+    if not tomar_checkpoint():
+        resumen["error"] = True
+        return dict(resumen, segundos=round(time.perf_counter() - inicio, 3))
+    hasta = run_query("SELECT COALESCE(MIN(hasta_id), 0) FROM checkpoints_saldo", return_data=True)[0][0]
+    ultimo = 0
+    while True:
+        # Keyset por id: cada lote empieza donde terminó el anterior, sin volver a
+        # recorrer las filas recientes con id bajo que no se archivan
+        tope, n = run_query("""SELECT MAX(id), COUNT(*) FROM (SELECT id FROM transacciones
+                                WHERE id > ? AND id <= ? AND ts < ? ORDER BY id LIMIT ?)""",
+                            (ultimo, hasta, limite, tamano_lote), return_data=True)[0]
+        if not n:
+            break
+        rango = (ultimo, tope, limite)
+        if not run_transaction([
+            (f"INSERT INTO transacciones_archivo ({_COLUMNAS}) SELECT {_COLUMNAS} FROM transacciones WHERE id > ? AND id <= ? AND ts < ?", rango),
+            ("DELETE FROM transacciones WHERE id > ? AND id <= ? AND ts < ?", rango),
+        ]):
+            resumen["error"] = True  # ya quedó en el log; lo que falte se toma en la próxima corrida
+            break
+        resumen["movidas"] += n
+        resumen["lotes"] += 1
+        ultimo = tope
+    resumen["auto_vacuum"], resumen["paginas_liberadas"] = _liberar_espacio(vacuum_completo)
+    resumen["segundos"] = round(time.perf_counter() - inicio, 3)
+    return resumen
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archiva las transacciones viejas y libera espacio.")
+    parser.add_argument("--dias", type=int, default=DIAS_DEFAULT, help="antigüedad desde la que se archiva")
+    parser.add_argument("--lote", type=int, default=5000, help="transacciones por transacción del escritor")
+    parser.add_argument("--vacuum-completo", action="store_true",
+                        help="si la base no tiene auto_vacuum incremental, activarlo con un VACUUM completo (una vez)")
+    args = parser.parse_args(argv)
+    resumen = archivar(args.dias, args.lote, args.vacuum_completo)
+    print(json.dumps(resumen, ensure_ascii=False))
+    return 1 if resumen["error"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
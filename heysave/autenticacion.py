@@ -0,0 +1,278 @@
+"""Contraseñas con scrypt y sesiones firmadas que sobreviven a recargar la página.
+
+El KDF es caro a propósito (~16 MiB y decenas de ms por intento): corre en un
+pool de hilos acotado (hashlib.scrypt suelta el GIL), así un pico de logins no
+deja sin CPU al resto de las sesiones de Streamlit. Un login correcto emite un
+token `id.firma` (HMAC-SHA256 con el secreto del servidor); la tabla `sesiones`
+guarda solo el SHA-256 del id, y una caché en memoria evita volver a leer la base
+para validarlo. Las sesiones que vuelven nunca pasan por el KDF.
+
+El token viaja en la URL, así que puede quedar en el historial o compartirse con
+un enlace: dura poco (`HEYSAVE_SESION_HORAS`) y cada vez que se restaura una
+sesión se cambia por uno nuevo, lo que invalida el que quedó atrás.
+
+Las contraseñas en texto plano de versiones viejas se rehashean al primer login,
+o todas de una vez con:
+    python -m heysave.autenticacion --migrar
+"""
+import argparse
+import base64
+import functools
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from heysave.db import run_query, run_transaction
+from heysave.instrumentacion import get_instrumentacion
+
+# --- CONTRASEÑAS (SCRYPT) ---
+# N=2^14, r=8: 16 MiB por intento (128 * r * N bytes)
+SCRYPT_N, SCRYPT_R, SCRYPT_P = 2 ** 14, 8, 1
+PREFIJO_HASH = "scrypt$"
+
+def _b64(datos):
+    return base64.b64encode(datos).decode("ascii")
+
+def _scrypt(password, sal, n, r, p):
+    return hashlib.scrypt(password.encode("utf-8"), salt=sal, n=n, r=r, p=p, maxmem=256 * r * n + 2 ** 20)
+
+def hashear_password(password):
+    """`scrypt$n$r$p$sal$hash` (base64), con sal aleatoria de 16 bytes."""
+    sal = secrets.token_bytes(16)
+    return f"{PREFIJO_HASH}{SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(sal)}${_b64(_scrypt(password, sal, SCRYPT_N, SCRYPT_R, SCRYPT_P))}"
+
+def verificar_password(password, guardado):
+    """`(correcta, hay_que_rehashear)`: rehashear si era texto plano o usa parámetros viejos."""
+    if not guardado:
+        return False, False
+    if not guardado.startswith(PREFIJO_HASH):
+        # Texto plano de antes de los hashes
+        return hmac.compare_digest(password.encode("utf-8"), guardado.encode("utf-8")), True
+    try:
+        n, r, p, sal, esperado = guardado[len(PREFIJO_HASH):].split("$")
+        n, r, p = int(n), int(r), int(p)
+        calculado = _scrypt(password, base64.b64decode(sal), n, r, p)
+    except ValueError:
+        return False, False
+    return hmac.compare_digest(calculado, base64.b64decode(esperado)), (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+class PoolKDF:
+    """Hilos acotados para el KDF, con contrapresión como la cola del escritor.
+
+    `max_hilos` limita cuántos scrypt corren a la vez (CPU y memoria) y
+    `max_pendientes` cuántos pueden esperar: si se llena, quien llama espera
+    turno en vez de encolar sin límite.
+    """
+
+    def __init__(self, max_hilos=2, max_pendientes=64):
+        self._ejecutor = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix="heysave-kdf")
+        self._cupos = threading.BoundedSemaphore(max_pendientes)
+
+    def ejecutar(self, funcion, *args):
+        with get_instrumentacion().medir("kdf"):
+            self._cupos.acquire()
+            try:
+                return self._ejecutor.submit(funcion, *args).result()
+            finally:
+                self._cupos.release()
+
+    def map(self, funcion, valores):
+        """`ejecutar` para cada valor, en paralelo y en orden; cada uno ocupa un cupo hasta terminar."""
+        futuros = []
+        with get_instrumentacion().medir("kdf"):
+            for valor in valores:
+                self._cupos.acquire()
+                try:
+                    futuro = self._ejecutor.submit(funcion, valor)
+                except BaseException:
+                    self._cupos.release()
+                    raise
+                futuro.add_done_callback(lambda _: self._cupos.release())
+                futuros.append(futuro)
+            return [futuro.result() for futuro in futuros]
+
+@functools.lru_cache(maxsize=None)
+def get_pool_kdf():
+    return PoolKDF(max_hilos=int(os.environ.get("HEYSAVE_KDF_HILOS", min(4, os.cpu_count() or 1))))
+
+# Para que un usuario inexistente tarde lo mismo que una contraseña incorrecta
+_HASH_SENUELO = f"{PREFIJO_HASH}{SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(b'0' * 16)}${_b64(b'0' * 64)}"
+
+def autenticar(usuario, password):
+    """`(user_id, usuario, nombre)` si las credenciales son correctas, si no None."""
+    fila = run_query("SELECT id, usuario, nombre, password FROM usuarios WHERE usuario = ?", (usuario,), return_data=True)
+    guardado = fila[0][3] if fila else _HASH_SENUELO
+    correcta, rehashear = get_pool_kdf().ejecutar(verificar_password, password, guardado)
+    if not (fila and correcta):
+        return None
+    if rehashear:
+        # Condicionado al valor leído: si otro login ya lo rehasheó, no se pisa
+        run_query("UPDATE usuarios SET password = ? WHERE id = ? AND password = ?",
+                  (get_pool_kdf().ejecutar(hashear_password, password), fila[0][0], guardado))
+    return fila[0][:3]
+
+def registrar_password(password):
+    """Hash para guardar al crear la cuenta (también por el pool)."""
+    return get_pool_kdf().ejecutar(hashear_password, password)
+
+def migrar_passwords(tamano_lote=100):
+    """Rehashea todas las contraseñas en texto plano; devuelve cuántas."""
+    total = 0
+    while True:
+        filas = run_query("SELECT id, password FROM usuarios WHERE password NOT LIKE 'scrypt$%' AND password IS NOT NULL LIMIT ?",
+                          (tamano_lote,), return_data=True)
+        if not filas:
+            return total
+        hashes = get_pool_kdf().map(hashear_password, [p for _, p in filas])
+        if not run_transaction([("UPDATE usuarios SET password = ? WHERE id = ? AND password = ?",
+                                 [(h, uid, p) for (uid, p), h in zip(filas, hashes)])]):
+            return total
+        total += len(filas)
+
+# --- SESIONES FIRMADAS ---
+HORAS_SESION = int(os.environ.get("HEYSAVE_SESION_HORAS", "12"))
+# `id.firma`: id de secrets.token_urlsafe y los primeros 32 hex del HMAC
+_TOKEN = re.compile(r"([A-Za-z0-9_-]{16,64})\.([0-9a-f]{32})")
+
+@functools.lru_cache(maxsize=None)
+def _secreto():
+    # HEYSAVE_SECRETO si está; si no, el que generó la migración (así los tokens sobreviven reinicios)
+    secreto = os.environ.get("HEYSAVE_SECRETO")
+    if secreto:
+        return secreto.encode("utf-8")
+    return run_query("SELECT valor FROM ajustes WHERE clave = 'secreto_sesiones'", return_data=True)[0][0].encode("utf-8")
+
+def _firma(id_sesion):
+    return hmac.new(_secreto(), id_sesion.encode("ascii"), hashlib.sha256).hexdigest()[:32]
+
+def _id_valido(token):
+    """El id del token si tiene el formato y la firma correctos, si no None.
+
+    El formato se revisa antes de codificar o comparar nada: el token llega de
+    la URL y puede traer cualquier texto.
+    """
+    partes = _TOKEN.fullmatch(token) if isinstance(token, str) else None
+    if not partes:
+        return None
+    id_sesion, firma = partes.groups()
+    # La firma descarta tokens inventados sin tocar la base
+    return id_sesion if hmac.compare_digest(firma.encode("ascii"), _firma(id_sesion).encode("ascii")) else None
+
+def _hash_id(id_sesion):
+    return hashlib.sha256(id_sesion.encode("ascii")).hexdigest()
+
+class CacheSesiones:
+    """LRU en memoria de sesiones válidas: hash del id -> (user_id, usuario, expira).
+
+    El TTL acota cuánto sigue valiendo aquí una sesión cerrada desde otro proceso.
+    """
+
+    def __init__(self, max_entradas=10000, ttl=60):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada and entrada[0] > time.monotonic() and entrada[1][2] > time.time():
+                self._datos.move_to_end(clave)
+                return entrada[1]
+            self._datos.pop(clave, None)
+            return None
+
+    def guardar(self, clave, sesion):
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + self.ttl, sesion)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def descartar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+@functools.lru_cache(maxsize=None)
+def get_cache_sesiones():
+    return CacheSesiones()
+
+def _sentencias_nueva_sesion(user_id):
+    id_sesion = secrets.token_urlsafe(24)
+    ahora = int(time.time())
+    return f"{id_sesion}.{_firma(id_sesion)}", [
+        ("INSERT INTO sesiones (token_hash, usuario_id, creada, expira) VALUES (?, ?, ?, ?)",
+         (_hash_id(id_sesion), user_id, ahora, ahora + HORAS_SESION * 3600)),
+        # De paso, las vencidas del mismo usuario
+        ("DELETE FROM sesiones WHERE usuario_id = ? AND expira < ?", (user_id, ahora)),
+    ]
+
+def crear_sesion(user_id):
+    """Token `id.firma` para el navegador, o None si no se pudo guardar."""
+    token, sentencias = _sentencias_nueva_sesion(user_id)
+    return token if run_transaction(sentencias) else None
+
+def validar_sesion(token):
+    """`(user_id, usuario)` de un token vigente, o None. Sin KDF: HMAC, caché y a lo sumo una lectura."""
+    id_sesion = _id_valido(token)
+    if id_sesion is None:
+        return None
+    clave = _hash_id(id_sesion)
+    cache = get_cache_sesiones()
+    sesion = cache.obtener(clave)
+    if sesion is None:
+        fila = run_query("""SELECT s.usuario_id, u.usuario, s.expira FROM sesiones s JOIN usuarios u ON u.id = s.usuario_id
+                            WHERE s.token_hash = ? AND s.expira > ?""", (clave, int(time.time())), return_data=True)
+        if not fila:
+            return None
+        sesion = fila[0]
+        cache.guardar(clave, sesion)
+    return sesion[:2]
+
+def renovar_sesion(token):
+    """`(user_id, usuario, token_nuevo)` a cambio de un token vigente, o None.
+
+    El viejo se borra en la misma transacción (debe seguir ahí: de dos
+    renovaciones simultáneas del mismo token gana una sola).
+    """
+    sesion = validar_sesion(token)
+    if sesion is None:
+        return None
+    clave = _hash_id(_id_valido(token))
+    get_cache_sesiones().descartar(clave)
+    nuevo, sentencias = _sentencias_nueva_sesion(sesion[0])
+    if not run_transaction([("DELETE FROM sesiones WHERE token_hash = ?", (clave,), 1)] + sentencias):
+        return None
+    return sesion[0], sesion[1], nuevo
+
+def revocar_sesion(token):
+    """Cierra la sesión del token (en la base y en la caché de este proceso)."""
+    id_sesion = _id_valido(token)
+    if id_sesion is None:
+        return
+    clave = _hash_id(id_sesion)
+    get_cache_sesiones().descartar(clave)
+    run_query("DELETE FROM sesiones WHERE token_hash = ?", (clave,))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mantenimiento de credenciales.")
+    parser.add_argument("--migrar", action="store_true", help="rehashear todas las contraseñas en texto plano")
+    args = parser.parse_args(argv)
+    if not args.migrar:
+        parser.print_help()
+        return 0
+    inicio = time.perf_counter()
+    migradas = migrar_passwords()
+    print(json.dumps({"migradas": migradas, "segundos": round(time.perf_counter() - inicio, 3)}))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""Caché en memoria de las lecturas por usuario, con invalidación explícita."""
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+from heysave.db import run_query
+
+# --- CACHÉ DE LECTURAS POR USUARIO ---
+class CacheUsuario:
+    """LRU con TTL para las lecturas de main_app, indexada por (user_id, seccion).
+
+    Las rutas de escritura llaman a `invalidar(user_id, ...)` con las secciones
+    que cambiaron; el TTL solo acota cuánto puede durar un dato si lo modificó
+    otro proceso.
+    """
+
+    def __init__(self, max_entradas=2000, ttl=300):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._versiones = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, user_id, seccion, cargar):
+        clave = (user_id, seccion)
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada and entrada[0] > time.monotonic():
+                self._datos.move_to_end(clave)
+                return entrada[1]
+            version = self._versiones.get(user_id, 0)
+        valor = cargar()
+        if valor is False:
+            return valor  # la consulta falló: no se guarda
+        with self._lock:
+            # Si alguien invalidó mientras leíamos, el valor ya nació viejo
+            if self._versiones.get(user_id, 0) == version:
+                self._datos[clave] = (time.monotonic() + self.ttl, valor)
+                self._datos.move_to_end(clave)
+                while len(self._datos) > self.max_entradas:
+                    self._datos.popitem(last=False)
+        return valor
+
+    def invalidar(self, user_id, *secciones):
+        # Sin secciones se descarta todo lo del usuario
+        with self._lock:
+            self._versiones[user_id] = self._versiones.get(user_id, 0) + 1
+            for clave in [k for k in self._datos if k[0] == user_id and (not secciones or k[1] in secciones)]:
+                del self._datos[clave]
+
+@functools.lru_cache(maxsize=None)
+def get_cache():
+    return CacheUsuario()
+
+# --- CACHÉ DE LECTURAS COMPARTIDAS ---
+class CacheCompartida:
+    """Lecturas iguales para todos los usuarios (p. ej. el catálogo de premios), por sección.
+
+    Aparte de CacheUsuario: ni ocupa lugar en su LRU ni se invalida junto con
+    las secciones de un usuario. TTL corto porque otros procesos también las cambian.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._datos = {}
+        self._versiones = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, seccion, cargar):
+        with self._lock:
+            entrada = self._datos.get(seccion)
+            if entrada and entrada[0] > time.monotonic():
+                return entrada[1]
+            version = self._versiones.get(seccion, 0)
+        valor = cargar()
+        if valor is False:
+            return valor
+        with self._lock:
+            if self._versiones.get(seccion, 0) == version:
+                self._datos[seccion] = (time.monotonic() + self.ttl, valor)
+        return valor
+
+    def invalidar(self, *secciones):
+        with self._lock:
+            for seccion in secciones:
+                self._versiones[seccion] = self._versiones.get(seccion, 0) + 1
+                self._datos.pop(seccion, None)
+
+@functools.lru_cache(maxsize=None)
+def get_cache_compartida():
+    return CacheCompartida()
+
+def consulta_usuario(user_id, seccion, query, params):
+    return get_cache().obtener(user_id, seccion, lambda: run_query(query, params, return_data=True))
+
+def invalidar_cache(user_id, *secciones):
+    get_cache().invalidar(user_id, *secciones)
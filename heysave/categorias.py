@@ -0,0 +1,95 @@
+"""Categorización de transacciones por palabras clave."""
+import csv
+import functools
+import os
+import re
+
+from heysave.instrumentacion import get_instrumentacion
+
+# --- CATEGORIZACIÓN DE TRANSACCIONES ---
+# Tabla de reglas: el orden es la prioridad (si una descripción tiene palabras
+# de varias categorías gana la primera, igual que la cadena de if/elif de antes).
+REGLAS_CATEGORIA = [
+    ("Alimentación 🍔", ["comida", "hamburguesa", "pizza", "starbucks", "menu", "kfc", "desayuno"]),
+    ("Transporte 🚕", ["uber", "taxi", "bus", "gasolina", "cabify", "pasaje"]),
+    ("Entretenimiento 🎬", ["cine", "netflix", "spotify", "fiesta", "entrada", "juego"]),
+    ("Educación 📚", ["libro", "fotocopias", "curso", "pension", "universidad", "clase"]),
+    ("Moda 👕", ["ropa", "zapatilla", "polo", "tienda", "shopping"]),
+]
+CATEGORIA_POR_DEFECTO = "Varios 📦"
+
+def _regex_trie(palabras):
+    # Arma un regex con forma de trie ("bus(?:queda)?|ca(?:bify|...)") para que
+    # el motor de `re` no pruebe miles de alternativas en cada posición.
+    trie = {}
+    for palabra in palabras:
+        nodo = trie
+        for ch in palabra: nodo = nodo.setdefault(ch, {})
+        nodo[""] = {}
+    def armar(nodo):
+        ramas = [re.escape(ch) + armar(hijo) for ch, hijo in sorted(nodo.items()) if ch]
+        if not ramas: return ""
+        cuerpo = ramas[0] if len(ramas) == 1 else "(?:" + "|".join(ramas) + ")"
+        return f"(?:{cuerpo})?" if "" in nodo else cuerpo
+    return armar(trie)
+
+class Categorizador:
+    """Matcher compilado una sola vez a partir de una tabla de reglas `(categoria, [palabras])`."""
+
+    def __init__(self, reglas, por_defecto=CATEGORIA_POR_DEFECTO):
+        self.por_defecto = por_defecto
+        self.categorias = [cat for cat, _ in reglas]
+        prioridad = {}
+        for prio, (cat, palabras) in enumerate(reglas):
+            for palabra in palabras:
+                if palabra: prioridad.setdefault(palabra.lower(), prio)
+        # El regex devuelve la palabra más larga que empieza en cada posición;
+        # las más cortas que también matchean ahí son prefijos suyos, así que
+        # cada palabra guarda la mejor prioridad entre ella y sus prefijos.
+        self._mejor = {p: min(prioridad[p[:i]] for i in range(1, len(p) + 1) if p[:i] in prioridad) for p in prioridad}
+        self._patron = re.compile("(?=(" + _regex_trie(prioridad) + "))") if prioridad else None
+
+    def categorizar(self, descripcion):
+        if not isinstance(descripcion, str) or self._patron is None:
+            return self.por_defecto
+        mejor = None
+        for m in self._patron.finditer(descripcion.lower()):
+            prio = self._mejor[m.group(1)]
+            if mejor is None or prio < mejor:
+                mejor = prio
+                if mejor == 0: break
+        return self.categorias[mejor] if mejor is not None else self.por_defecto
+
+    def categorizar_lote(self, descripciones):
+        """Categoriza una lista o una Serie de pandas; cada descripción distinta se evalúa una sola vez."""
+        if hasattr(descripciones, "unique") and hasattr(descripciones, "map"):  # Serie de pandas, sin importarlo
+            serie = descripciones.fillna("").astype(str)
+            return serie.map({d: self.categorizar(d) for d in serie.unique()})
+        memo = {}
+        resultado = []
+        for d in descripciones:
+            if d not in memo: memo[d] = self.categorizar(d)
+            resultado.append(memo[d])
+        return resultado
+
+def cargar_reglas(ruta):
+    # Archivo CSV "categoria,palabra" para ampliar el diccionario sin tocar el código
+    agrupadas = {cat: list(palabras) for cat, palabras in REGLAS_CATEGORIA}
+    with open(ruta, newline="", encoding="utf-8") as f:
+        for fila in csv.reader(f):
+            if len(fila) >= 2 and fila[1].strip():
+                agrupadas.setdefault(fila[0].strip(), []).append(fila[1].strip())
+    return list(agrupadas.items())
+
+@functools.lru_cache(maxsize=None)
+def get_categorizador():
+    ruta = os.environ.get("HEYSAVE_REGLAS")
+    return Categorizador(cargar_reglas(ruta) if ruta else REGLAS_CATEGORIA)
+
+def detectar_categoria(descripcion):
+    with get_instrumentacion().medir("categorizacion"):
+        return get_categorizador().categorizar(descripcion)
+
+def categorizar_lote(descripciones):
+    with get_instrumentacion().medir("categorizacion"):
+        return get_categorizador().categorizar_lote(descripciones)
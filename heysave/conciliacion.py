@@ -0,0 +1,155 @@
+"""Conciliación de saldos contra el libro de transacciones.
+
+`usuarios.saldo`, `usuarios.saldo_metas` y `metas.ahorrado` se modifican en el
+lugar. Aquí se recalculan desde el último punto de control de cada usuario
+(`checkpoints_saldo`) más las transacciones posteriores, y se informa cuánto
+difieren. Todo es una agregación por conjuntos dentro de SQLite: un solo
+recorrido de las transacciones nuevas, agrupado por usuario.
+
+Uso (p. ej. desde cron, cada noche):
+    python -m heysave.conciliacion [--checkpoint] [--reconstruir] [--desde-cero] [--limite 20]
+"""
+import argparse
+import json
+import sys
+import time
+
+from heysave.db import run_query, run_transaction
+
+# Medio céntimo: los montos se guardan como REAL
+TOLERANCIA = 0.005
+
+# Cómo mueve cada transacción los tres saldos del usuario:
+#   Ingreso / Gasto              -> saldo
+#   Abono (saldo -> meta)        -> saldo y metas
+#   Ingreso "Ahorro" (retiro)    -> metas -> saldo_metas
+#   Gasto "Transferencia"        -> sale de metas
+_EFECTOS_SQL = """
+    SUM(CASE WHEN t.tipo = 'Ingreso' AND t.categoria IS NOT 'Ahorro' THEN t.monto
+             WHEN t.tipo = 'Gasto' AND t.categoria IS NOT 'Transferencia' THEN -t.monto
+             WHEN t.tipo = 'Abono' THEN -t.monto ELSE 0 END) AS saldo,
+    SUM(CASE WHEN t.tipo = 'Ingreso' AND t.categoria = 'Ahorro' THEN t.monto ELSE 0 END) AS saldo_metas,
+    SUM(CASE WHEN t.tipo = 'Abono' THEN t.monto
+             WHEN (t.tipo = 'Ingreso' AND t.categoria = 'Ahorro') OR (t.tipo = 'Gasto' AND t.categoria = 'Transferencia') THEN -t.monto
+             ELSE 0 END) AS metas"""
+
+# Saldos reales y los que dicta el libro, una fila por usuario, partiendo de los checkpoints.
+# Solo se leen las transacciones posteriores al checkpoint más viejo: NOT INDEXED hace
+# que sea un rango sobre el rowid y no un recorrido entero de idx_transacciones_usuario.
+# Los usuarios sin checkpoint se registraron después del último y todas sus
+# transacciones caen en ese rango; las archivadas son todas anteriores (ver heysave.archivo).
+_MOVIMIENTOS_SQL = f"""
+    SELECT t.usuario_id, COUNT(*) AS n, {_EFECTOS_SQL}
+    FROM transacciones t NOT INDEXED LEFT JOIN checkpoints_saldo c ON c.usuario_id = t.usuario_id
+    WHERE t.id > (SELECT COALESCE(MIN(hasta_id), 0) FROM checkpoints_saldo) AND t.id > COALESCE(c.hasta_id, 0)
+    GROUP BY t.usuario_id"""
+# Desde cero: el libro completo, archivo incluido, desde saldo 0
+_MOVIMIENTOS_CERO_SQL = f"SELECT t.usuario_id, COUNT(*) AS n, {_EFECTOS_SQL} FROM transacciones_todas t GROUP BY t.usuario_id"
+
+def _saldos_sql(desde_cero):
+    base = "0" if desde_cero else "COALESCE(c.{0}, 0)"
+    return f"""
+    WITH movimientos AS ({_MOVIMIENTOS_CERO_SQL if desde_cero else _MOVIMIENTOS_SQL}),
+    en_metas AS (SELECT usuario_id, SUM(ahorrado) AS total FROM metas GROUP BY usuario_id)
+    SELECT u.id AS usuario_id, u.usuario, COALESCE(mv.n, 0) AS n,
+           COALESCE(u.saldo, 0) AS saldo, COALESCE(u.saldo_metas, 0) AS saldo_metas, COALESCE(em.total, 0) AS metas,
+           {base.format("saldo")} + COALESCE(mv.saldo, 0) AS libro_saldo,
+           {base.format("saldo_metas")} + COALESCE(mv.saldo_metas, 0) AS libro_saldo_metas,
+           {base.format("metas")} + COALESCE(mv.metas, 0) AS libro_metas
+    FROM usuarios u
+    LEFT JOIN checkpoints_saldo c ON c.usuario_id = u.id
+    LEFT JOIN movimientos mv ON mv.usuario_id = u.id
+    LEFT JOIN en_metas em ON em.usuario_id = u.id"""
+
+def _diferencias_sql(desde_cero):
+    return f"""
+    SELECT usuario_id, usuario, n, saldo - libro_saldo, saldo_metas - libro_saldo_metas, metas - libro_metas
+    FROM ({_saldos_sql(desde_cero)})
+    WHERE ABS(saldo - libro_saldo) > :tol OR ABS(saldo_metas - libro_saldo_metas) > :tol OR ABS(metas - libro_metas) > :tol
+    ORDER BY MAX(ABS(saldo - libro_saldo), ABS(saldo_metas - libro_saldo_metas), ABS(metas - libro_metas)) DESC"""
+
+def conciliar(desde_cero=False, limite=20):
+    """Compara los saldos guardados con los del libro.
+
+    Devuelve un dict con usuarios revisados, usuarios con diferencia, la suma de
+    las diferencias por saldo (guardado - libro), los `limite` usuarios con la
+    diferencia más grande y segundos.
+    """
+    inicio = time.perf_counter()
+    filas = run_query(_diferencias_sql(desde_cero), {"tol": TOLERANCIA}, return_data=True)
+    if filas is False:
+        return None
+    usuarios = run_query("SELECT COUNT(*) FROM usuarios", return_data=True)[0][0]
+    return {
+        "usuarios": usuarios,
+        "con_diferencia": len(filas),
+        "diferencia": {campo: round(sum(f[i] for f in filas), 2) for i, campo in enumerate(("saldo", "saldo_metas", "metas"), start=3)},
+        "mayores": [{"usuario_id": uid, "usuario": usuario, "movimientos": n,
+                     "saldo": round(d_saldo, 2), "saldo_metas": round(d_metas_ret, 2), "metas": round(d_metas, 2)}
+                    for uid, usuario, n, d_saldo, d_metas_ret, d_metas in filas[:limite]],
+        "segundos": round(time.perf_counter() - inicio, 3),
+    }
+
+def _sentencia_checkpoint(desde_cero=False, aceptar=False):
+    # Con `aceptar` se toman como buenos los saldos guardados (como en la migración);
+    # si no, los del libro, así una diferencia sigue a la vista hasta que se corrija
+    prefijo = "" if aceptar else "libro_"
+    # hasta_id es el último id asignado (no el MAX de la tabla, que baja si se archiva todo)
+    return (f"""INSERT OR REPLACE INTO checkpoints_saldo (usuario_id, hasta_id, ts, saldo, saldo_metas, metas)
+                SELECT usuario_id, COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'transacciones'), 0), :ahora,
+                       {prefijo}saldo, {prefijo}saldo_metas, {prefijo}metas
+                FROM ({_saldos_sql(desde_cero)})""",
+            {"ahora": int(time.time())})
+
+def tomar_checkpoint(desde_cero=False, aceptar=False):
+    """Guarda un punto de control para todos los usuarios en una sola transacción del escritor."""
+    return run_transaction([_sentencia_checkpoint(desde_cero, aceptar)])
+
+def reconstruir(desde_cero=False, limite=20):
+    """Reescribe `saldo` y `saldo_metas` con los valores del libro y toma un checkpoint.
+
+    Lo ahorrado en cada meta no se puede repartir desde el libro (las
+    transacciones no dicen a qué meta fueron), así que esa diferencia solo se
+    informa. Devuelve el reporte de `conciliar` previo a la corrección, con
+    `corregidos` (True/False).
+
+    Corre fuera de la app (CLI): la caché por usuario de los procesos de
+    Streamlit no se entera y sigue mostrando los saldos viejos hasta que vence
+    su TTL (5 minutos) o se reinicia la app.
+    """
+    reporte = conciliar(desde_cero, limite)
+    if reporte is None:
+        return None
+    reporte["corregidos"] = run_transaction([
+        (f"""UPDATE usuarios SET saldo = s.libro_saldo, saldo_metas = s.libro_saldo_metas
+             FROM ({_saldos_sql(desde_cero)}) s
+             WHERE usuarios.id = s.usuario_id
+               AND (ABS(s.saldo - s.libro_saldo) > :tol OR ABS(s.saldo_metas - s.libro_saldo_metas) > :tol)""", {"tol": TOLERANCIA}),
+        _sentencia_checkpoint(desde_cero),
+    ])
+    return reporte
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concilia los saldos de los usuarios con el libro de transacciones.")
+    parser.add_argument("--checkpoint", action="store_true", help="guardar un punto de control con los saldos del libro")
+    parser.add_argument("--aceptar", action="store_true", help="con --checkpoint: tomar como buenos los saldos guardados")
+    parser.add_argument("--reconstruir", action="store_true", help="reescribir saldo y saldo_metas con los del libro")
+    parser.add_argument("--desde-cero", action="store_true",
+                        help="ignorar los checkpoints y recorrer todo el libro (los saldos iniciales sin transacción se pierden)")
+    parser.add_argument("--limite", type=int, default=20, help="usuarios con mayor diferencia a listar")
+    args = parser.parse_args(argv)
+    if args.reconstruir:
+        reporte = reconstruir(args.desde_cero, args.limite)
+    else:
+        reporte = conciliar(args.desde_cero, args.limite)
+        if reporte is not None and args.checkpoint:
+            reporte["checkpoint"] = tomar_checkpoint(args.desde_cero, args.aceptar)
+    if reporte is None:
+        print(json.dumps({"error": True}))
+        return 1
+    print(json.dumps(reporte, ensure_ascii=False))
+    # Código 1 si quedaron diferencias sin corregir, para que cron avise
+    return 1 if reporte["con_diferencia"] and not reporte.get("corregidos") else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,628 @@
+"""Capa de almacenamiento: pool de conexiones, migraciones y escritor único de SQLite."""
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from heysave.instrumentacion import get_instrumentacion, logger
+
+# --- GESTIÓN DE BASE DE DATOS ---
+DB_PATH = os.environ.get("HEYSAVE_DB", "heysave.db")
+
+# Pragmas aplicados a cada conexión nueva del pool.
+# WAL deja leer mientras alguien escribe y, con synchronous=NORMAL, el commit
+# ya no hace fsync (solo los checkpoints del WAL lo hacen).
+PRAGMAS_SQLITE = [
+    # Solo tiene efecto en una base nueva (antes de crear tablas); en una existente
+    # lo activa `python -m heysave.archivo --vacuum-completo`
+    "PRAGMA auto_vacuum = INCREMENTAL",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+]
+
+class PoolSQLite:
+    """Pool de conexiones SQLite reutilizables entre reruns y sesiones.
+
+    Cada conexión se abre una sola vez con los pragmas de arriba y guarda su
+    propia caché de sentencias preparadas (`cached_statements`), así que las
+    consultas repetidas de cada rerun no se vuelven a compilar.
+    """
+
+    def __init__(self, ruta, tamano=8, sentencias_cache=256):
+        self.ruta = ruta
+        self.tamano = tamano
+        self.sentencias_cache = sentencias_cache
+        self._libres = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._creadas = 0
+        # Contadores por hilo: en Streamlit cada rerun corre entero en un hilo
+        self._local = threading.local()
+
+    def _abrir(self):
+        # isolation_level=None: autocommit, las transacciones se abren a mano
+        conn = sqlite3.connect(self.ruta, timeout=5.0, isolation_level=None,
+                               check_same_thread=False, cached_statements=self.sentencias_cache)
+        for pragma in PRAGMAS_SQLITE:
+            conn.execute(pragma)
+        return conn
+
+    def _tomar(self):
+        try:
+            return self._libres.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._creadas < self.tamano:
+                self._creadas += 1
+                crear = True
+            else:
+                crear = False
+        if not crear:
+            return self._libres.get()
+        try:
+            return self._abrir()
+        except Exception:
+            with self._lock: self._creadas -= 1
+            raise
+
+    @contextmanager
+    def conexion(self):
+        conn = self._tomar()
+        self._local.accesos = getattr(self._local, "accesos", 0) + 1
+        try:
+            yield conn
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e) or "busy" in str(e):
+                self._local.bloqueos = getattr(self._local, "bloqueos", 0) + 1
+            raise
+        finally:
+            # Nunca devolvemos al pool una conexión con una transacción a medias
+            if conn.in_transaction:
+                conn.rollback()
+            self._libres.put(conn)
+
+    def sumar_escritura(self, conteo):
+        # Lo que el escritor hizo por una operación de este hilo (ver EscritorSQLite._bucle)
+        local = self._local
+        local.escrituras = getattr(local, "escrituras", 0) + conteo["sentencias"]
+        local.bloqueos = getattr(local, "bloqueos", 0) + conteo["bloqueos"]
+        local.rechazadas = getattr(local, "rechazadas", 0) + conteo["rechazada"]
+
+    def conteo_hilo(self, reiniciar=False):
+        """Consultas y errores de bloqueo del hilo actual desde el último reinicio.
+
+        Incluye lo que el escritor ejecutó para las operaciones que este hilo
+        esperó con `run_transaction`: sus sentencias (también en `escrituras`),
+        sus reintentos por BUSY (en `errores_bloqueo`) y si la cola la rechazó.
+        """
+        lecturas, escrituras = getattr(self._local, "accesos", 0), getattr(self._local, "escrituras", 0)
+        conteo = {"consultas": lecturas + escrituras, "escrituras": escrituras,
+                  "errores_bloqueo": getattr(self._local, "bloqueos", 0), "rechazadas": getattr(self._local, "rechazadas", 0)}
+        if reiniciar:
+            self._local.accesos = self._local.escrituras = self._local.bloqueos = self._local.rechazadas = 0
+        return conteo
+
+    def cerrar(self):
+        while True:
+            try: self._libres.get_nowait().close()
+            except queue.Empty: break
+        with self._lock: self._creadas = 0
+
+# --- MIGRACIONES DE ESQUEMA ---
+# Cada migración se aplica una sola vez y deja su número en PRAGMA user_version.
+# Para cambiar el esquema se agrega una migración nueva al final, nunca se edita una vieja.
+def _migracion_esquema_base(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS usuarios (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, usuario TEXT UNIQUE, password TEXT,
+                    nombre TEXT, dni TEXT, banco TEXT, saldo REAL DEFAULT 0, 
+                    saldo_metas REAL DEFAULT 0, puntos INTEGER DEFAULT 0,
+                    foto BLOB,
+                    pais TEXT, direccion TEXT, postal TEXT)''')
+
+    # Bases creadas con versiones viejas de la app no tienen estas columnas
+    existentes = {fila[1] for fila in conn.execute("PRAGMA table_info(usuarios)")}
+    columnas_nuevas = {"foto": "BLOB", "saldo_metas": "REAL DEFAULT 0", "pais": "TEXT", "direccion": "TEXT", "postal": "TEXT"}
+    for col, tipo in columnas_nuevas.items():
+        if col not in existentes:
+            conn.execute(f"ALTER TABLE usuarios ADD COLUMN {col} {tipo}")
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS transacciones (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, usuario_id INTEGER, fecha TEXT,
+                    descripcion TEXT, categoria TEXT, monto REAL, tipo TEXT,
+                    FOREIGN KEY(usuario_id) REFERENCES usuarios(id))''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS metas (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, usuario_id INTEGER, nombre TEXT,
+                    objetivo REAL, ahorrado REAL DEFAULT 0,
+                    FOREIGN KEY(usuario_id) REFERENCES usuarios(id))''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS premios_canjeados (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, usuario_id INTEGER, premio TEXT,
+                    codigo TEXT, fecha TEXT,
+                    FOREIGN KEY(usuario_id) REFERENCES usuarios(id))''')
+
+# `fecha` se guarda como "%d/%m" (sin año): se asume el año actual, o el anterior
+# si ese mes todavía no llegó este año.
+MES_DE_FECHA_SQL = """(CASE WHEN substr({col}, 4, 2) > strftime('%m', 'now', 'localtime')
+    THEN CAST(strftime('%Y', 'now', 'localtime') AS INTEGER) - 1
+    ELSE strftime('%Y', 'now', 'localtime') END || '-' || substr({col}, 4, 2))"""
+MES_DE_TS_SQL = "strftime('%Y-%m', {col}, 'unixepoch', 'localtime')"
+
+# Gastos de los agregados: sin las transferencias de metas (Gasto "Transferencia"), que
+# salen de lo ahorrado y no del saldo
+_ES_GASTO_SQL = "({p}tipo = 'Gasto' AND {p}categoria IS NOT 'Transferencia')"
+TRIGGER_GASTOS_CATEGORIA_MES = f'''CREATE TRIGGER IF NOT EXISTS trg_gastos_categoria_mes AFTER INSERT ON transacciones
+    WHEN {_ES_GASTO_SQL.format(p="NEW.")}
+    BEGIN
+        INSERT INTO gastos_categoria_mes (usuario_id, mes, categoria, total, cantidad)
+        VALUES (NEW.usuario_id, {MES_DE_TS_SQL.format(col="COALESCE(NEW.ts, strftime('%s', 'now'))")}, NEW.categoria, NEW.monto, 1)
+        ON CONFLICT(usuario_id, mes, categoria) DO UPDATE SET total = total + excluded.total, cantidad = cantidad + 1;
+    END'''
+RELLENAR_GASTOS_CATEGORIA_MES = f'''INSERT INTO gastos_categoria_mes (usuario_id, mes, categoria, total, cantidad)
+    SELECT usuario_id, {MES_DE_TS_SQL.format(col="ts")}, categoria, SUM(monto), COUNT(*)
+    FROM {{tabla}} WHERE {_ES_GASTO_SQL.format(p="")} GROUP BY 1, 2, 3'''
+
+def _migracion_timestamp_transacciones(conn):
+    # `ts` (epoch, segundos) hace ordenable y filtrable la fecha; `fecha` queda solo para mostrar
+    conn.execute("ALTER TABLE transacciones ADD COLUMN ts INTEGER")
+    conn.execute(f"""UPDATE transacciones SET ts = COALESCE(
+                        CAST(strftime('%s', {MES_DE_FECHA_SQL.format(col="fecha")} || '-' || substr(fecha, 1, 2), 'utc') AS INTEGER), 0)""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transacciones_usuario_ts ON transacciones(usuario_id, ts, id)")
+    # Red de seguridad para INSERTs que no traigan ts
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_transacciones_ts AFTER INSERT ON transacciones
+                    WHEN NEW.ts IS NULL
+                    BEGIN
+                        UPDATE transacciones SET ts = CAST(strftime('%s', 'now') AS INTEGER) WHERE id = NEW.id;
+                    END''')
+    # Los agregados pasan a usar el mes real de ts y se recalculan desde cero
+    conn.execute("DROP TRIGGER IF EXISTS trg_gastos_categoria_mes")
+    conn.execute(TRIGGER_GASTOS_CATEGORIA_MES)
+    conn.execute("DELETE FROM gastos_categoria_mes")
+    conn.execute(RELLENAR_GASTOS_CATEGORIA_MES.format(tabla="transacciones"))
+
+def _migracion_fotos(conn):
+    from heysave.fotos import _miniatura  # fotos depende de db: import diferido
+    # Las fotos salen de la fila de usuarios a un almacén direccionado por contenido
+    conn.execute('''CREATE TABLE IF NOT EXISTS fotos (
+                    hash TEXT PRIMARY KEY, original BLOB, miniatura BLOB, creada INTEGER)''')
+    conn.execute("ALTER TABLE usuarios ADD COLUMN foto_hash TEXT")
+    for user_id, foto in conn.execute("SELECT id, foto FROM usuarios WHERE foto IS NOT NULL").fetchall():
+        foto_hash = hashlib.sha256(foto).hexdigest()
+        conn.execute("INSERT OR IGNORE INTO fotos (hash, original, miniatura, creada) VALUES (?, ?, ?, ?)",
+                     (foto_hash, foto, _miniatura(foto), int(time.time())))
+        conn.execute("UPDATE usuarios SET foto_hash = ?, foto = NULL WHERE id = ?", (foto_hash, user_id))
+
+def _migracion_premios(conn):
+    # Catálogo con stock y un pool de códigos únicos pregenerados por premio
+    from heysave.premios import PREMIOS_INICIALES, STOCK_INICIAL, generar_codigos
+    conn.execute('''CREATE TABLE IF NOT EXISTS premios (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT UNIQUE, icono TEXT,
+                    costo INTEGER, prefijo TEXT, stock INTEGER DEFAULT 0, activo INTEGER DEFAULT 1)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS codigos_premio (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, premio_id INTEGER, codigo TEXT UNIQUE, token TEXT,
+                    FOREIGN KEY(premio_id) REFERENCES premios(id))''')
+    # Índices parciales: los códigos libres (token NULL) por premio, y los ya tomados por token
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_codigos_libres ON codigos_premio(premio_id) WHERE token IS NULL")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_codigos_token ON codigos_premio(token) WHERE token IS NOT NULL")
+    for icono, nombre, costo, prefijo in PREMIOS_INICIALES:
+        conn.execute("INSERT OR IGNORE INTO premios (nombre, icono, costo, prefijo) VALUES (?, ?, ?, ?)", (nombre, icono, costo, prefijo))
+        premio_id = conn.execute("SELECT id FROM premios WHERE nombre = ?", (nombre,)).fetchone()[0]
+        conn.executemany("INSERT OR IGNORE INTO codigos_premio (premio_id, codigo) VALUES (?, ?)",
+                         [(premio_id, codigo) for codigo in generar_codigos(prefijo, STOCK_INICIAL)])
+    conn.execute("UPDATE premios SET stock = (SELECT COUNT(*) FROM codigos_premio WHERE premio_id = premios.id AND token IS NULL)")
+
+def _migracion_busqueda(conn):
+    # Índice FTS5 de descripción y categoría sobre la caliente y el archivo (external content:
+    # el texto no se duplica). usuario_id va como columna indexada para filtrar con `usuario_id : "N"`.
+    try:
+        conn.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS transacciones_fts USING fts5(
+                        descripcion, categoria, usuario_id, content='transacciones_todas', content_rowid='id',
+                        tokenize='unicode61 remove_diacritics 2', prefix='2 3')''')
+    except sqlite3.OperationalError as e:
+        # SQLite sin FTS5: la búsqueda cae a LIKE (ver heysave.finanzas.buscar_movimientos)
+        logger.warning("Sin índice de búsqueda: %s", e)
+        return
+    # Relevancia: la descripción pesa más que la categoría; usuario_id no cuenta
+    conn.execute("INSERT INTO transacciones_fts(transacciones_fts, rank) VALUES ('rank', 'bm25(10.0, 2.0, 0.0)')")
+    conn.execute("INSERT INTO transacciones_fts(transacciones_fts) VALUES ('rebuild')")
+    borrar = ("INSERT INTO transacciones_fts(transacciones_fts, rowid, descripcion, categoria, usuario_id) "
+              "VALUES ('delete', OLD.id, OLD.descripcion, OLD.categoria, OLD.usuario_id);")
+    insertar = ("INSERT INTO transacciones_fts(rowid, descripcion, categoria, usuario_id) "
+                "VALUES (NEW.id, NEW.descripcion, NEW.categoria, NEW.usuario_id);")
+    for tabla, otra in (("transacciones", "transacciones_archivo"), ("transacciones_archivo", "transacciones")):
+        # Archivar inserta en el archivo y borra de la caliente: mientras la fila siga en
+        # alguna de las dos, su entrada del índice se queda
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{tabla}_fts_borrar AFTER DELETE ON {tabla}
+                        WHEN NOT EXISTS (SELECT 1 FROM {otra} WHERE id = OLD.id)
+                        BEGIN {borrar} END''')
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{tabla}_fts_editar AFTER UPDATE OF descripcion, categoria, usuario_id ON {tabla}
+                        BEGIN {borrar} {insertar} END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_transacciones_fts_insertar AFTER INSERT ON transacciones
+                    BEGIN {insertar} END''')
+
+# Ingresos del resumen mensual: sin los retiros de metas (Ingreso "Ahorro"), que solo
+# devuelven al saldo lo que ya se había ahorrado
+_ES_INGRESO_SQL = "({p}tipo = 'Ingreso' AND {p}categoria IS NOT 'Ahorro')"
+TRIGGER_RESUMEN_MENSUAL = f'''CREATE TRIGGER IF NOT EXISTS trg_resumen_mensual AFTER INSERT ON transacciones
+    WHEN {_ES_GASTO_SQL.format(p="NEW.")} OR {_ES_INGRESO_SQL.format(p="NEW.")}
+    BEGIN
+        INSERT INTO resumen_mensual (usuario_id, mes, ingresos, gastos, n_ingresos, n_gastos)
+        VALUES (NEW.usuario_id, {MES_DE_TS_SQL.format(col="COALESCE(NEW.ts, strftime('%s', 'now'))")},
+                CASE WHEN NEW.tipo = 'Ingreso' THEN NEW.monto ELSE 0 END,
+                CASE WHEN NEW.tipo = 'Gasto' THEN NEW.monto ELSE 0 END,
+                NEW.tipo = 'Ingreso', NEW.tipo = 'Gasto')
+        ON CONFLICT(usuario_id, mes) DO UPDATE SET
+            ingresos = ingresos + excluded.ingresos, gastos = gastos + excluded.gastos,
+            n_ingresos = n_ingresos + excluded.n_ingresos, n_gastos = n_gastos + excluded.n_gastos;
+    END'''
+RELLENAR_RESUMEN_MENSUAL = f'''INSERT OR REPLACE INTO resumen_mensual (usuario_id, mes, ingresos, gastos, n_ingresos, n_gastos)
+    SELECT usuario_id, {MES_DE_TS_SQL.format(col="ts")},
+           SUM(CASE WHEN tipo = 'Ingreso' THEN monto ELSE 0 END), SUM(CASE WHEN tipo = 'Gasto' THEN monto ELSE 0 END),
+           SUM(tipo = 'Ingreso'), SUM(tipo = 'Gasto')
+    FROM {{tabla}} WHERE {_ES_GASTO_SQL.format(p="")} OR {_ES_INGRESO_SQL.format(p="")} GROUP BY 1, 2'''
+
+MIGRACIONES = [
+    (1, _migracion_esquema_base),
+    # Índices para las consultas de cada rerun:
+    # historial (ORDER BY id DESC LIMIT 10), tips (cubre tipo + categoria), metas y canjes
+    (2, [
+        "CREATE INDEX IF NOT EXISTS idx_transacciones_usuario ON transacciones(usuario_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_transacciones_usuario_tipo ON transacciones(usuario_id, tipo, categoria)",
+        "CREATE INDEX IF NOT EXISTS idx_metas_usuario ON metas(usuario_id)",
+        "CREATE INDEX IF NOT EXISTS idx_premios_canjeados_usuario ON premios_canjeados(usuario_id, id)",
+    ]),
+    # Agregados de gasto por usuario/mes/categoría, mantenidos por trigger en cada INSERT
+    (3, [
+        '''CREATE TABLE IF NOT EXISTS gastos_categoria_mes (
+                usuario_id INTEGER, mes TEXT, categoria TEXT, total REAL DEFAULT 0, cantidad INTEGER DEFAULT 0,
+                PRIMARY KEY (usuario_id, mes, categoria)) WITHOUT ROWID''',
+        f'''CREATE TRIGGER IF NOT EXISTS trg_gastos_categoria_mes AFTER INSERT ON transacciones
+            WHEN NEW.tipo = 'Gasto'
+            BEGIN
+                INSERT INTO gastos_categoria_mes (usuario_id, mes, categoria, total, cantidad)
+                VALUES (NEW.usuario_id, {MES_DE_FECHA_SQL.format(col="NEW.fecha")}, NEW.categoria, NEW.monto, 1)
+                ON CONFLICT(usuario_id, mes, categoria) DO UPDATE SET total = total + excluded.total, cantidad = cantidad + 1;
+            END''',
+        f'''INSERT OR REPLACE INTO gastos_categoria_mes (usuario_id, mes, categoria, total, cantidad)
+            SELECT usuario_id, {MES_DE_FECHA_SQL.format(col="fecha")}, categoria, SUM(monto), COUNT(*)
+            FROM transacciones WHERE tipo = 'Gasto' GROUP BY 1, 2, 3''',
+    ]),
+    (4, _migracion_timestamp_transacciones),
+    (5, _migracion_fotos),
+    # Resumen mensual materializado (ingresos/gastos por usuario y mes), mismo esquema de trigger
+    (6, [
+        '''CREATE TABLE IF NOT EXISTS resumen_mensual (
+                usuario_id INTEGER, mes TEXT, ingresos REAL DEFAULT 0, gastos REAL DEFAULT 0,
+                n_ingresos INTEGER DEFAULT 0, n_gastos INTEGER DEFAULT 0,
+                PRIMARY KEY (usuario_id, mes)) WITHOUT ROWID''',
+        TRIGGER_RESUMEN_MENSUAL,
+        RELLENAR_RESUMEN_MENSUAL.format(tabla="transacciones"),
+    ]),
+    (7, _migracion_premios),
+    # Reglas de ahorro automático hacia metas; las ejecuta `python -m heysave.programador`
+    (8, [
+        '''CREATE TABLE IF NOT EXISTS reglas_ahorro (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, usuario_id INTEGER, meta_id INTEGER, monto REAL,
+                frecuencia TEXT CHECK (frecuencia IN ('diaria', 'semanal', 'mensual')), dia INTEGER,
+                proxima INTEGER, activa INTEGER DEFAULT 1, ultima_ejecucion INTEGER, ultimo_resultado TEXT,
+                FOREIGN KEY(usuario_id) REFERENCES usuarios(id), FOREIGN KEY(meta_id) REFERENCES metas(id))''',
+        # Solo las activas, en el orden en que el programador las toma
+        "CREATE INDEX IF NOT EXISTS idx_reglas_pendientes ON reglas_ahorro(proxima, id) WHERE activa = 1",
+        "CREATE INDEX IF NOT EXISTS idx_reglas_usuario ON reglas_ahorro(usuario_id)",
+    ]),
+    # Último punto de control de saldos por usuario: los saldos que corresponden al libro
+    # hasta la transacción `hasta_id`; `heysave.conciliacion` parte de aquí.
+    # El primero son los saldos actuales (lo anterior no siempre dejó rastro en transacciones).
+    (9, [
+        '''CREATE TABLE IF NOT EXISTS checkpoints_saldo (
+                usuario_id INTEGER PRIMARY KEY, hasta_id INTEGER, ts INTEGER,
+                saldo REAL, saldo_metas REAL, metas REAL,
+                FOREIGN KEY(usuario_id) REFERENCES usuarios(id))''',
+        '''INSERT OR REPLACE INTO checkpoints_saldo (usuario_id, hasta_id, ts, saldo, saldo_metas, metas)
+            SELECT u.id, (SELECT COALESCE(MAX(id), 0) FROM transacciones), CAST(strftime('%s', 'now') AS INTEGER),
+                   COALESCE(u.saldo, 0), COALESCE(u.saldo_metas, 0), COALESCE(m.total, 0)
+            FROM usuarios u LEFT JOIN (SELECT usuario_id, SUM(ahorrado) AS total FROM metas GROUP BY usuario_id) m ON m.usuario_id = u.id''',
+    ]),
+    # Archivo de transacciones viejas (las mueve `python -m heysave.archivo`). Conserva los ids;
+    # sin triggers, así los agregados mensuales no cambian al mover filas
+    (10, [
+        '''CREATE TABLE IF NOT EXISTS transacciones_archivo (
+                id INTEGER PRIMARY KEY, usuario_id INTEGER, fecha TEXT, descripcion TEXT,
+                categoria TEXT, monto REAL, tipo TEXT, ts INTEGER,
+                FOREIGN KEY(usuario_id) REFERENCES usuarios(id))''',
+        "CREATE INDEX IF NOT EXISTS idx_transacciones_archivo_usuario_ts ON transacciones_archivo(usuario_id, ts, id)",
+        '''CREATE VIEW IF NOT EXISTS transacciones_todas AS
+            SELECT id, usuario_id, fecha, descripcion, categoria, monto, tipo, ts FROM transacciones
+            UNION ALL
+            SELECT id, usuario_id, fecha, descripcion, categoria, monto, tipo, ts FROM transacciones_archivo''',
+    ]),
+    (11, _migracion_busqueda),
+    # Sesiones de login (ver heysave.autenticacion): solo el SHA-256 del id del token, nunca el token.
+    # El secreto que firma los tokens se genera aquí, uno por base, salvo que se fije HEYSAVE_SECRETO
+    (12, [
+        '''CREATE TABLE IF NOT EXISTS sesiones (
+                token_hash TEXT PRIMARY KEY, usuario_id INTEGER, creada INTEGER, expira INTEGER,
+                FOREIGN KEY(usuario_id) REFERENCES usuarios(id)) WITHOUT ROWID''',
+        "CREATE INDEX IF NOT EXISTS idx_sesiones_usuario ON sesiones(usuario_id, expira)",
+        "CREATE TABLE IF NOT EXISTS ajustes (clave TEXT PRIMARY KEY, valor TEXT)",
+        "INSERT OR IGNORE INTO ajustes (clave, valor) VALUES ('secreto_sesiones', lower(hex(randomblob(32))))",
+    ]),
+    # El resumen mensual contaba los retiros de metas como ingresos: trigger nuevo y se
+    # recalcula todo desde el libro completo (el archivo no tiene trigger, pero sus filas cuentan)
+    (13, [
+        "DROP TRIGGER IF EXISTS trg_resumen_mensual",
+        TRIGGER_RESUMEN_MENSUAL,
+        "DELETE FROM resumen_mensual",
+        RELLENAR_RESUMEN_MENSUAL.format(tabla="transacciones_todas"),
+    ]),
+    # Igual con las transferencias de metas, que contaban como gasto en los dos agregados
+    (14, [
+        "DROP TRIGGER IF EXISTS trg_resumen_mensual",
+        TRIGGER_RESUMEN_MENSUAL,
+        "DELETE FROM resumen_mensual",
+        RELLENAR_RESUMEN_MENSUAL.format(tabla="transacciones_todas"),
+        "DROP TRIGGER IF EXISTS trg_gastos_categoria_mes",
+        TRIGGER_GASTOS_CATEGORIA_MES,
+        "DELETE FROM gastos_categoria_mes",
+        RELLENAR_GASTOS_CATEGORIA_MES.format(tabla="transacciones_todas"),
+    ]),
+]
+
+def init_db(conn):
+    """Lleva la base a la última versión de MIGRACIONES (cada paso en su propia transacción)."""
+    for version, migracion in MIGRACIONES:
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Otro proceso pudo haber migrado mientras esperábamos el lock
+            if conn.execute("PRAGMA user_version").fetchone()[0] < version:
+                if callable(migracion):
+                    migracion(conn)
+                else:
+                    for sentencia in migracion:
+                        conn.execute(sentencia)
+                conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+# Un único pool y un único escritor por proceso. lru_cache no serializa la primera
+# llamada: varias sesiones que arrancan a la vez crearían cada una su escritor.
+# Reentrante porque get_escritor llama a get_pool con el lock tomado.
+_lock_inicio = threading.RLock()
+_unicos = {}
+
+def _unico(nombre, crear):
+    instancia = _unicos.get(nombre)
+    if instancia is None:
+        with _lock_inicio:
+            instancia = _unicos.get(nombre)
+            if instancia is None:
+                instancia = _unicos[nombre] = crear()
+    return instancia
+
+def _crear_pool():
+    pool = PoolSQLite(DB_PATH)
+    with pool.conexion() as conn:
+        init_db(conn)
+    return pool
+
+def get_pool():
+    # El paquete se importa una vez, no en cada rerun: las migraciones corren una sola vez por proceso
+    return _unico("pool", _crear_pool)
+
+# --- ESCRITOR ÚNICO (GROUP COMMIT) ---
+def _es_bloqueo(error):
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in str(error) or "busy" in str(error))
+
+def _es_masiva(sentencias):
+    return any(isinstance(sentencia[1], list) for sentencia in sentencias)
+
+class EscritorSQLite:
+    """Hilo único que hace todas las escrituras de la app, en commits agrupados.
+
+    Las sesiones encolan operaciones (listas de sentencias, como las de
+    `run_transaction`) y reciben un Future con True/False y, en `futuro.conteo`,
+    las sentencias ejecutadas y los BUSY que sufrió la operación. El hilo junta lo que
+    haya en la cola en una sola transacción y cada operación corre en su propio
+    SAVEPOINT: si falla o no cumple `minimo_filas` se deshace solo ella. Así
+    nadie compite por el lock de escritura y un commit cubre muchas operaciones;
+    las lecturas siguen yendo al pool en paralelo (WAL).
+    """
+
+    def __init__(self, conn, instrumentacion, max_pendientes=1000, max_lote=64, reintentos=5):
+        self._conn = conn
+        self._inst = instrumentacion
+        self._cola = queue.Queue(maxsize=max_pendientes)
+        self.max_lote = max_lote
+        self.reintentos = reintentos
+        self.estadisticas = {"operaciones": 0, "fallidas": 0, "grupos": 0, "reintentos": 0, "rechazadas": 0}
+        self._hilo = threading.Thread(target=self._bucle, name="heysave-escritor", daemon=True)
+        self._hilo.start()
+
+    def enviar(self, sentencias, espera=10.0):
+        """Encola una operación; si la cola sigue llena tras `espera` segundos se rechaza (False)."""
+        futuro = Future()
+        try:
+            self._cola.put((list(sentencias), futuro), timeout=espera)
+        except queue.Full:
+            # Contrapresión: mejor un error visible que una cola sin límite
+            self.estadisticas["rechazadas"] += 1
+            logger.warning("Cola de escritura llena (%d pendientes): operación rechazada", self._cola.qsize())
+            futuro.conteo = {"sentencias": 0, "bloqueos": 0, "rechazada": 1}
+            futuro.set_result(False)
+        return futuro
+
+    def pendientes(self):
+        return self._cola.qsize()
+
+    def _bucle(self):
+        retenidas = deque()
+        seguir = True
+        while seguir:
+            primera = retenidas.popleft() if retenidas else self._cola.get()
+            if primera is None:
+                break
+            lote = [primera]
+            # Las operaciones masivas (executemany, p. ej. la importación CSV) van solas:
+            # dentro de un SAVEPOINT SQLite las escribe bastante más lento
+            while len(lote) < self.max_lote and not _es_masiva(primera[0]):
+                try:
+                    op = self._cola.get_nowait()
+                except queue.Empty:
+                    break
+                if op is None:
+                    seguir = False
+                    break
+                if _es_masiva(op[0]):
+                    retenidas.append(op)
+                    break
+                lote.append(op)
+            resultados = [False] * len(lote)
+            conteos = [{"sentencias": 0, "bloqueos": 0, "rechazada": 0} for _ in lote]
+            try:
+                resultados = self._confirmar([sentencias for sentencias, _ in lote], conteos)
+            except Exception as e:
+                logger.exception("Error inesperado en el escritor: %s", e)
+            finally:
+                for (_, futuro), ok, conteo in zip(lote, resultados, conteos):
+                    # Antes de set_result: quien espera el Future ya lo encuentra puesto
+                    futuro.conteo = conteo
+                    futuro.set_result(ok)
+        self._conn.close()
+
+    def _confirmar(self, operaciones, conteos):
+        conn = self._conn
+        # Una operación sola no necesita SAVEPOINT: si falla se deshace la transacción entera
+        aislada = len(operaciones) == 1
+        for intento in range(self.reintentos + 1):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                resultados = [self._aplicar(sentencias, conteo, savepoint=not aislada) for sentencias, conteo in zip(operaciones, conteos)]
+                if aislada and not resultados[0]:
+                    conn.rollback()
+                else:
+                    conn.execute("COMMIT")
+                self.estadisticas["grupos"] += 1
+                self.estadisticas["operaciones"] += len(operaciones)
+                self.estadisticas["fallidas"] += resultados.count(False)
+                return resultados
+            except sqlite3.Error as e:
+                if conn.in_transaction:
+                    conn.rollback()
+                # SQLITE_BUSY (otro proceso escribiendo más allá del busy_timeout): se reintenta el grupo entero
+                if _es_bloqueo(e):
+                    for conteo in conteos:
+                        conteo["bloqueos"] += 1
+                if _es_bloqueo(e) and intento < self.reintentos:
+                    self.estadisticas["reintentos"] += 1
+                    time.sleep(min(0.05 * 2 ** intento, 1.0))
+                    continue
+                self._inst.registrar_error("COMMIT", e)
+                self.estadisticas["fallidas"] += len(operaciones)
+                return [False] * len(operaciones)
+
+    def _aplicar(self, sentencias, conteo, savepoint=True):
+        conn, inst = self._conn, self._inst
+        query = "SAVEPOINT operacion"
+        if savepoint:
+            conn.execute(query)
+        try:
+            for sentencia in sentencias:
+                query, params = sentencia[0], sentencia[1]
+                minimo_filas = sentencia[2] if len(sentencia) > 2 else 0
+                inicio = time.perf_counter() if inst.activa else None
+                conteo["sentencias"] += 1
+                if isinstance(params, list):
+                    c = conn.executemany(query, params)
+                else:
+                    c = conn.execute(query, params)
+                if inicio is not None:
+                    inst.registrar(query, (time.perf_counter() - inicio) * 1000, conn, params)
+                if minimo_filas and c.rowcount < minimo_filas:
+                    break
+            else:
+                if savepoint:
+                    conn.execute("RELEASE operacion")
+                return True
+        except sqlite3.Error as e:
+            if _es_bloqueo(e):
+                raise
+            inst.registrar_error(query, e)
+        if savepoint:
+            conn.execute("ROLLBACK TO operacion")
+            conn.execute("RELEASE operacion")
+        return False
+
+    def cerrar(self):
+        self._cola.put(None)
+        self._hilo.join()
+
+def get_escritor():
+    # get_pool() migra antes de aceptar escrituras
+    return _unico("escritor", lambda: EscritorSQLite(get_pool()._abrir(), get_instrumentacion()))
+
+def run_query(query, params=(), return_data=False):
+    # Misma API de siempre: las lecturas van al pool y las escrituras al escritor único
+    if not return_data:
+        return run_transaction([(query, params)])
+    inst = get_instrumentacion()
+    inicio = time.perf_counter() if inst.activa else None
+    try:
+        with get_pool().conexion() as conn:
+            resultado = conn.execute(query, params).fetchall()
+            if inicio is not None:
+                inst.registrar(query, (time.perf_counter() - inicio) * 1000, conn, params)
+            return resultado
+    except Exception as e:
+        inst.registrar_error(query, e)
+        return False
+
+def enviar_transaccion(sentencias):
+    """Como `run_transaction`, pero sin esperar: devuelve el Future del escritor."""
+    return get_escritor().enviar(sentencias)
+
+def run_transaction(sentencias):
+    """Ejecuta varias sentencias como una sola operación atómica.
+
+    `sentencias` es una lista de tuplas `(query, params)` o `(query, params, minimo_filas)`;
+    si `params` es una lista de tuplas se ejecuta con `executemany`. Si alguna falla, o modifica menos filas que `minimo_filas` (p. ej. un
+    `UPDATE ... WHERE saldo >= ?` que no encontró saldo), se deshace todo y se
+    devuelve False. La escritura la hace el escritor único; aquí solo se espera su resultado
+    y se suma a los contadores de este hilo lo que costó (ver `PoolSQLite.conteo_hilo`).
+    """
+    with get_instrumentacion().medir("db"):
+        futuro = enviar_transaccion(sentencias)
+        ok = futuro.result()
+    get_pool().sumar_escritura(futuro.conteo)
+    return ok
+
+class Transaccion:
+    """Acumula las sentencias de una operación de negocio para `transaccion()`."""
+
+    def __init__(self):
+        self.sentencias = []
+        self.ok = None
+
+    def ejecutar(self, query, params=(), minimo_filas=0):
+        self.sentencias.append((query, params, minimo_filas))
+
+@contextmanager
+def transaccion():
+    # Uso:
+    #   with transaccion() as tx:
+    #       tx.ejecutar("UPDATE ...", (...), minimo_filas=1)
+    #       tx.ejecutar("INSERT ...", (...))
+    #   if tx.ok: ...
+    tx = Transaccion()
+    yield tx
+    tx.ok = run_transaction(tx.sentencias)
@@ -0,0 +1,172 @@
+"""Lógica de dominio: historial y búsqueda, análisis mensual, tips y niveles."""
+import datetime
+import functools
+import re
+import time
+
+from heysave.cache import get_cache
+from heysave.db import get_pool, run_query
+from heysave.instrumentacion import get_instrumentacion
+
+# --- HISTORIAL DE MOVIMIENTOS ---
+@functools.lru_cache(maxsize=4096)
+def ts_de_fecha(fecha):
+    # Epoch (hora local) del inicio del día: el formato de la columna `ts`
+    return int(time.mktime(fecha.timetuple()))
+
+def historial_pagina(user_id, cursor=None, desde=None, hasta=None, limite=10):
+    """Una página del historial, de la más reciente a la más antigua (keyset pagination).
+
+    `cursor` es el `(ts, id)` de la última fila de la página anterior; con el
+    índice (usuario_id, ts, id) cada página cuesta lo mismo sin importar cuántos
+    movimientos tenga el usuario. `desde`/`hasta` son fechas (`datetime.date`), ambas incluidas.
+    Cada página lee la tabla caliente y `transacciones_archivo` con el mismo cursor y
+    las mezcla por (ts, id): una importación puede dejar en la caliente filas más
+    viejas que las archivadas. Cada lado es un rango de su índice con su propio LIMIT.
+    Devuelve `(filas, siguiente_cursor)`; el cursor es None si no hay más. Si la
+    lectura falla devuelve False, como `run_query` (y la caché no lo guarda).
+    """
+    condiciones = "usuario_id = ?"
+    params = [user_id]
+    if desde:
+        condiciones += " AND ts >= ?"; params.append(ts_de_fecha(desde))
+    if hasta:
+        condiciones += " AND ts < ?"; params.append(ts_de_fecha(hasta + datetime.timedelta(days=1)))
+    if cursor:
+        condiciones += " AND (ts, id) < (?, ?)"; params.extend(cursor)
+    params.append(limite + 1)
+    pagina = "SELECT * FROM (SELECT id, ts, fecha, descripcion, categoria, tipo, monto FROM {} WHERE " + condiciones + " ORDER BY ts DESC, id DESC LIMIT ?)"
+    filas = run_query(f"{pagina.format('transacciones')} UNION ALL {pagina.format('transacciones_archivo')} ORDER BY 2 DESC, 1 DESC LIMIT ?",
+                      tuple(params * 2 + [limite + 1]), return_data=True)
+    if filas is False:
+        return False
+    if len(filas) > limite:
+        filas = filas[:limite]
+        return filas, (filas[-1][1], filas[-1][0])
+    return filas, None
+
+# --- BÚSQUEDA DE MOVIMIENTOS ---
+_PALABRA = re.compile(r"\w+")
+_COLUMNAS_HISTORIAL = "t.id, t.ts, t.fecha, t.descripcion, t.categoria, t.tipo, t.monto"
+
+@functools.lru_cache(maxsize=None)
+def _hay_indice_busqueda():
+    # La migración no crea el índice si este SQLite no trae FTS5
+    return bool(run_query("SELECT 1 FROM sqlite_master WHERE name = 'transacciones_fts'", return_data=True))
+
+def _consulta_fts(user_id, texto):
+    """Expresión MATCH de FTS5: cada palabra como prefijo (AND), solo en las filas del usuario."""
+    palabras = _PALABRA.findall(texto)
+    if not palabras:
+        return None
+    # Entre comillas cada palabra es literal: AND, OR, NEAR, * o ":" escritos por el usuario no son operadores
+    terminos = " ".join(f'"{p}"*' for p in palabras)
+    return f'usuario_id : "{int(user_id)}" AND {{descripcion categoria}} : ({terminos})'
+
+def buscar_movimientos(user_id, texto, limite=20):
+    """Movimientos del usuario (caliente y archivo) que coinciden con `texto`, los más relevantes primero.
+
+    Con el índice FTS5 la búsqueda es por prefijo de palabra, sin tildes ni
+    mayúsculas y ordenada por bm25; solo después se leen las `limite` filas
+    elegidas, por id. Sin FTS5 cae a un LIKE sobre las filas del usuario.
+    Devuelve filas con la misma forma que `historial_pagina`, o False si la lectura falla.
+    """
+    consulta = _consulta_fts(user_id, texto)
+    if consulta is None:
+        return []
+    if not _hay_indice_busqueda():
+        patron = "%" + texto.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return run_query(f"""SELECT {_COLUMNAS_HISTORIAL} FROM transacciones_todas t
+                             WHERE t.usuario_id = ? AND (t.descripcion LIKE ? ESCAPE '\\' OR t.categoria LIKE ? ESCAPE '\\')
+                             ORDER BY t.ts DESC, t.id DESC LIMIT ?""", (user_id, patron, patron, limite), return_data=True)
+    # Primero los ids y su rank (sin tocar las tablas), después cada tabla por su clave:
+    # un JOIN directo contra la vista transacciones_todas la materializaría entera
+    filas = run_query(f"""WITH elegidas AS (
+                              SELECT rowid AS id, rank FROM transacciones_fts WHERE transacciones_fts MATCH :consulta
+                              ORDER BY rank, rowid DESC LIMIT :limite)
+                          SELECT {_COLUMNAS_HISTORIAL}, e.rank FROM elegidas e JOIN transacciones t ON t.id = e.id
+                          UNION ALL
+                          SELECT {_COLUMNAS_HISTORIAL}, e.rank FROM elegidas e JOIN transacciones_archivo t ON t.id = e.id
+                          ORDER BY 8, 1 DESC""", {"consulta": consulta, "limite": limite}, return_data=True)
+    return filas if filas is False else [fila[:7] for fila in filas]
+
+# --- ANÁLISIS MENSUAL ---
+def resumen_analitico(user_id, meses=12):
+    """DataFrames del dashboard a partir de los agregados materializados.
+
+    Lee con un único `read_sql` los ingresos de resumen_mensual y los gastos de
+    gastos_categoria_mes (a lo sumo meses x categorías filas, sin importar
+    cuántas transacciones tenga el usuario) y arma todo con pivots de pandas.
+    Devuelve `(mensual, por_categoria)` indexados por mes ("YYYY-MM").
+    """
+    import pandas as pd  # solo el dashboard lo necesita
+
+    hoy = datetime.date.today()
+    inicio = hoy.year * 12 + hoy.month - meses  # meses contados desde el año 0, incluye el actual
+    desde = f"{inicio // 12:04d}-{inicio % 12 + 1:02d}"
+    query = """SELECT mes, 'Ingreso' AS tipo, 'Ingresos' AS categoria, ingresos AS total
+               FROM resumen_mensual WHERE usuario_id = ? AND mes >= ?
+               UNION ALL
+               SELECT mes, 'Gasto', categoria, total
+               FROM gastos_categoria_mes WHERE usuario_id = ? AND mes >= ?"""
+    params = (user_id, desde, user_id, desde)
+    inst = get_instrumentacion()
+    with get_pool().conexion() as conn:
+        inicio = time.perf_counter()
+        df = pd.read_sql(query, conn, params=params)
+        if inst.activa:
+            inst.registrar(query, (time.perf_counter() - inicio) * 1000, conn, params)
+    mensual = df.pivot_table(index="mes", columns="tipo", values="total", aggfunc="sum", fill_value=0.0)
+    mensual = mensual.reindex(columns=["Ingreso", "Gasto"], fill_value=0.0)
+    mensual.columns = ["Ingresos", "Gastos"]
+    mensual["Ahorro"] = mensual["Ingresos"] - mensual["Gastos"]
+    mensual["Tasa de ahorro"] = (mensual["Ahorro"] / mensual["Ingresos"].where(mensual["Ingresos"] > 0)).fillna(0.0)
+    por_categoria = df[df["tipo"] == "Gasto"].pivot_table(index="mes", columns="categoria", values="total", aggfunc="sum", fill_value=0.0)
+    return mensual.sort_index(), por_categoria.sort_index()
+
+# --- OTRAS FUNCIONES ---
+def analizar_gastos_y_sugerir(user_id):
+    return get_cache().obtener(user_id, "tips", lambda: _calcular_tips(user_id))
+
+def _calcular_tips(user_id):
+    # Lee los agregados de gastos_categoria_mes: una fila por categoría,
+    # sin importar cuántos gastos tenga el usuario. Las transferencias de metas
+    # salen de lo ahorrado, no son gasto: no pesan en ninguna regla.
+    tips = []
+    hoy = datetime.date.today()
+    mes_actual = hoy.strftime("%Y-%m")
+    mes_anterior = (hoy.replace(day=1) - datetime.timedelta(days=1)).strftime("%Y-%m")
+    gastos = run_query("""SELECT categoria, SUM(total),
+                                 SUM(CASE WHEN mes = ? THEN total ELSE 0 END),
+                                 SUM(CASE WHEN mes = ? THEN total ELSE 0 END)
+                          FROM gastos_categoria_mes WHERE usuario_id = ? AND categoria IS NOT 'Transferencia'
+                          GROUP BY categoria""",
+                       (mes_actual, mes_anterior, user_id), return_data=True)
+    saldo_actual = run_query("SELECT saldo FROM usuarios WHERE id = ?", (user_id,), return_data=True)[0][0]
+    
+    if not gastos: return ["👋 Registra tus primeros gastos para recibir consejos de la IA."]
+    cats = {cat: (total, este_mes, mes_pasado) for cat, total, este_mes, mes_pasado in gastos}
+    
+    if any("Alimentación" in c for c in cats): tips.append("🍔 **Comida:** Cocinar en casa ahorra hasta S/. 120/mes.")
+    if any("Transporte" in c for c in cats): tips.append("🚕 **Movilidad:** ¿Has probado compartir viaje o usar bus?")
+    if any("Entretenimiento" in c for c in cats): tips.append("🎬 **Ocio:** Busca descuentos de estudiante.")
+
+    # Reglas sobre el mes en curso: peso de cada categoría y crecimiento vs. el mes pasado
+    total_mes = sum(v[1] for v in cats.values())
+    for cat, (total, este_mes, mes_pasado) in cats.items():
+        if total_mes > 0 and len(cats) > 1 and este_mes / total_mes >= 0.5:
+            tips.append(f"📊 **{cat}** se lleva el {este_mes / total_mes:.0%} de tus gastos de este mes.")
+        if mes_pasado > 0 and este_mes > mes_pasado * 1.3:
+            tips.append(f"📈 **{cat}:** gastaste {este_mes / mes_pasado - 1:.0%} más que el mes pasado (S/. {este_mes:,.2f}).")
+    
+    if saldo_actual < 20: tips.append("🚨 **URGENTE:** Saldo crítico (< S/. 20).")
+    elif saldo_actual < 50: tips.append("⚠️ **Cuidado:** Prioriza lo esencial (< S/. 50).")
+        
+    if not tips: tips.append("✅ **¡Finanzas Saludables!** Sigue así.")
+    return tips
+
+def calcular_nivel(puntos):
+    if puntos < 100: return "Bronce 🥉", 100
+    elif puntos < 500: return "Plata 🥈", 500
+    elif puntos < 1500: return "Oro 🥇", 1500
+    else: return "Diamante 💎", 5000
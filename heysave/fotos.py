@@ -0,0 +1,57 @@
+"""Fotos de perfil guardadas por hash de contenido, con miniatura precalculada."""
+import functools
+import hashlib
+import io
+import os
+import time
+
+from heysave.db import run_query, run_transaction
+
+# --- FOTOS DE PERFIL ---
+AVATAR_DEFAULT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "avatar_default.png")
+LADO_MINIATURA = 256
+
+def _miniatura(imagen):
+    # Pillow viene con Streamlit; si no está o la imagen no se puede leer, se usa el original
+    try:
+        from PIL import Image, ImageOps
+        with Image.open(io.BytesIO(imagen)) as img:
+            img = ImageOps.exif_transpose(img).convert("RGB")
+            img.thumbnail((LADO_MINIATURA, LADO_MINIATURA))
+            salida = io.BytesIO()
+            img.save(salida, format="JPEG", quality=85, optimize=True)
+            return salida.getvalue()
+    except Exception:
+        return imagen
+
+def guardar_foto(user_id, imagen, hash_anterior=None):
+    """Guarda la foto (y su miniatura, generada una sola vez) y la asigna al usuario."""
+    foto_hash = hashlib.sha256(imagen).hexdigest()
+    sentencias = [
+        ("INSERT OR IGNORE INTO fotos (hash, original, miniatura, creada) VALUES (?, ?, ?, ?)",
+         (foto_hash, imagen, _miniatura(imagen), int(time.time()))),
+        ("UPDATE usuarios SET foto_hash = ? WHERE id = ?", (foto_hash, user_id), 1),
+    ]
+    if hash_anterior and hash_anterior != foto_hash:
+        # La foto vieja se borra solo si ya nadie la usa
+        sentencias.append(("DELETE FROM fotos WHERE hash = ? AND NOT EXISTS (SELECT 1 FROM usuarios WHERE foto_hash = ?)",
+                           (hash_anterior, hash_anterior)))
+    return run_transaction(sentencias)
+
+@functools.lru_cache(maxsize=1000)
+def _leer_miniatura(foto_hash):
+    # El hash identifica el contenido: una vez leída, la miniatura nunca cambia.
+    # Si no está (o falló la lectura) se lanza KeyError y lru_cache no guarda nada
+    data = run_query("SELECT miniatura FROM fotos WHERE hash = ?", (foto_hash,), return_data=True)
+    if not data:
+        raise KeyError(foto_hash)
+    return data[0][0]
+
+def obtener_miniatura(foto_hash):
+    """Miniatura de la foto, o el avatar por defecto (sin cachearlo) si no hay foto o no se pudo leer."""
+    if not foto_hash:
+        return AVATAR_DEFAULT
+    try:
+        return _leer_miniatura(foto_hash)
+    except KeyError:
+        return AVATAR_DEFAULT
@@ -0,0 +1,161 @@
+"""Importación de estados de cuenta CSV en `transacciones`, por lotes."""
+import contextlib
+import csv
+import datetime
+import functools
+import io
+import itertools
+import os
+import re
+import time
+import unicodedata
+
+from heysave.cache import invalidar_cache
+from heysave.categorias import categorizar_lote
+from heysave.db import run_transaction
+from heysave.finanzas import ts_de_fecha
+
+# --- IMPORTACIÓN DE ESTADOS DE CUENTA (CSV) ---
+# Encabezados aceptados para cada columna (en minúsculas y sin tildes)
+COLUMNAS_CSV = {
+    "fecha": {"fecha", "date", "fecha operacion", "fecha de operacion", "fecha proceso"},
+    "descripcion": {"descripcion", "description", "concepto", "detalle", "glosa"},
+    "monto": {"monto", "importe", "amount", "valor", "monto s/."},
+    "tipo": {"tipo", "type", "movimiento"},
+}
+FORMATOS_FECHA_CSV = ["%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%d/%m/%y"]
+# "15/03": sin año (strptime le pondría 1900), se resuelve en _fecha_sin_anio
+_FECHA_SIN_ANIO = re.compile(r"(\d{1,2})/(\d{1,2})")
+TIPOS_GASTO_CSV = {"gasto", "cargo", "debito", "retiro", "egreso"}
+_COLUMNAS = "usuario_id, fecha, ts, descripcion, categoria, monto, tipo"
+
+def _normalizar_encabezado(texto):
+    texto = unicodedata.normalize("NFKD", texto.strip().lower())
+    return "".join(ch for ch in texto if not unicodedata.combining(ch))
+
+def _parsear_monto(texto):
+    limpio = re.sub(r"[^\d,.\-]", "", texto or "")
+    if "," in limpio and "." in limpio:
+        # El separador que aparece último es el decimal
+        miles = "," if limpio.rfind(",") < limpio.rfind(".") else "."
+        limpio = limpio.replace(miles, "").replace(",", ".")
+    elif "," in limpio:
+        limpio = limpio.replace(",", ".")
+    return float(limpio)
+
+def _fecha_sin_anio(dia, mes, hoy):
+    # Como `fecha` en la migración 4: el año actual, o el anterior si la fecha todavía no
+    # llegó. Con el año explícito un 29/02 cae en el último año bisiesto
+    for anio in range(hoy.year, hoy.year - 5, -1):
+        try:
+            fecha = datetime.date(anio, mes, dia)
+        except ValueError:
+            continue
+        if fecha <= hoy:
+            return fecha
+    return None
+
+def _parsear_fecha(texto):
+    return _parsear_fecha_del_dia(texto.strip(), datetime.date.today())
+
+@functools.lru_cache(maxsize=4096)
+def _parsear_fecha_del_dia(texto, hoy):
+    # Cacheada: un estado de cuenta repite las mismas pocas fechas miles de veces
+    # (con `hoy` en la clave, las fechas sin año no quedan fijas al cambiar de año)
+    for formato in FORMATOS_FECHA_CSV:
+        try:
+            return datetime.datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    partes = _FECHA_SIN_ANIO.fullmatch(texto)
+    return _fecha_sin_anio(int(partes[1]), int(partes[2]), hoy) if partes else None
+
+def _filas_csv(archivo, pila):
+    # Acepta una ruta, un archivo de texto o uno binario (p. ej. st.file_uploader).
+    # `pila` cierra al final solo lo que se abre aquí; el archivo de quien llama queda abierto
+    if isinstance(archivo, (str, os.PathLike)):
+        archivo = pila.enter_context(open(archivo, "rb"))
+    if not isinstance(archivo, io.TextIOBase):
+        archivo = io.TextIOWrapper(archivo, encoding="utf-8-sig", errors="replace", newline="")
+        # Cerrar el wrapper cerraría también el binario: se suelta sin cerrarlo
+        pila.callback(archivo.detach)
+    encabezado = archivo.readline()
+    try:
+        dialecto = csv.Sniffer().sniff(encabezado, delimiters=",;\t|")
+    except csv.Error:
+        dialecto = csv.excel
+    lector = csv.reader(itertools.chain([encabezado], archivo), dialecto)
+    nombres = [_normalizar_encabezado(c) for c in next(lector)]
+    indices = {}
+    for campo, alias in COLUMNAS_CSV.items():
+        for i, nombre in enumerate(nombres):
+            if nombre in alias:
+                indices[campo] = i
+                break
+    faltan = {"fecha", "descripcion", "monto"} - set(indices)
+    if faltan:
+        raise ValueError(f"Faltan columnas en el CSV: {', '.join(sorted(faltan))}")
+    return lector, indices
+
+def importar_csv(user_id, archivo, tamano_lote=5000, progreso=None):
+    """Importa un estado de cuenta CSV en `transacciones` leyéndolo por lotes.
+
+    Cada lote se categoriza de una vez, se inserta con `executemany` y ajusta
+    `usuarios.saldo` con un único UPDATE, todo en una sola transacción; la
+    memoria usada depende de `tamano_lote`, no del tamaño del archivo. Los montos
+    negativos (o con tipo cargo/débito) son gastos y se aplican aunque dejen el
+    saldo en negativo: el estado de cuenta manda.
+
+    Devuelve un dict con filas importadas, rechazadas, segundos y filas por segundo.
+    """
+    inicio = time.perf_counter()
+    importadas = rechazadas = 0
+    lote = []
+
+    def guardar(lote):
+        gastos = iter(categorizar_lote([d for d, _, _, tipo in lote if tipo == "Gasto"]))
+        filas, neto = [], 0.0
+        for desc, fecha, monto, tipo in lote:
+            cat = next(gastos) if tipo == "Gasto" else "Ingreso"
+            filas.append((user_id, f"{fecha.day:02d}/{fecha.month:02d}", ts_de_fecha(fecha), desc, cat, monto, tipo))
+            neto += monto if tipo == "Ingreso" else -monto
+        # El lote pasa por una tabla temporal y entra con un solo INSERT ... SELECT: el
+        # trigger de FTS5 vacía su buffer en cada sentencia, y con executemany directo
+        # sobre transacciones eso pasaría una vez por fila
+        return run_transaction([
+            (f"CREATE TEMP TABLE IF NOT EXISTS _importacion ({_COLUMNAS})", ()),
+            ("DELETE FROM temp._importacion", ()),
+            ("INSERT INTO temp._importacion VALUES (?, ?, ?, ?, ?, ?, ?)", filas),
+            (f"INSERT INTO transacciones ({_COLUMNAS}) SELECT {_COLUMNAS} FROM temp._importacion", ()),
+            ("UPDATE usuarios SET saldo = saldo + ? WHERE id = ?", (neto, user_id), 1),
+        ])
+
+    with contextlib.ExitStack() as pila:
+        lector, indices = _filas_csv(archivo, pila)
+        for fila in lector:
+            try:
+                fecha = _parsear_fecha(fila[indices["fecha"]])
+                desc = fila[indices["descripcion"]].strip()
+                monto = _parsear_monto(fila[indices["monto"]])
+            except (IndexError, ValueError):
+                rechazadas += 1
+                continue
+            if fecha is None or not desc or monto == 0:
+                rechazadas += 1
+                continue
+            tipo_txt = _normalizar_encabezado(fila[indices["tipo"]]) if "tipo" in indices and len(fila) > indices["tipo"] else ""
+            tipo = "Gasto" if monto < 0 or tipo_txt in TIPOS_GASTO_CSV else "Ingreso"
+            lote.append((desc, fecha, abs(monto), tipo))
+            if len(lote) >= tamano_lote:
+                if guardar(lote): importadas += len(lote)
+                else: rechazadas += len(lote)
+                lote = []
+                if progreso: progreso(importadas)
+        if lote:
+            if guardar(lote): importadas += len(lote)
+            else: rechazadas += len(lote)
+
+    invalidar_cache(user_id)
+    segundos = time.perf_counter() - inicio
+    return {"filas": importadas, "rechazadas": rechazadas, "segundos": round(segundos, 3),
+            "filas_por_segundo": round(importadas / segundos, 1) if segundos > 0 else 0.0}
@@ -0,0 +1,121 @@
+"""Instrumentación de consultas: tiempos por SQL normalizado, consultas lentas y desglose por rerun."""
+import datetime
+import functools
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# --- INSTRUMENTACIÓN DE CONSULTAS ---
+logger = logging.getLogger("heysave")
+
+@functools.lru_cache(maxsize=1024)
+def normalizar_sql(query):
+    # Sin literales ni espacios extra: la misma consulta con distintos valores cuenta como una
+    sql = re.sub(r"'(?:[^']|'')*'", "?", query)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(...)", sql)
+    return re.sub(r"\s+", " ", sql).strip()
+
+class Instrumentacion:
+    """Tiempos por consulta normalizada, log de consultas lentas y desglose de cada rerun.
+
+    Desactivada (lo normal en producción) solo cuesta un `if` por consulta; los
+    errores se cuentan y se loguean siempre.
+    """
+
+    def __init__(self, activa=False, umbral_lento_ms=100.0, max_lentas=200, max_reruns=200):
+        self.activa = activa
+        self.umbral_lento_ms = umbral_lento_ms
+        self.consultas = {}  # sql normalizado -> [veces, total_ms, max_ms, errores]
+        self.lentas = deque(maxlen=max_lentas)
+        self.reruns = deque(maxlen=max_reruns)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stats(self, query):
+        clave = normalizar_sql(query)
+        stats = self.consultas.get(clave)
+        if stats is None:
+            stats = self.consultas[clave] = [0, 0.0, 0.0, 0]
+        return clave, stats
+
+    def _sumar(self, seccion, ms):
+        tiempos = getattr(self._local, "tiempos", None)
+        if tiempos is not None:
+            tiempos[seccion] = tiempos.get(seccion, 0.0) + ms
+
+    def registrar(self, query, ms, conn=None, params=()):
+        with self._lock:
+            clave, stats = self._stats(query)
+            stats[0] += 1; stats[1] += ms; stats[2] = max(stats[2], ms)
+        self._sumar("db", ms)
+        if ms >= self.umbral_lento_ms:
+            plan = None
+            if conn is not None and not isinstance(params, list):
+                try:
+                    plan = [fila[-1] for fila in conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+                except sqlite3.Error:
+                    pass
+            self.lentas.append({"sql": clave, "ms": round(ms, 2), "plan": plan,
+                                "cuando": datetime.datetime.now().isoformat(timespec="seconds")})
+            logger.warning("Consulta lenta (%.1f ms): %s", ms, clave)
+
+    def registrar_error(self, query, error):
+        with self._lock:
+            clave, stats = self._stats(query)
+            stats[3] += 1
+        logger.warning("Consulta fallida: %s (%s)", clave, error)
+
+    @contextmanager
+    def medir(self, seccion):
+        if not self.activa:
+            yield
+            return
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._sumar(seccion, (time.perf_counter() - inicio) * 1000)
+
+    def iniciar_rerun(self):
+        self._local.tiempos = {} if self.activa else None
+        self._local.inicio = time.perf_counter()
+
+    def cerrar_rerun(self, etiqueta=""):
+        """Desglose del rerun del hilo actual: total, DB, categorización y el resto (render)."""
+        tiempos = getattr(self._local, "tiempos", None)
+        if tiempos is None:
+            return None
+        self._local.tiempos = None
+        total = (time.perf_counter() - self._local.inicio) * 1000
+        desglose = {"total_ms": round(total, 2)}
+        for seccion, ms in sorted(tiempos.items()):
+            desglose[f"{seccion}_ms"] = round(ms, 2)
+        desglose["render_ms"] = round(total - sum(tiempos.values()), 2)
+        self.reruns.append(dict(desglose, pantalla=etiqueta, cuando=datetime.datetime.now().isoformat(timespec="seconds")))
+        return desglose
+
+    def resumen(self):
+        with self._lock:
+            consultas = [{"sql": sql, "veces": n, "total_ms": round(total, 2), "prom_ms": round(total / n, 3) if n else 0.0,
+                          "max_ms": round(maximo, 2), "errores": errores}
+                         for sql, (n, total, maximo, errores) in self.consultas.items()]
+        consultas.sort(key=lambda c: c["total_ms"], reverse=True)
+        return {"activa": self.activa, "umbral_lento_ms": self.umbral_lento_ms, "consultas": consultas,
+                "lentas": list(self.lentas), "reruns": list(self.reruns)}
+
+    def reiniciar(self):
+        with self._lock:
+            self.consultas.clear()
+            self.lentas.clear()
+            self.reruns.clear()
+
+@functools.lru_cache(maxsize=None)
+def get_instrumentacion():
+    return Instrumentacion(activa=os.environ.get("HEYSAVE_PERF") == "1",
+                           umbral_lento_ms=float(os.environ.get("HEYSAVE_SLOW_MS", "100")))
@@ -0,0 +1,69 @@
+"""Catálogo de premios con stock y canje atómico con códigos únicos."""
+import datetime
+import secrets
+
+from heysave.cache import get_cache_compartida, invalidar_cache
+from heysave.db import run_query, run_transaction
+
+# (icono, nombre, costo en puntos, prefijo de los códigos); se cargan en la migración
+PREMIOS_INICIALES = [
+    ("☕", "Café Gratis", 50, "CAFE"),
+    ("🍿", "2x1 Cine", 150, "CINE"),
+    ("📚", "Libro -20%", 300, "BOOK"),
+    ("🎧", "Spotify 1 Mes", 600, "SPOT"),
+]
+STOCK_INICIAL = 500
+
+def generar_codigos(prefijo, cantidad):
+    # 40 bits aleatorios por código; los choques se descartan con INSERT OR IGNORE
+    return [f"{prefijo}-{secrets.token_hex(5).upper()}" for _ in range(cantidad)]
+
+def catalogo():
+    """Premios activos como dicts (id, icono, nombre, costo, stock), cacheados hasta el próximo canje o un minuto."""
+    # El mismo para todos: va en la caché compartida, no en la de cada usuario
+    filas = get_cache_compartida().obtener("premios", lambda: run_query(
+        "SELECT id, icono, nombre, costo, stock FROM premios WHERE activo = 1 ORDER BY costo, id", return_data=True))
+    return [dict(zip(("id", "icono", "nombre", "costo", "stock"), fila)) for fila in filas or []]
+
+def canjear(user_id, premio_id):
+    """Canjea un premio y devuelve su código, o None si no alcanzan los puntos o no queda stock.
+
+    Todo es una sola operación del escritor: descuenta puntos (`puntos >= costo`,
+    con el costo leído de la tabla), descuenta stock (`stock > 0`), reserva un
+    código libre marcándolo con un token propio y lo registra en
+    premios_canjeados con un INSERT ... SELECT por ese token. Si cualquiera de
+    los pasos no afecta filas se deshace todo, así que dos clicks simultáneos
+    nunca gastan de más ni reciben el mismo código.
+    """
+    token = secrets.token_hex(16)
+    ok = run_transaction([
+        ("UPDATE usuarios SET puntos = puntos - (SELECT costo FROM premios WHERE id = ?) "
+         "WHERE id = ? AND puntos >= (SELECT costo FROM premios WHERE id = ? AND activo = 1)",
+         (premio_id, user_id, premio_id), 1),
+        ("UPDATE premios SET stock = stock - 1 WHERE id = ? AND activo = 1 AND stock > 0", (premio_id,), 1),
+        ("UPDATE codigos_premio SET token = ? WHERE id = (SELECT id FROM codigos_premio WHERE premio_id = ? AND token IS NULL LIMIT 1)",
+         (token, premio_id), 1),
+        ("INSERT INTO premios_canjeados (usuario_id, premio, codigo, fecha) "
+         "SELECT ?, p.nombre, c.codigo, ? FROM codigos_premio c JOIN premios p ON p.id = c.premio_id WHERE c.token = ?",
+         (user_id, datetime.date.today().strftime("%d/%m/%Y"), token), 1),
+    ])
+    get_cache_compartida().invalidar("premios")
+    if not ok:
+        return None
+    invalidar_cache(user_id, "usuario", "canjes")
+    filas = run_query("SELECT codigo FROM codigos_premio WHERE token = ?", (token,), return_data=True)
+    return filas[0][0] if filas else None
+
+def reponer_stock(premio_id, cantidad):
+    """Genera `cantidad` códigos nuevos y recalcula el stock a partir de los libres."""
+    prefijo = run_query("SELECT prefijo FROM premios WHERE id = ?", (premio_id,), return_data=True)
+    if not prefijo:
+        return False
+    ok = run_transaction([
+        ("INSERT OR IGNORE INTO codigos_premio (premio_id, codigo) VALUES (?, ?)",
+         [(premio_id, codigo) for codigo in generar_codigos(prefijo[0][0], cantidad)]),
+        ("UPDATE premios SET stock = (SELECT COUNT(*) FROM codigos_premio WHERE premio_id = ? AND token IS NULL) WHERE id = ?",
+         (premio_id, premio_id), 1),
+    ])
+    get_cache_compartida().invalidar("premios")
+    return ok
@@ -0,0 +1,156 @@
+"""Ahorro automático: reglas recurrentes hacia metas y el trabajo por lotes que las ejecuta.
+
+Uso (p. ej. desde cron, cada hora):
+    python -m heysave.programador [--ahora EPOCH] [--lote 5000]
+"""
+import argparse
+import datetime
+import json
+import sys
+import time
+
+from heysave.cache import consulta_usuario, invalidar_cache
+from heysave.db import run_query, run_transaction
+from heysave.finanzas import ts_de_fecha
+
+FRECUENCIAS = ("diaria", "semanal", "mensual")
+# Mismos puntos que un abono manual desde la pestaña Metas
+PUNTOS_POR_SOL = 0.25
+
+def primera_ejecucion(frecuencia, dia, hoy=None):
+    """Epoch (medianoche local) del primer día, desde hoy inclusive, en que toca la regla.
+
+    `dia` es el día de la semana (0 = lunes) para "semanal" y el día del mes
+    (1-28) para "mensual"; "diaria" lo ignora.
+    """
+    hoy = hoy or datetime.date.today()
+    if frecuencia == "semanal":
+        fecha = hoy + datetime.timedelta(days=(dia - hoy.weekday()) % 7)
+    elif frecuencia == "mensual":
+        fecha = hoy.replace(day=dia)
+        if dia < hoy.day:
+            fecha = (hoy.replace(day=1) + datetime.timedelta(days=32)).replace(day=dia)
+    else:
+        fecha = hoy
+    return ts_de_fecha(fecha)
+
+def crear_regla(user_id, meta_id, monto, frecuencia, dia=1):
+    if monto <= 0 or frecuencia not in FRECUENCIAS:
+        return False
+    dia = min(max(int(dia), 0 if frecuencia == "semanal" else 1), 6 if frecuencia == "semanal" else 28)
+    ok = run_transaction([
+        # El INSERT ... SELECT solo encuentra la meta si es del usuario
+        ("INSERT INTO reglas_ahorro (usuario_id, meta_id, monto, frecuencia, dia, proxima) "
+         "SELECT ?, id, ?, ?, ?, ? FROM metas WHERE id = ? AND usuario_id = ?",
+         (user_id, monto, frecuencia, dia, primera_ejecucion(frecuencia, dia), meta_id, user_id), 1),
+    ])
+    invalidar_cache(user_id, "reglas")
+    return ok
+
+def desactivar_regla(user_id, regla_id):
+    ok = run_transaction([("UPDATE reglas_ahorro SET activa = 0 WHERE id = ? AND usuario_id = ?", (regla_id, user_id), 1)])
+    invalidar_cache(user_id, "reglas")
+    return ok
+
+def reglas_usuario(user_id):
+    return consulta_usuario(user_id, "reglas", """SELECT r.id, r.meta_id, m.nombre, r.monto, r.frecuencia, r.dia, r.proxima, r.ultimo_resultado
+                                                  FROM reglas_ahorro r JOIN metas m ON m.id = r.meta_id
+                                                  WHERE r.usuario_id = ? AND r.activa = 1 ORDER BY r.id""", (user_id,))
+
+# --- EJECUCIÓN POR LOTES ---
+# Siguiente vencimiento estrictamente posterior a :ahora, sin ponerse al día
+# período por período si el programador estuvo parado
+_PROXIMA_SQL = """CASE frecuencia
+    WHEN 'mensual' THEN (
+        SELECT CASE WHEN c > :ahora THEN c
+                    ELSE CAST(strftime('%s', date(c, 'unixepoch', 'localtime', '+1 month'), 'utc') AS INTEGER) END
+        FROM (SELECT CAST(strftime('%s', date(:ahora, 'unixepoch', 'localtime', 'start of month',
+                                              printf('+%d days', dia - 1)), 'utc') AS INTEGER) AS c))
+    ELSE proxima + ((:ahora - proxima) / (CASE frecuencia WHEN 'diaria' THEN 86400 ELSE 604800 END) + 1)
+                   * (CASE frecuencia WHEN 'diaria' THEN 86400 ELSE 604800 END)
+END"""
+
+def _sentencias_lote(ahora, tamano_lote):
+    """Una operación del escritor que procesa hasta `tamano_lote` reglas vencidas.
+
+    Todo en SQL por conjuntos sobre tablas temporales de la conexión del
+    escritor: el lote se fija en `_lote`, la suma acumulada por usuario (función
+    de ventana, en orden de id) decide qué reglas alcanzan con el saldo, los
+    abonos se registran como transacciones "Abono" y metas, usuarios y reglas se
+    actualizan con un UPDATE cada una.
+    """
+    p = {"ahora": ahora, "lote": tamano_lote, "factor": PUNTOS_POR_SOL}
+    return [
+        ("CREATE TEMP TABLE IF NOT EXISTS _lote (id INTEGER PRIMARY KEY)", ()),
+        ("CREATE TEMP TABLE IF NOT EXISTS _abonos (regla_id INTEGER PRIMARY KEY, usuario_id INTEGER, meta_id INTEGER, monto REAL, puntos INTEGER)", ()),
+        ("DELETE FROM temp._lote", ()),
+        ("DELETE FROM temp._abonos", ()),
+        ("INSERT INTO temp._lote (id) SELECT id FROM reglas_ahorro WHERE activa = 1 AND proxima <= :ahora ORDER BY proxima, id LIMIT :lote", p),
+        # Igual que "Abonar": la meta debe estar en progreso y el saldo alcanzar (contando las reglas previas del usuario)
+        ("""INSERT INTO temp._abonos (regla_id, usuario_id, meta_id, monto, puntos)
+            SELECT regla_id, usuario_id, meta_id, monto, CAST(monto * :factor AS INTEGER) FROM (
+                SELECT r.id AS regla_id, r.usuario_id, r.meta_id, r.monto, u.saldo,
+                       SUM(r.monto) OVER (PARTITION BY r.usuario_id ORDER BY r.id) AS acumulado
+                FROM temp._lote l
+                CROSS JOIN reglas_ahorro r ON r.id = l.id  -- CROSS: que recorra el lote, no toda la tabla
+                JOIN usuarios u ON u.id = r.usuario_id
+                JOIN metas m ON m.id = r.meta_id AND m.usuario_id = r.usuario_id AND m.ahorrado < m.objetivo)
+            WHERE acumulado <= saldo""", p),
+        # Cada abono queda en el libro, igual que uno manual
+        ("""INSERT INTO transacciones (usuario_id, fecha, ts, descripcion, categoria, monto, tipo)
+            SELECT a.usuario_id, strftime('%d/%m', :ahora, 'unixepoch', 'localtime'), :ahora, 'Ahorro automático: ' || m.nombre, 'Ahorro', a.monto, 'Abono'
+            FROM temp._abonos a JOIN metas m ON m.id = a.meta_id ORDER BY a.regla_id""", p),
+        ("""UPDATE metas SET ahorrado = metas.ahorrado + a.monto
+            FROM (SELECT meta_id, SUM(monto) AS monto FROM temp._abonos GROUP BY meta_id) a
+            WHERE metas.id = a.meta_id""", ()),
+        ("""UPDATE usuarios SET saldo = usuarios.saldo - a.monto, puntos = usuarios.puntos + a.puntos
+            FROM (SELECT usuario_id, SUM(monto) AS monto, SUM(puntos) AS puntos FROM temp._abonos GROUP BY usuario_id) a
+            WHERE usuarios.id = a.usuario_id""", ()),
+        # 'meta': la meta ya se completó o no existe, y la regla se desactiva
+        (f"""UPDATE reglas_ahorro SET
+                ultima_ejecucion = :ahora,
+                proxima = {_PROXIMA_SQL},
+                ultimo_resultado = CASE
+                    WHEN id IN (SELECT regla_id FROM temp._abonos) THEN 'ok'
+                    WHEN NOT EXISTS (SELECT 1 FROM metas m WHERE m.id = reglas_ahorro.meta_id AND m.usuario_id = reglas_ahorro.usuario_id)
+                      OR (SELECT ahorrado >= objetivo FROM metas m WHERE m.id = reglas_ahorro.meta_id) THEN 'meta'
+                    ELSE 'saldo' END
+            WHERE id IN (SELECT id FROM temp._lote)""", p),
+        ("UPDATE reglas_ahorro SET activa = 0 WHERE id IN (SELECT id FROM temp._lote) AND ultimo_resultado = 'meta'", ()),
+    ]
+
+def ejecutar_pendientes(ahora=None, tamano_lote=5000):
+    """Ejecuta todas las reglas vencidas a `ahora`, un lote por transacción.
+
+    Devuelve un dict con lotes, si hubo error, reglas por resultado
+    (ok/saldo/meta), monto abonado, puntos otorgados y segundos.
+    """
+    ahora = int(ahora if ahora is not None else time.time())
+    inicio = time.perf_counter()
+    lotes, error = 0, False
+    while run_query("SELECT 1 FROM reglas_ahorro WHERE activa = 1 AND proxima <= ? LIMIT 1", (ahora,), return_data=True):
+        if not run_transaction(_sentencias_lote(ahora, tamano_lote)):
+            error = True  # ya quedó en el log; lo que falte se toma en la próxima corrida
+            break
+        lotes += 1
+    resumen = {"lotes": lotes, "error": error, "ok": 0, "saldo": 0, "meta": 0, "monto": 0.0, "puntos": 0}
+    for resultado, cantidad, monto, puntos in run_query("""SELECT ultimo_resultado, COUNT(*), SUM(monto), SUM(CAST(monto * ? AS INTEGER))
+                                                           FROM reglas_ahorro WHERE ultima_ejecucion = ? GROUP BY 1""",
+                                                        (PUNTOS_POR_SOL, ahora), return_data=True) or []:
+        resumen[resultado] = cantidad
+        if resultado == "ok":
+            resumen["monto"], resumen["puntos"] = round(monto, 2), puntos
+    resumen["segundos"] = round(time.perf_counter() - inicio, 3)
+    return resumen
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ejecuta las reglas de ahorro automático vencidas.")
+    parser.add_argument("--ahora", type=int, help="epoch de referencia (por defecto, ahora)")
+    parser.add_argument("--lote", type=int, default=5000, help="reglas por transacción")
+    args = parser.parse_args(argv)
+    resumen = ejecutar_pendientes(args.ahora, args.lote)
+    print(json.dumps(resumen, ensure_ascii=False))
+    return 1 if resumen["error"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
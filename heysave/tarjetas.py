@@ -0,0 +1,132 @@
+"""Identificación de banco, red y tipo de una tarjeta por su BIN (prefijo del número)."""
+import bisect
+import csv
+import functools
+import heapq
+import os
+import re
+
+# Tabla incluida: rangos de cada red y los BIN de los bancos peruanos conocidos.
+# HEYSAVE_BINS apunta a una tabla más grande con el mismo formato, que se suma encima.
+BINS_DEFAULT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "datos", "bins.csv")
+CAMPOS_BIN = ("banco", "red", "tipo", "pais")
+_NO_DIGITO = re.compile(r"\D")
+
+def _segmentos(rangos):
+    """Rangos `(inicio, fin, orden, datos)` solapados -> segmentos disjuntos y ordenados `(inicio, fin, datos)`.
+
+    Donde se pisan gana el rango de mayor `orden` (la fila más tardía). Barrido
+    por los bordes con un heap de los rangos abiertos: O(n log n) en filas, sin
+    importar cuántos números cubra cada rango.
+    """
+    rangos = sorted(rangos)
+    bordes = sorted({r[0] for r in rangos} | {r[1] + 1 for r in rangos})
+    abiertos, segmentos, i = [], [], 0
+    for desde, hasta in zip(bordes, bordes[1:]):
+        while i < len(rangos) and rangos[i][0] == desde:
+            inicio, fin, orden, datos = rangos[i]
+            heapq.heappush(abiertos, (-orden, fin, datos))
+            i += 1
+        while abiertos and abiertos[0][1] < desde:
+            heapq.heappop(abiertos)
+        if not abiertos:
+            continue
+        datos = abiertos[0][2]
+        if segmentos and segmentos[-1][1] == desde - 1 and segmentos[-1][2] is datos:
+            segmentos[-1] = (segmentos[-1][0], hasta - 1, datos)
+        else:
+            segmentos.append((desde, hasta - 1, datos))
+    return segmentos
+
+def cargar_bins(ruta):
+    """Filas `(prefijo, banco, red, tipo, pais)` de un CSV con esos encabezados (las columnas vacías valen "")."""
+    with open(ruta, newline="", encoding="utf-8") as f:
+        return [(fila["prefijo"].strip(), *((fila.get(campo) or "").strip() for campo in CAMPOS_BIN))
+                for fila in csv.DictReader(f) if (fila.get("prefijo") or "").strip()]
+
+class IndiceBIN:
+    """Prefijo BIN -> metadatos, con búsqueda del prefijo más largo en O(dígitos).
+
+    Los prefijos exactos van en un dict (un trie aplanado) y los rangos como
+    "2221-2720", por largo, en segmentos disjuntos ordenados que se buscan con
+    bisect: un rango de 8 dígitos ocupa una entrada, no una por número. Se
+    prueban los prefijos del número del más largo al más corto, así que cada
+    búsqueda son a lo sumo `largo_max` lecturas de dict y bisecciones. Las filas
+    con los mismos metadatos comparten la tupla.
+    """
+
+    def __init__(self, filas):
+        self._prefijos = {}
+        rangos = {}
+        compartidas = {}
+        # Si un prefijo se repite gana la última fila (la tabla de HEYSAVE_BINS pisa a la incluida);
+        # a igual largo, un prefijo exacto gana a un rango que lo cubra
+        for orden, (prefijo, *datos) in enumerate(filas):
+            datos = compartidas.setdefault(tuple(datos), tuple(datos))
+            if "-" in prefijo:
+                inicio, fin = (p.strip() for p in prefijo.split("-", 1))
+                rangos.setdefault(len(inicio), []).append((int(inicio), int(fin), orden, datos))
+            else:
+                self._prefijos[prefijo] = datos
+        self._rangos = {}
+        for largo, lista in rangos.items():
+            segmentos = _segmentos(lista)
+            self._rangos[largo] = ([s[0] for s in segmentos], segmentos)
+        self.largo_max = max([*map(len, self._prefijos), *self._rangos], default=0)
+
+    def __len__(self):
+        # Entradas guardadas (prefijos más segmentos de rango), no números cubiertos
+        return len(self._prefijos) + sum(len(segmentos) for _, segmentos in self._rangos.values())
+
+    def _en_rangos(self, prefijo):
+        if len(prefijo) not in self._rangos:
+            return None
+        inicios, segmentos = self._rangos[len(prefijo)]
+        valor = int(prefijo)
+        i = bisect.bisect_right(inicios, valor) - 1
+        if i >= 0 and valor <= segmentos[i][1]:
+            return segmentos[i][2]
+        return None
+
+    def buscar(self, numero):
+        """Metadatos del prefijo más largo que coincide, o None.
+
+        Los campos que ese prefijo deja vacíos se completan con los prefijos más
+        cortos (p. ej. un BIN de banco sin tipo hereda el de su rango de red).
+        """
+        n = _NO_DIGITO.sub("", numero)[:self.largo_max]
+        info = None
+        for largo in range(len(n), 0, -1):
+            datos = self._prefijos.get(n[:largo]) or self._en_rangos(n[:largo])
+            if datos is None:
+                continue
+            if info is None:
+                info = dict(zip(CAMPOS_BIN, datos), prefijo=n[:largo])
+            else:
+                for campo, valor in zip(CAMPOS_BIN, datos):
+                    if not info[campo]: info[campo] = valor
+        return info
+
+@functools.lru_cache(maxsize=None)
+def get_indice_bins():
+    # Se carga una vez por proceso
+    filas = cargar_bins(BINS_DEFAULT)
+    ruta = os.environ.get("HEYSAVE_BINS")
+    if ruta:
+        filas += cargar_bins(ruta)
+    return IndiceBIN(filas)
+
+def info_tarjeta(numero):
+    """Banco, red, tipo, país y prefijo BIN de un número de tarjeta (completo o a medio escribir)."""
+    n = numero.replace(" ", "")
+    info = get_indice_bins().buscar(n) or dict.fromkeys(CAMPOS_BIN + ("prefijo",), "")
+    red = info["red"] or "Tarjeta"
+    banco = "Desconocido"
+    if len(n) >= 4:
+        if info["banco"]: banco = info["banco"]
+        elif red in ["Visa", "Mastercard"]: banco = f"{red} Bank"
+    return dict(info, banco=banco, red=red)
+
+def detectar_banco_red(numero):
+    info = info_tarjeta(numero)
+    return info["banco"], info["red"]
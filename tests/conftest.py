@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# heysave.db lee HEYSAVE_DB al importarse: una base temporal para toda la sesión de pytest
+os.environ["HEYSAVE_DB"] = os.path.join(tempfile.mkdtemp(prefix="heysave-tests-"), "heysave.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
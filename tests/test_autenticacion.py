@@ -0,0 +1,78 @@
+import base64
+import threading
+import time
+import types
+
+from heysave import autenticacion
+from heysave.autenticacion import (HORAS_SESION, PoolKDF, autenticar, crear_sesion, hashear_password, migrar_passwords,
+                                   renovar_sesion, revocar_sesion, validar_sesion, verificar_password)
+from heysave.db import run_query
+
+def _usuario(usuario, password):
+    run_query("INSERT INTO usuarios (usuario, password, nombre) VALUES (?, ?, 'Test')", (usuario, password))
+    return run_query("SELECT id FROM usuarios WHERE usuario = ?", (usuario,), return_data=True)[0][0]
+
+def test_verificar_y_rehashear():
+    guardado = hashear_password("secreta")
+    assert verificar_password("secreta", guardado) == (True, False)
+    assert verificar_password("otra", guardado) == (False, False)
+    # Texto plano de antes y parámetros más débiles que los actuales: correctas, pero a rehashear
+    assert verificar_password("secreta", "secreta") == (True, True)
+    sal = b"s" * 16
+    viejo = f"scrypt$1024$8$1${base64.b64encode(sal).decode()}${base64.b64encode(autenticacion._scrypt('secreta', sal, 1024, 8, 1)).decode()}"
+    assert verificar_password("secreta", viejo) == (True, True)
+    assert verificar_password("secreta", "scrypt$roto") == (False, False)
+
+def test_login_rehashea_texto_plano():
+    user_id = _usuario("auth1", "secreta")
+    assert autenticar("auth1", "otra") is None
+    assert autenticar("auth1", "secreta") == (user_id, "auth1", "Test")
+    guardado = run_query("SELECT password FROM usuarios WHERE id = ?", (user_id,), return_data=True)[0][0]
+    assert guardado.startswith("scrypt$") and verificar_password("secreta", guardado) == (True, False)
+    assert autenticar("no_existe", "secreta") is None
+
+def test_migrar_pasa_por_los_cupos_del_pool(monkeypatch):
+    pool = PoolKDF(max_hilos=4, max_pendientes=2)
+    en_vuelo, maximo, lock = [0], [0], threading.Lock()
+    def lento(valor):
+        with lock:
+            en_vuelo[0] += 1
+            maximo[0] = max(maximo[0], en_vuelo[0])
+        time.sleep(0.01)
+        with lock:
+            en_vuelo[0] -= 1
+        return valor * 2
+    assert pool.map(lento, range(10)) == [v * 2 for v in range(10)]
+    assert maximo[0] <= 2
+    # migrar_passwords usa ese mismo camino
+    monkeypatch.setattr(autenticacion, "get_pool_kdf", lambda: pool)
+    user_id = _usuario("auth2", "plana")
+    assert migrar_passwords() >= 1
+    guardado = run_query("SELECT password FROM usuarios WHERE id = ?", (user_id,), return_data=True)[0][0]
+    assert verificar_password("plana", guardado) == (True, False)
+
+def test_sesion_vence(monkeypatch):
+    user_id = _usuario("auth3", "x")
+    token = crear_sesion(user_id)
+    assert validar_sesion(token) == (user_id, "auth3")  # queda en la caché de sesiones
+    despues = time.time() + HORAS_SESION * 3600 + 1
+    monkeypatch.setattr(autenticacion, "time", types.SimpleNamespace(time=lambda: despues, monotonic=time.monotonic))
+    assert validar_sesion(token) is None
+    assert renovar_sesion(token) is None
+
+def test_renovar_y_revocar():
+    user_id = _usuario("auth4", "x")
+    token = crear_sesion(user_id)
+    assert validar_sesion(token) == (user_id, "auth4")
+    # Recargar la página cambia el token: el viejo deja de servir y no se puede renovar dos veces
+    _, _, nuevo = renovar_sesion(token)
+    assert nuevo != token
+    assert validar_sesion(token) is None
+    assert renovar_sesion(token) is None
+    assert validar_sesion(nuevo) == (user_id, "auth4")
+    revocar_sesion(nuevo)
+    assert validar_sesion(nuevo) is None
+    assert run_query("SELECT COUNT(*) FROM sesiones WHERE usuario_id = ?", (user_id,), return_data=True) == [(0,)]
+    # Tokens mal formados o con la firma cambiada
+    assert validar_sesion(nuevo[:-1] + ("0" if nuevo[-1] != "0" else "1")) is None
+    assert validar_sesion("no-es-un-token") is None and validar_sesion(None) is None
@@ -0,0 +1,38 @@
+from heysave.conciliacion import conciliar, tomar_checkpoint
+from heysave.db import run_query, run_transaction
+
+_MOVIMIENTO = "INSERT INTO transacciones (usuario_id, fecha, ts, descripcion, categoria, monto, tipo) VALUES (?, '01/01', 1700000000, ?, ?, ?, ?)"
+
+def _diferencia(user_id):
+    reporte = conciliar(limite=10 ** 6)
+    return next(({k: fila[k] for k in ("saldo", "saldo_metas", "metas")}
+                 for fila in reporte["mayores"] if fila["usuario_id"] == user_id), None)
+
+def test_checkpoint_y_filas_nuevas_concilian():
+    run_query("INSERT INTO usuarios (usuario, password, nombre, saldo, saldo_metas) VALUES ('concilia1', 'x', 'Test', 0, 0)")
+    user_id = run_query("SELECT id FROM usuarios WHERE usuario = 'concilia1'", return_data=True)[0][0]
+    assert run_transaction([("INSERT INTO metas (usuario_id, nombre, objetivo, ahorrado) VALUES (?, 'Casa', 500, 0)", (user_id,))])
+    meta_id = run_query("SELECT id FROM metas WHERE usuario_id = ?", (user_id,), return_data=True)[0][0]
+    # Antes del checkpoint: un ingreso y un abono, cada uno con su efecto en los saldos
+    assert run_transaction([(_MOVIMIENTO, (user_id, "Sueldo", "Ingreso", 200.0, "Ingreso")),
+                            ("UPDATE usuarios SET saldo = saldo + 200 WHERE id = ?", (user_id,))])
+    assert run_transaction([(_MOVIMIENTO, (user_id, "Abono: Casa", "Ahorro", 50.0, "Abono")),
+                            ("UPDATE usuarios SET saldo = saldo - 50 WHERE id = ?", (user_id,)),
+                            ("UPDATE metas SET ahorrado = ahorrado + 50 WHERE id = ?", (meta_id,))])
+    assert _diferencia(user_id) is None
+    assert tomar_checkpoint()
+    assert run_query("SELECT saldo, saldo_metas, metas FROM checkpoints_saldo WHERE usuario_id = ?", (user_id,), return_data=True) == [(150, 0, 50)]
+
+    # Después: gasto, retiro de meta y transferencia desde la meta
+    assert run_transaction([(_MOVIMIENTO, (user_id, "Pizza", "Otros", 20.0, "Gasto")),
+                            ("UPDATE usuarios SET saldo = saldo - 20 WHERE id = ?", (user_id,))])
+    assert run_transaction([(_MOVIMIENTO, (user_id, "Retiro Meta: Casa", "Ahorro", 10.0, "Ingreso")),
+                            ("UPDATE usuarios SET saldo_metas = saldo_metas + 10 WHERE id = ?", (user_id,)),
+                            ("UPDATE metas SET ahorrado = ahorrado - 10 WHERE id = ?", (meta_id,))])
+    assert run_transaction([(_MOVIMIENTO, (user_id, "Transf. a 123: Casa", "Transferencia", 15.0, "Gasto")),
+                            ("UPDATE metas SET ahorrado = ahorrado - 15 WHERE id = ?", (meta_id,))])
+    assert _diferencia(user_id) is None
+
+    # Una fila que no movió el saldo queda a la vista
+    assert run_transaction([(_MOVIMIENTO, (user_id, "Café", "Otros", 5.0, "Gasto"))])
+    assert _diferencia(user_id) == {"saldo": 5.0, "saldo_metas": 0.0, "metas": 0.0}
@@ -0,0 +1,68 @@
+import sqlite3
+import threading
+
+import pytest
+
+from heysave.db import EscritorSQLite
+from heysave.instrumentacion import get_instrumentacion
+
+@pytest.fixture
+def escritor(tmp_path):
+    """Escritor propio sobre una base aparte, con una función SQL que lo frena hasta `soltar`."""
+    conn = sqlite3.connect(tmp_path / "escritor.db", check_same_thread=False, isolation_level=None)
+    conn.execute("CREATE TABLE t (v TEXT NOT NULL UNIQUE)")
+    frenado, soltar = threading.Event(), threading.Event()
+    conn.create_function("esperar", 0, lambda: frenado.set() or soltar.wait(5))
+    escritor = EscritorSQLite(conn, get_instrumentacion(), max_pendientes=4)
+    # Mientras esta operación corre, lo que se envíe se acumula en la cola
+    freno = escritor.enviar([("SELECT esperar()", ())])
+    assert frenado.wait(5)
+
+    def valores():
+        lector = sqlite3.connect(tmp_path / "escritor.db")
+        try:
+            return sorted(v for (v,) in lector.execute("SELECT v FROM t"))
+        finally:
+            lector.close()
+    yield escritor, soltar, valores
+    soltar.set()
+    assert freno.result()
+    escritor.cerrar()
+
+def test_operacion_fallida_se_deshace_sola(escritor):
+    escritor, soltar, valores = escritor
+    futuros = [escritor.enviar([("INSERT INTO t VALUES ('a')", ())]),
+               # Falla en la segunda sentencia: su primera también se deshace
+               escritor.enviar([("INSERT INTO t VALUES ('b')", ()), ("INSERT INTO t VALUES ('a')", ())]),
+               # No cumple minimo_filas
+               escritor.enviar([("INSERT INTO t VALUES ('c')", ()), ("DELETE FROM t WHERE v = 'z'", (), 1)]),
+               escritor.enviar([("INSERT INTO t VALUES ('d')", ())])]
+    soltar.set()
+    assert [f.result() for f in futuros] == [True, False, False, True]
+    assert [f.conteo["sentencias"] for f in futuros] == [1, 2, 2, 1]
+    assert valores() == ["a", "d"]
+    # El freno y un solo grupo con las cuatro operaciones
+    assert escritor.estadisticas["grupos"] == 2
+    assert escritor.estadisticas["fallidas"] == 2
+
+def test_operacion_masiva_va_sola(escritor):
+    escritor, soltar, valores = escritor
+    futuros = [escritor.enviar([("INSERT INTO t VALUES ('a')", ())]),
+               escritor.enviar([("INSERT INTO t VALUES (?)", [("m1",), ("m2",)])]),
+               escritor.enviar([("INSERT INTO t VALUES ('b')", ())])]
+    soltar.set()
+    assert all(f.result() for f in futuros)
+    assert valores() == ["a", "b", "m1", "m2"]
+    # Freno, la que iba antes de la masiva, la masiva y la que quedó retenida detrás
+    assert escritor.estadisticas["grupos"] == 4
+
+def test_cola_llena_rechaza(escritor):
+    escritor, soltar, valores = escritor
+    futuros = [escritor.enviar([("INSERT INTO t VALUES (?)", (str(i),))]) for i in range(4)]
+    rechazada = escritor.enviar([("INSERT INTO t VALUES ('x')", ())], espera=0.05)
+    assert rechazada.done() and rechazada.result() is False
+    assert rechazada.conteo == {"sentencias": 0, "bloqueos": 0, "rechazada": 1}
+    assert escritor.estadisticas["rechazadas"] == 1
+    soltar.set()
+    assert all(f.result() for f in futuros)
+    assert valores() == ["0", "1", "2", "3"]
@@ -0,0 +1,14 @@
+import hashlib
+
+from heysave.db import run_query
+from heysave.fotos import AVATAR_DEFAULT, guardar_foto, obtener_miniatura
+
+def test_miniatura_no_queda_en_el_avatar_por_defecto():
+    run_query("INSERT INTO usuarios (usuario, password, nombre) VALUES ('fotos1', 'x', 'Test')")
+    user_id = run_query("SELECT id FROM usuarios WHERE usuario = 'fotos1'", return_data=True)[0][0]
+    imagen = b"no es una imagen"  # sin Pillow legible, la miniatura es el original
+    foto_hash = hashlib.sha256(imagen).hexdigest()
+    # Se pide antes de que exista la fila (p. ej. otro proceso todavía guardando)
+    assert obtener_miniatura(foto_hash) == AVATAR_DEFAULT
+    assert guardar_foto(user_id, imagen)
+    assert obtener_miniatura(foto_hash) == imagen
@@ -0,0 +1,49 @@
+import random
+
+from heysave.db import run_query, run_transaction
+from heysave.finanzas import historial_pagina
+
+COLUMNAS = "(id, usuario_id, fecha, descripcion, categoria, monto, tipo, ts)"
+
+def _usuario(nombre):
+    run_query("INSERT INTO usuarios (usuario, password, nombre) VALUES (?, 'x', 'Test')", (nombre,))
+    return run_query("SELECT id FROM usuarios WHERE usuario = ?", (nombre,), return_data=True)[0][0]
+
+def _paginar(user_id, **filtros):
+    ids, cursor = [], None
+    while True:
+        filas, cursor = historial_pagina(user_id, cursor=cursor, limite=7, **filtros)
+        ids += [f[0] for f in filas]
+        if cursor is None:
+            return ids
+
+def test_mezcla_caliente_y_archivo_por_ts():
+    # Como tras importar un extracto viejo después de archivar: la caliente
+    # tiene filas más viejas que algunas archivadas, con ts intercalados
+    user_id = _usuario("historial1")
+    rng = random.Random(7)
+    base = run_query("SELECT COALESCE(MAX(id), 0) FROM transacciones_todas", return_data=True)[0][0] + 1
+    filas = [(base + i, user_id, "01/01", f"mov {i}", "Otros", 1.0, "Gasto", 1_600_000_000 + rng.randrange(0, 10 ** 7))
+             for i in range(267)]
+    archivadas = set(rng.sample(range(267), 146))
+    assert run_transaction([
+        (f"INSERT INTO transacciones {COLUMNAS} VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [f for i, f in enumerate(filas) if i not in archivadas]),
+        (f"INSERT INTO transacciones_archivo {COLUMNAS} VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [f for i, f in enumerate(filas) if i in archivadas]),
+    ])
+    esperado = [f[0] for f in sorted(filas, key=lambda f: (f[7], f[0]), reverse=True)]
+    assert _paginar(user_id) == esperado
+
+def test_lectura_fallida_no_se_cachea_como_pagina_vacia(monkeypatch):
+    from heysave import finanzas
+    from heysave.cache import get_cache
+
+    user_id = _usuario("historial2")
+    assert run_transaction([(f"INSERT INTO transacciones (usuario_id, fecha, descripcion, categoria, monto, tipo, ts) VALUES (?, '01/01', 'Pizza', 'Otros', 1.0, 'Gasto', 1700000000)",
+                             (user_id,))])
+    # Un fallo pasajero (p. ej. la base bloqueada) mientras se llena la caché
+    monkeypatch.setattr(finanzas, "run_query", lambda *a, **k: False)
+    assert get_cache().obtener(user_id, "historial", lambda: historial_pagina(user_id)) is False
+    assert finanzas.buscar_movimientos(user_id, "pizza") is False
+    monkeypatch.undo()
+    filas, _ = get_cache().obtener(user_id, "historial", lambda: historial_pagina(user_id))
+    assert [f[3] for f in filas] == ["Pizza"]
@@ -0,0 +1,39 @@
+import datetime
+import io
+import warnings
+
+from heysave.db import run_query
+from heysave.importacion import _fecha_sin_anio, _parsear_fecha, importar_csv
+
+CSV = "fecha,descripcion,monto\n15/03/2024,Sueldo,1000\n16/03/2024,Pizza,-30\n"
+
+def test_fecha_sin_anio_usa_el_anio_actual_o_el_anterior():
+    hoy = datetime.date(2026, 10, 18)
+    assert _fecha_sin_anio(15, 3, hoy) == datetime.date(2026, 3, 15)
+    assert _fecha_sin_anio(18, 10, hoy) == hoy
+    assert _fecha_sin_anio(25, 12, hoy) == datetime.date(2025, 12, 25)
+
+def test_fecha_sin_anio_29_de_febrero_y_fechas_invalidas():
+    assert _fecha_sin_anio(29, 2, datetime.date(2026, 10, 18)) == datetime.date(2024, 2, 29)
+    assert _fecha_sin_anio(31, 2, datetime.date(2026, 10, 18)) is None
+    assert _parsear_fecha("31/02") is None
+
+def test_parsear_fecha_sin_anio_no_cae_en_1900():
+    assert _parsear_fecha(" 15/03 ").year >= datetime.date.today().year - 1
+    assert _parsear_fecha("15/03/2024") == datetime.date(2024, 3, 15)
+
+def _usuario(nombre):
+    run_query("INSERT INTO usuarios (usuario, password, nombre, saldo) VALUES (?, 'x', 'Test', 0)", (nombre,))
+    return run_query("SELECT id FROM usuarios WHERE usuario = ?", (nombre,), return_data=True)[0][0]
+
+def test_importar_desde_ruta_cierra_el_archivo(tmp_path):
+    ruta = tmp_path / "extracto.csv"
+    ruta.write_text(CSV, encoding="utf-8")
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", ResourceWarning)
+        assert importar_csv(_usuario("import1"), str(ruta))["filas"] == 2
+
+def test_importar_no_cierra_el_archivo_de_quien_llama():
+    archivo = io.BytesIO(CSV.encode("utf-8"))
+    assert importar_csv(_usuario("import2"), archivo)["filas"] == 2
+    assert not archivo.closed
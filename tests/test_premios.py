@@ -0,0 +1,32 @@
+import threading
+
+from heysave.db import run_query, run_transaction
+from heysave.premios import canjear, catalogo
+
+def test_canjes_simultaneos_no_venden_de_mas():
+    assert run_transaction([
+        ("INSERT INTO premios (nombre, icono, costo, prefijo, stock) VALUES ('Test Canje', '🧪', 10, 'TEST', 3)", ()),
+        ("INSERT INTO codigos_premio (premio_id, codigo) SELECT id, 'TEST-' || n FROM premios, (SELECT 1 AS n UNION ALL SELECT 2 UNION ALL SELECT 3) WHERE nombre = 'Test Canje'", ()),
+        ("INSERT INTO usuarios (usuario, password, nombre, puntos) VALUES (?, 'x', 'Test', 15)", [(f"canje{i}",) for i in range(12)]),
+    ])
+    premio_id = run_query("SELECT id FROM premios WHERE nombre = 'Test Canje'", return_data=True)[0][0]
+    usuarios = [fila[0] for fila in run_query("SELECT id FROM usuarios WHERE usuario LIKE 'canje%'", return_data=True)]
+    assert [p["stock"] for p in catalogo() if p["id"] == premio_id] == [3]
+
+    codigos = {}
+    barrera = threading.Barrier(len(usuarios))
+    def canjear_a_la_vez(user_id):
+        barrera.wait()
+        codigos[user_id] = canjear(user_id, premio_id)
+    hilos = [threading.Thread(target=canjear_a_la_vez, args=(u,)) for u in usuarios]
+    for hilo in hilos: hilo.start()
+    for hilo in hilos: hilo.join()
+    entregados = [c for c in codigos.values() if c]
+    assert sorted(entregados) == ["TEST-1", "TEST-2", "TEST-3"]
+    assert run_query("SELECT stock FROM premios WHERE id = ?", (premio_id,), return_data=True) == [(0,)]
+    assert run_query("SELECT COUNT(*), COUNT(DISTINCT codigo) FROM premios_canjeados WHERE premio = 'Test Canje'", return_data=True) == [(3, 3)]
+    ganadores = [u for u, c in codigos.items() if c]
+    assert run_query(f"SELECT SUM(puntos) FROM usuarios WHERE id IN ({','.join('?' * len(usuarios))})",
+                     tuple(usuarios), return_data=True) == [(15 * len(usuarios) - 10 * len(ganadores),)]
+    # El canje invalidó el catálogo compartido
+    assert [p["stock"] for p in catalogo() if p["id"] == premio_id] == [0]
@@ -0,0 +1,32 @@
+import time
+
+from heysave.conciliacion import conciliar, tomar_checkpoint
+from heysave.db import run_query, run_transaction
+from heysave.programador import crear_regla, ejecutar_pendientes
+
+def test_reglas_ok_saldo_y_meta_sin_descuadre():
+    run_query("INSERT INTO usuarios (usuario, password, nombre, saldo, puntos) VALUES ('regla1', 'x', 'Test', 100, 0)")
+    user_id = run_query("SELECT id FROM usuarios WHERE usuario = 'regla1'", return_data=True)[0][0]
+    assert run_transaction([("INSERT INTO metas (usuario_id, nombre, objetivo, ahorrado) VALUES (?, ?, ?, ?)",
+                             [(user_id, "Viaje", 1000, 0), (user_id, "Bici", 50, 50)])])
+    viaje, bici = [fila[0] for fila in run_query("SELECT id FROM metas WHERE usuario_id = ? ORDER BY id", (user_id,), return_data=True)]
+    # El saldo inicial no tiene transacción: se acepta como punto de partida
+    assert tomar_checkpoint(aceptar=True)
+    assert crear_regla(user_id, viaje, 30, "diaria")
+    assert crear_regla(user_id, viaje, 80, "diaria")  # 30 + 80 ya no alcanza con 100
+    assert crear_regla(user_id, bici, 10, "diaria")   # meta completa
+    assert not crear_regla(user_id, 999999, 10, "diaria")
+
+    ahora = int(time.time())
+    resumen = ejecutar_pendientes(ahora)
+    assert (resumen["error"], resumen["ok"], resumen["saldo"], resumen["meta"]) == (False, 1, 1, 1)
+    assert (resumen["monto"], resumen["puntos"]) == (30, 7)
+    assert run_query("SELECT saldo, puntos FROM usuarios WHERE id = ?", (user_id,), return_data=True) == [(70, 7)]
+    assert run_query("SELECT ahorrado FROM metas WHERE usuario_id = ? ORDER BY id", (user_id,), return_data=True) == [(30,), (50,)]
+    assert run_query("""SELECT monto, ultimo_resultado, activa, proxima > ? FROM reglas_ahorro WHERE usuario_id = ? ORDER BY id""",
+                     (ahora, user_id), return_data=True) == [(30, "ok", 1, 1), (80, "saldo", 1, 1), (10, "meta", 0, 1)]
+    # Nada vencido: una segunda corrida no hace nada
+    assert ejecutar_pendientes(ahora)["lotes"] == 0
+
+    reporte = conciliar(limite=10 ** 6)
+    assert user_id not in [fila["usuario_id"] for fila in reporte["mayores"]]
@@ -0,0 +1,49 @@
+import sqlite3
+import time
+
+from heysave.db import init_db, run_query, run_transaction
+
+_INSERTAR = "INSERT INTO transacciones (usuario_id, fecha, ts, descripcion, categoria, monto, tipo) VALUES (?, '01/01', ?, ?, ?, ?, ?)"
+
+def _usuario(usuario):
+    run_query("INSERT INTO usuarios (usuario, password, nombre) VALUES (?, 'x', 'Test')", (usuario,))
+    return run_query("SELECT id FROM usuarios WHERE usuario = ?", (usuario,), return_data=True)[0][0]
+
+def test_retiro_de_meta_no_cuenta_como_ingreso():
+    user_id = _usuario("resumen1")
+    ts = int(time.time())
+    assert run_transaction([(_INSERTAR,
+                             [(user_id, ts, "Sueldo", "Ingreso", 500.0, "Ingreso"),
+                              (user_id, ts, "Retiro Meta: Viaje", "Ahorro", 100.0, "Ingreso"),
+                              (user_id, ts, "Pizza", "Alimentación 🍔", 20.0, "Gasto")])])
+    assert run_query("SELECT ingresos, gastos, n_ingresos, n_gastos FROM resumen_mensual WHERE usuario_id = ?",
+                     (user_id,), return_data=True) == [(500.0, 20.0, 1, 1)]
+
+def test_transferencia_de_meta_no_cuenta_como_gasto():
+    user_id = _usuario("resumen2")
+    ts = int(time.time())
+    assert run_transaction([(_INSERTAR,
+                             [(user_id, ts, "Pizza", "Alimentación 🍔", 20.0, "Gasto"),
+                              (user_id, ts, "Transf. a 123: Viaje", "Transferencia", 300.0, "Gasto")])])
+    assert run_query("SELECT ingresos, gastos, n_ingresos, n_gastos FROM resumen_mensual WHERE usuario_id = ?",
+                     (user_id,), return_data=True) == [(0.0, 20.0, 0, 1)]
+    assert run_query("SELECT categoria, total, cantidad FROM gastos_categoria_mes WHERE usuario_id = ?",
+                     (user_id,), return_data=True) == [("Alimentación 🍔", 20.0, 1)]
+
+def test_migracion_recalcula_agregados_con_transferencias(tmp_path):
+    conn = sqlite3.connect(tmp_path / "vieja.db", isolation_level=None)
+    init_db(conn)
+    conn.execute("INSERT INTO usuarios (id, usuario, password, nombre) VALUES (1, 'u', 'x', 'U')")
+    ts = int(time.time())
+    conn.executemany(_INSERTAR, [(1, ts, "Pizza", "Alimentación 🍔", 20.0, "Gasto"),
+                                 (1, ts - 400 * 86400, "Transf. CCI 999: Casa", "Transferencia", 50.0, "Gasto")])
+    conn.execute("INSERT INTO transacciones_archivo SELECT id, usuario_id, fecha, descripcion, categoria, monto, tipo, ts FROM transacciones WHERE categoria = 'Transferencia'")
+    conn.execute("DELETE FROM transacciones WHERE categoria = 'Transferencia'")
+    # Como las dejaban los triggers de antes: la transferencia (ya archivada) contada como gasto
+    conn.execute("INSERT INTO gastos_categoria_mes VALUES (1, strftime('%Y-%m', ?, 'unixepoch', 'localtime'), 'Transferencia', 50.0, 1)", (ts - 400 * 86400,))
+    conn.execute("INSERT INTO resumen_mensual VALUES (1, strftime('%Y-%m', ?, 'unixepoch', 'localtime'), 0, 50.0, 0, 1)", (ts - 400 * 86400,))
+    conn.execute("PRAGMA user_version = 13")
+    init_db(conn)
+    assert conn.execute("SELECT SUM(gastos), SUM(n_gastos) FROM resumen_mensual").fetchone() == (20.0, 1)
+    assert conn.execute("SELECT categoria, total FROM gastos_categoria_mes").fetchall() == [("Alimentación 🍔", 20.0)]
+    conn.close()
@@ -0,0 +1,31 @@
+from heysave.tarjetas import BINS_DEFAULT, IndiceBIN, cargar_bins
+
+def test_rango_ancho_de_8_digitos_ocupa_una_entrada():
+    indice = IndiceBIN([
+        ("4", "", "Visa", "", ""),
+        ("40000000-49999999", "Banco Ancho", "", "Crédito", "PE"),
+        # Más tardío y más corto que el rango: no lo tapa para números de 8 dígitos
+        ("4123", "Banco Exacto", "", "Débito", "PE"),
+    ])
+    assert len(indice) == 3
+    info = indice.buscar("4512 3456 7890 1234")
+    assert (info["banco"], info["red"], info["tipo"], info["prefijo"]) == ("Banco Ancho", "Visa", "Crédito", "45123456")
+    assert indice.buscar("4123 0000 0000 0000")["banco"] == "Banco Ancho"
+    assert indice.buscar("4123")["banco"] == "Banco Exacto"
+    assert indice.buscar("3999 9999 9999 9999") is None
+
+def test_rangos_solapados_gana_la_fila_mas_tardia():
+    indice = IndiceBIN([
+        ("222100-272099", "", "Mastercard", "", ""),
+        ("250000-259999", "Banco Medio", "Mastercard", "", ""),
+    ])
+    assert len(indice) == 3  # el primero queda partido en dos segmentos alrededor del segundo
+    assert indice.buscar("2550001234567890")["banco"] == "Banco Medio"
+    assert indice.buscar("2600001234567890")["banco"] == ""
+    assert indice.buscar("2720991234567890")["red"] == "Mastercard"
+    assert indice.buscar("2721001234567890") is None
+
+def test_tabla_incluida_no_expande_rangos():
+    filas = cargar_bins(BINS_DEFAULT)
+    assert len(IndiceBIN(filas)) <= len(filas)
+    assert IndiceBIN(filas).buscar("2221 0000 0000 0000")["red"] == "Mastercard"
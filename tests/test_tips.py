@@ -0,0 +1,24 @@
+import datetime
+import time
+
+from heysave.db import run_query, run_transaction
+from heysave.finanzas import _calcular_tips
+
+def test_reglas_del_mes_ignoran_transferencias():
+    run_query("INSERT INTO usuarios (usuario, password, nombre, saldo) VALUES ('tips1', 'x', 'Test', 1000)")
+    user_id = run_query("SELECT id FROM usuarios WHERE usuario = 'tips1'", return_data=True)[0][0]
+    ahora = int(time.time())
+    ultimo_dia = datetime.date.today().replace(day=1) - datetime.timedelta(days=1)
+    mes_pasado = int(time.mktime(datetime.datetime.combine(ultimo_dia, datetime.time(12)).timetuple()))
+    assert run_transaction([("INSERT INTO transacciones (usuario_id, fecha, ts, descripcion, categoria, monto, tipo) VALUES (?, '01/01', ?, ?, ?, ?, 'Gasto')",
+                             [(user_id, ahora, "Menú", "Alimentación 🍔", 60.0),
+                              (user_id, ahora, "Taxi", "Transporte 🚌", 40.0),
+                              (user_id, mes_pasado, "Bus", "Transporte 🚌", 20.0)]),
+                            # Transferencias de metas como las agregaban los triggers de antes:
+                            # sin el filtro se llevarían el 83% del mes y crecerían 50x
+                            ("INSERT INTO gastos_categoria_mes VALUES (?, strftime('%Y-%m', ?, 'unixepoch', 'localtime'), 'Transferencia', ?, 1)",
+                             [(user_id, ahora, 500.0), (user_id, mes_pasado, 10.0)])])
+    tips = _calcular_tips(user_id)
+    assert any(t.startswith("📊 **Alimentación 🍔** se lleva el 60%") for t in tips)
+    assert any(t.startswith("📈 **Transporte 🚌:** gastaste 100% más") for t in tips)
+    assert not any("Transferencia" in t for t in tips)